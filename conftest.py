@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+SCHEMA = """
+CREATE TABLE Athlete (IDAthlete INTEGER, FirstName TEXT, LastName TEXT, CountryCode TEXT, Gender TEXT);
+CREATE TABLE Bib (IDRace INTEGER, IDAthlete INTEGER, BibNumber INTEGER, FinishingTime TEXT, FinishingPlace INTEGER, Finished TEXT);
+CREATE TABLE Event (IDEvent INTEGER, Event TEXT, City TEXT, Country TEXT);
+CREATE TABLE Judge (IDJudge INTEGER, FirstName TEXT, LastName TEXT, CountryCode TEXT);
+CREATE TABLE JudgeCall (IDRace INTEGER, IDJudge INTEGER, Color TEXT, Infraction TEXT, TOD TEXT, BibNumber INTEGER);
+CREATE TABLE Race (IDRace INTEGER, IDEvent INTEGER, RaceDate TEXT, StartTime TEXT, Distance INTEGER, DistanceUnits TEXT, Gender TEXT);
+CREATE TABLE VideoObservation (ID INTEGER, IDRace INTEGER, BibNumber INTEGER, LOCAverage NUMERIC, TOD TEXT);
+CREATE TABLE RaceJudge (IDRace INTEGER, IDJudge INTEGER);
+"""
+
+RACES = [
+    (1, 1, "2024-05-01", "09:00:00", 20, "km", "Men"),
+    (2, 1, "2024-05-01", "11:00:00", 10, "km", "Women"),
+]
+
+ATHLETES = [
+    (1, "Ann", "Able", "USA", "W"),
+    (2, "Bob", "Baker", "CAN", "M"),
+    (3, "Cal", "Cole", "MEX", "M"),
+    (4, "Dee", "Dunn", "USA", "W"),
+]
+
+# The same bib number is used in both races to catch joins that ignore IDRace
+BIBS = [
+    (1, 2, 7, "01:25:00", 1, "Y"),
+    (1, 3, 12, "01:27:00", 2, "Y"),
+    (2, 1, 7, "00:45:00", 1, "Y"),
+    (2, 4, 9, "00:47:00", 2, "Y"),
+]
+
+JUDGES = [
+    (1, "Jane", "Smith", "USA"),
+    (2, "Ken", "Jones", "GBR"),
+    (3, "Lee", "Brown", "AUS"),
+]
+
+RACE_JUDGES = [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2), (2, 3)]
+
+# Rows are deliberately out of time order, and "10:..." sorts before "9:..." as text
+OBSERVATIONS = [
+    (1, 1, 7, 41.5, "10:02:00 AM"),
+    (2, 1, 7, 38.0, "09:58:00 AM"),
+    (3, 1, 7, 45.25, "10:06:00 AM"),
+    (4, 1, 12, 52.0, "10:01:00 AM"),
+    (5, 1, 12, None, "10:03:00 AM"),
+    (6, 1, 12, 61.0, "09:59:00 AM"),
+    (7, 2, 7, 30.0, "11:10:00 AM"),
+    (8, 2, 7, 33.5, "11:05:00 AM"),
+    (9, 2, 9, 48.0, "11:07:00 AM"),
+    (10, 2, 9, 50.5, "11:12:00 AM"),
+]
+
+JUDGE_CALLS = [
+    (1, 1, "Yellow", "~", "10:00:00 AM", 7),
+    (1, 1, "Red", "~", "10:04:00 AM", 7),
+    (1, 2, "Red", "~", "10:03:00 AM", 7),
+    (1, 3, "Yellow", "<", "10:05:00 AM", 7),
+    (1, 3, "Red", "~", "09:59:30 AM", 12),
+    (1, 2, "Yellow", "~", "10:02:00 AM", 12),
+    (1, 2, "Red", "~", "10:00:30 AM", 12),
+    (1, 1, "Yellow", "<", "10:01:30 AM", 12),
+    (2, 1, "Yellow", "~", "11:06:00 AM", 9),
+    (2, 2, "Red", "<", "11:09:00 AM", 9),
+]
+
+
+def create_race_db(path):
+    """
+    Create a small race database with the same schema as the ones we receive.
+
+    :param path: Where to create the database file
+    :type path: str
+    """
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.execute("INSERT INTO Event VALUES (1, 'Champs', 'Town', 'USA')")
+    connection.executemany("INSERT INTO Race VALUES (?, ?, ?, ?, ?, ?, ?)", RACES)
+    connection.executemany("INSERT INTO Athlete VALUES (?, ?, ?, ?, ?)", ATHLETES)
+    connection.executemany("INSERT INTO Bib VALUES (?, ?, ?, ?, ?, ?)", BIBS)
+    connection.executemany("INSERT INTO Judge VALUES (?, ?, ?, ?)", JUDGES)
+    connection.executemany("INSERT INTO RaceJudge VALUES (?, ?)", RACE_JUDGES)
+    connection.executemany(
+        "INSERT INTO VideoObservation VALUES (?, ?, ?, ?, ?)", OBSERVATIONS
+    )
+    connection.executemany(
+        "INSERT INTO JudgeCall VALUES (?, ?, ?, ?, ?, ?)", JUDGE_CALLS
+    )
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def race_db_path(tmp_path):
+    path = str(tmp_path / "race.db")
+    create_race_db(path)
+    return path
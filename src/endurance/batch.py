@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+
+# Graphs are only saved to files, so no GUI backend (and no Qt) is needed
+matplotlib.use("Agg")
+
+from endurance.db import DB
+from endurance.loc_graph import JudgeCallType, LocGraph
+from endurance.race_data import load_race
+
+BATCH_FORMATS = ("pdf", "png")
+"""File formats graphs can be rendered to"""
+
+GRAPH_SIZE = (12, 7)
+"""Width and height of rendered graphs in inches, the same as the graph in the app"""
+
+GRAPH_DPI = 100
+"""Resolution of rendered graphs in dots per inch"""
+
+logger = logging.getLogger(__name__)
+
+_databases = dict()
+"""Databases opened by the current worker process, by path"""
+
+
+def _open_database(db_path):
+    """
+    Open a database once per worker process, so races of the same database rendered
+    by a process share its connections and parsed times of day.
+
+    :param db_path: Path to the database
+    :type db_path: str
+    :return: The opened database
+    :rtype: DB
+    """
+    db = _databases.get(db_path)
+    if db is None:
+        db = _databases[db_path] = DB(db_path, pool_size=1)
+    return db
+
+
+def render_race(db_path, race_id, output_dir, formats=("pdf",), max_loc=60):
+    """
+    Render the graph of every walker of a race, and a graph of each walker on their
+    own, showing the calls of every judge. Graphs are saved to a directory of the race
+    under the output directory. This is run on a worker process by render_database.
+
+    :param db_path: Path to the database to render from
+    :type db_path: str
+    :param race_id: ID of the race to render
+    :type race_id: int
+    :param output_dir: Directory to save the graphs under
+    :type output_dir: str
+    :param formats: File formats to save each graph in, see BATCH_FORMATS
+    :type formats: tuple[str]
+    :param max_loc: Value at which to draw the Max LOC line
+    :type max_loc: int
+    :return: Paths of the saved graphs, and the graphs that failed to render with
+        their error
+    :rtype: tuple[list[str], list[tuple[str, str]]]
+    """
+    dataset, athletes, judges = load_race(_open_database(db_path), race_id)
+
+    graph = LocGraph(*GRAPH_SIZE, dpi=GRAPH_DPI, max_loc=max_loc)
+    graph.plot(
+        dataset,
+        athletes,
+        {judge[0]: f"{judge[2]}, {judge[1]}" for judge in judges},
+    )
+    graph.display_judge_call_by_judges([judge[0] for judge in judges])
+    for call_type in JudgeCallType:
+        graph.display_judge_call_by_type(call_type, True)
+
+    race_dir = os.path.join(output_dir, f"race_{race_id}")
+    os.makedirs(race_dir, exist_ok=True)
+    bibs = [athlete[2] for athlete in athletes]
+    pages = [("all_walkers", bibs)] + [(f"walker_{bib}", [bib]) for bib in bibs]
+
+    saved = []
+    failed = []
+    for name, selected_bibs in pages:
+        graph.display_athletes(selected_bibs)
+        for file_format in formats:
+            path = os.path.join(race_dir, f"{name}.{file_format}")
+            try:
+                graph.get_figure().savefig(path, format=file_format)
+            except (OSError, ValueError) as error:
+                failed.append((path, str(error)))
+                continue
+            saved.append(path)
+    return saved, failed
+
+
+def render_database(
+    db_path, output_dir, formats=("pdf",), race_ids=None, max_loc=60, workers=None
+):
+    """
+    Render the graphs of every race of a database with render_race, spreading races
+    over a pool of processes.
+
+    :param db_path: Path to the database to render from
+    :type db_path: str
+    :param output_dir: Directory to save the graphs under
+    :type output_dir: str
+    :param formats: File formats to save each graph in, see BATCH_FORMATS
+    :type formats: tuple[str]
+    :param race_ids: IDs of the races to render, every race if None
+    :type race_ids: list[int] | None
+    :param max_loc: Value at which to draw the Max LOC line
+    :type max_loc: int
+    :param workers: Number of processes to use, the number of CPUs if None
+    :type workers: int | None
+    :return: Paths of the saved graphs under "saved", and the graphs or races that
+        failed to render with their error under "failed"
+    :rtype: dict[str, list]
+    """
+    if race_ids is None:
+        with DB(db_path, pool_size=1) as db:
+            race_ids = [race[0] for race in db.get_races()]
+
+    result = {"saved": [], "failed": []}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(
+                render_race, db_path, race_id, output_dir, tuple(formats), max_loc
+            ): race_id
+            for race_id in race_ids
+        }
+        for future in as_completed(futures):
+            race_id = futures[future]
+            try:
+                saved, failed = future.result()
+            except Exception as error:
+                logger.exception("Could not render race %s", race_id)
+                result["failed"].append((f"race {race_id}", str(error)))
+                continue
+            logger.info("Rendered %s graphs of race %s", len(saved), race_id)
+            result["saved"].extend(saved)
+            result["failed"].extend(failed)
+
+    result["saved"].sort()
+    return result
+
+
+def make_parser():
+    """
+    Make the parser for the command line arguments.
+
+    :returns: The parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="endurance-batch",
+        description="Render the LOC graphs of every race and walker of a database.",
+    )
+    parser.add_argument("database", help="database to render graphs of")
+    parser.add_argument(
+        "-o", "--output", default="graphs", help="directory to save the graphs under"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="formats",
+        action="append",
+        choices=BATCH_FORMATS,
+        help="file format of the graphs, can be given more than once, pdf by default",
+    )
+    parser.add_argument(
+        "-r",
+        "--race",
+        dest="races",
+        action="append",
+        type=int,
+        help="ID of a race to render, can be given more than once, every race by default",
+    )
+    parser.add_argument(
+        "--max-loc",
+        type=int,
+        default=60,
+        help="LOC value at which to draw the Max LOC line, in ms",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes to use",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log what is being done"
+    )
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point for rendering graphs without the app.
+
+    :param argv: The command line arguments, without the program name, sys.argv if None
+    :type argv: list[str] | None
+    :returns: 0 if every graph was rendered, an error code otherwise
+    :rtype: int
+    """
+    args = make_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    if not os.path.isfile(args.database):
+        print(f"No database found at {args.database}")
+        return 1
+
+    start = time.perf_counter()
+    result = render_database(
+        args.database,
+        args.output,
+        args.formats or ["pdf"],
+        args.races,
+        args.max_loc,
+        args.workers,
+    )
+    elapsed = time.perf_counter() - start
+
+    saved = len(result["saved"])
+    print(
+        f"Rendered {saved:,} graphs to {args.output} in {elapsed:.2f} s "
+        f"({saved / max(elapsed, 1e-9):,.1f} graphs/s)"
+    )
+    if result["failed"]:
+        print(f"{len(result['failed'])} failed:")
+        for name, error in result["failed"]:
+            print(f"  {name}: {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import argparse
+import logging
+import os
+import time
+
+from endurance.importer import (
+    IMPORT_CHUNK_SIZE,
+    IMPORT_TABLES,
+    ImportFormatError,
+    import_export,
+)
+from endurance.warehouse import (
+    NamespaceError,
+    build_warehouse,
+    find_event_databases,
+)
+
+
+def warehouse(args):
+    """
+    Merge the event databases in a directory into a warehouse database.
+
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :returns: 0 if every database was merged, an error code otherwise
+    :rtype: int
+    """
+    db_paths = find_event_databases(args.directory, exclude=[args.output])
+    if not db_paths:
+        print(f"No databases found in {args.directory}")
+        return 1
+
+    start = time.perf_counter()
+    try:
+        result = build_warehouse(db_paths, args.output, args.workers)
+    except NamespaceError as error:
+        print(f"Could not build the warehouse: {error}")
+        return 1
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Ingested {len(result['ingested'])} and skipped {len(result['skipped'])} "
+        f"unchanged of {len(db_paths)} databases into {args.output}, "
+        f"{result['rows']:,} rows in {elapsed:.2f} s"
+    )
+    return 0
+
+
+def import_command(args):
+    """
+    Import CSV or Parquet exports into a database.
+
+    :param args: Parsed command line arguments
+    :type args: argparse.Namespace
+    :returns: 0 if every export was imported, an error code otherwise
+    :rtype: int
+    """
+    total_rows = 0
+    total_elapsed = 0
+    for path in args.exports:
+        try:
+            rows, elapsed = import_export(
+                path, args.database, args.table, args.chunk_size
+            )
+        except (ImportFormatError, OSError) as error:
+            print(f"Could not import {path}: {error}")
+            return 1
+        print(f"Imported {rows:,} rows from {path} in {elapsed:.2f} s")
+        total_rows += rows
+        total_elapsed += elapsed
+
+    print(
+        f"Imported {total_rows:,} rows in {total_elapsed:.2f} s "
+        f"({total_rows / max(total_elapsed, 1e-9):,.0f} rows/s)"
+    )
+    return 0
+
+
+COMMANDS = {"warehouse": warehouse, "import": import_command}
+"""Functions handling each command line command, by name"""
+
+
+def find_command(argv):
+    """
+    Find the command line command in the arguments, which may come after options such
+    as -v.
+
+    :param argv: The command line arguments, without the program name
+    :type argv: list[str]
+    :returns: Name of the command in COMMANDS, None if there is none
+    :rtype: str | None
+    """
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg if arg in COMMANDS else None
+    return None
+
+
+def make_parser():
+    """
+    Make the parser for the command line commands.
+
+    :returns: The parser
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog="endurance")
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log what is being done"
+    )
+    # Also accepted after the command, without overriding -v given before it
+    verbose_parser = argparse.ArgumentParser(add_help=False)
+    verbose_parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="log what is being done",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    warehouse_parser = commands.add_parser(
+        "warehouse",
+        parents=[verbose_parser],
+        help="merge a directory of event databases into one database",
+    )
+    warehouse_parser.add_argument("directory", help="directory of event databases")
+    warehouse_parser.add_argument(
+        "output", help="warehouse database to create or update"
+    )
+    warehouse_parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes to use",
+    )
+
+    import_parser = commands.add_parser(
+        "import",
+        parents=[verbose_parser],
+        help="import CSV or Parquet exports of observations or judge calls",
+    )
+    import_parser.add_argument("database", help="database to import into")
+    import_parser.add_argument(
+        "exports", nargs="+", help="CSV or Parquet (.parquet) files to import"
+    )
+    import_parser.add_argument(
+        "-t",
+        "--table",
+        choices=IMPORT_TABLES,
+        help="table to import into, detected from the columns if left out",
+    )
+    import_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=IMPORT_CHUNK_SIZE,
+        help="number of rows read and inserted at a time",
+    )
+
+    return parser
+
+
+def main(argv):
+    """
+    Run a command line command.
+
+    :param argv: The command line arguments, without the program name
+    :type argv: list[str]
+    :returns: 0 if the command succeeded, an error code otherwise
+    :rtype: int
+    """
+    args = make_parser().parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    return COMMANDS[args.command](args)
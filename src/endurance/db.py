@@ -1,19 +1,963 @@
+import atexit
+import hashlib
+import logging
+import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+TOD_FORMAT = "%H:%M:%S %p"
+"""Format of the time of day (TOD) columns in the database"""
+
+COLORS = ("Yellow", "Red")
+"""Colors of judge calls, the position of a color is its code in columnar query results"""
+
+INFRACTIONS = ("~", "<")
+"""Infractions of judge calls, the position of an infraction is its code in columnar query results"""
+
+OPTIMIZED_SUFFIX = ".optimized.db"
+"""Suffix given to the optimized working copy of a database"""
+
+OPTIMIZED_INDEXES = {
+    "VideoObservation_Race_Bib": "VideoObservation (IDRace, BibNumber, TODSeconds, LOCAverage, TOD)",
+    "JudgeCall_Race_Bib": "JudgeCall (IDRace, BibNumber, IDJudge, Color, Infraction, TODSeconds, TOD)",
+    "JudgeCall_Race_Judge": "JudgeCall (IDRace, IDJudge, BibNumber, Color, Infraction, TODSeconds, TOD)",
+    "Bib_Race_Bib": "Bib (IDRace, BibNumber, IDAthlete)",
+    "Athlete_ID": "Athlete (IDAthlete)",
+    "Judge_ID": "Judge (IDJudge)",
+}
+"""Indexes created in the optimized working copy of a database, by name"""
+
+SCHEMA = {
+    "Athlete": {
+        "IDAthlete": "INTEGER",
+        "FirstName": "TEXT",
+        "LastName": "TEXT",
+        "CountryCode": "TEXT",
+        "Gender": "TEXT",
+    },
+    "Bib": {
+        "IDRace": "INTEGER",
+        "IDAthlete": "INTEGER",
+        "BibNumber": "INTEGER",
+        "FinishingTime": "TEXT",
+        "FinishingPlace": "INTEGER",
+        "Finished": "TEXT",
+    },
+    "Event": {
+        "IDEvent": "INTEGER",
+        "Event": "TEXT",
+        "City": "TEXT",
+        "Country": "TEXT",
+    },
+    "Judge": {
+        "IDJudge": "INTEGER",
+        "FirstName": "TEXT",
+        "LastName": "TEXT",
+        "CountryCode": "TEXT",
+    },
+    "JudgeCall": {
+        "IDRace": "INTEGER",
+        "IDJudge": "INTEGER",
+        "Color": "TEXT",
+        "Infraction": "TEXT",
+        "TOD": "TEXT",
+        "BibNumber": "INTEGER",
+    },
+    "Race": {
+        "IDRace": "INTEGER",
+        "IDEvent": "INTEGER",
+        "RaceDate": "TEXT",
+        "StartTime": "TEXT",
+        "Distance": "INTEGER",
+        "DistanceUnits": "TEXT",
+        "Gender": "TEXT",
+    },
+    "VideoObservation": {
+        "ID": "INTEGER",
+        "IDRace": "INTEGER",
+        "BibNumber": "INTEGER",
+        "LOCAverage": "NUMERIC",
+        "TOD": "TEXT",
+    },
+    "RaceJudge": {"IDRace": "INTEGER", "IDJudge": "INTEGER"},
+}
+"""Tables of a race database with the type of each column, by name"""
+
+DEFAULT_BATCH_SIZE = 10_000
+"""Number of rows fetched at a time when streaming query results"""
+
+PROFILE_VARIABLE = "ENDURANCE_PROFILE"
+"""Environment variable that turns on query profiling for every DB when set"""
+
+QUERY_FUNCTIONS = (
+    "execute_lookup_query",
+    "execute_lookup_query_with_headers",
+    "execute_columnar_query",
+    "stream_query",
+    "stream_columnar_query",
+    "_stream_batches",
+    "_fetch_all",
+)
+"""Methods of DB that run queries for others, skipped when finding who issued a query"""
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionProfile:
+    """
+    Settings used to open connections to a database. The defaults open the file read
+    only, since this app never writes to the databases it visualizes.
+
+    :param read_only: Open the database file with mode=ro
+    :type read_only: bool
+    :param immutable: Open the database file with immutable=1, which skips all locking and
+        change detection. Only use this for files nothing else writes to while they are open.
+    :type immutable: bool
+    :param mmap_size: Number of bytes of the database file to memory map, 0 to disable
+    :type mmap_size: int
+    :param cache_size: Page cache size, in pages if positive or in KiB if negative
+    :type cache_size: int
+    :param temp_store_memory: Keep temporary tables and indexes in memory
+    :type temp_store_memory: bool
+    :param query_only: Refuse any statement that would change the database
+    :type query_only: bool
+    """
+
+    def __init__(
+        self,
+        read_only=True,
+        immutable=False,
+        mmap_size=256 * 1024 * 1024,
+        cache_size=-64 * 1024,
+        temp_store_memory=True,
+        query_only=True,
+    ):
+        self.read_only = read_only
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.temp_store_memory = temp_store_memory
+        self.query_only = query_only
+
+    def uri(self, db_path):
+        """
+        Get the URI used to open a database file with this profile.
+
+        :param db_path: Path to the database file
+        :type db_path: str
+        :return: URI of the database file
+        :rtype: str
+        """
+        params = []
+        if self.read_only:
+            params.append("mode=ro")
+        if self.immutable:
+            params.append("immutable=1")
+        uri = ConnectionProfile.file_uri(Path(db_path).resolve())
+        return f"{uri}?{'&'.join(params)}" if params else uri
+
+    @staticmethod
+    def file_uri(path):
+        """
+        Get the file URI of an absolute path, the way SQLite reads it. Network share
+        paths, like \\\\server\\share\\races.db on Windows, keep the server in the path
+        of the URI, as SQLite refuses URIs with any authority other than localhost.
+
+        :param path: Absolute path to the file
+        :type path: pathlib.PurePath
+        :return: URI of the file
+        :rtype: str
+        """
+        uri = path.as_uri()
+        authority = uri[len("file://") :].split("/", 1)[0]
+        if authority:
+            uri = "file:////" + uri[len("file://") :]
+        return uri
+
+    def connect(self, db_path, **kwargs):
+        """
+        Open a connection to a database file and apply this profile to it.
+
+        :param db_path: Path to the database file
+        :type db_path: str
+        :param kwargs: Additional arguments passed to sqlite3.connect
+        :return: The new connection
+        :rtype: sqlite3.Connection
+        """
+        connection = sqlite3.connect(self.uri(db_path), uri=True, **kwargs)
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        connection.execute(
+            f"PRAGMA temp_store = {'MEMORY' if self.temp_store_memory else 'DEFAULT'}"
+        )
+        connection.execute(f"PRAGMA query_only = {int(self.query_only)}")
+        return connection
+
+    def describe(self, connection):
+        """
+        Read back the settings that are in effect on a connection opened with this profile.
+
+        :param connection: The connection to describe
+        :type connection: sqlite3.Connection
+        :return: A map of setting name to its value
+        :rtype: dict[str, any]
+        """
+
+        def pragma(name):
+            result = connection.execute(f"PRAGMA {name}").fetchone()
+            return result[0] if result else None
+
+        return {
+            "read_only": self.read_only,
+            "immutable": self.immutable,
+            "mmap_size": pragma("mmap_size"),
+            "cache_size": pragma("cache_size"),
+            "temp_store": pragma("temp_store"),
+            "query_only": pragma("query_only"),
+        }
+
+
+class ConnectionPool:
+    """
+    A small pool of connections to one database that can be shared between threads. A
+    connection is only ever used by one thread at a time, so threads checking out a
+    connection never wait on each other unless every connection is in use.
+
+    :param connect: Function that opens a new connection to the database
+    :type connect: typing.Callable[[], sqlite3.Connection]
+    :param size: Max number of connections to open
+    :type size: int
+    """
+
+    def __init__(self, connect, size=4):
+        self._connect = connect
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block.
+
+        :return: A connection only used by this thread until the block ends
+        :rtype: typing.Iterator[sqlite3.Connection]
+        """
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection)
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot use a closed connection pool.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self._size:
+                connection = self._connect()
+                self._connections.append(connection)
+                return connection
+        return self._idle.get()
+
+    def _release(self, connection):
+        with self._lock:
+            if self._closed:
+                connection.close()
+                return
+        self._idle.put(connection)
+
+    def close(self):
+        """
+        Close every connection in this pool. Connections that are checked out are closed
+        once they are returned.
+        """
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+class QueryCache:
+    """
+    A least recently used cache of query results, bounded by an estimate of the memory
+    the cached results take up. Cached results are shared, so they must not be modified.
+
+    :param max_bytes: Max estimated size of all cached results, 0 to disable caching
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Look up a cached result, marking it as the most recently used.
+
+        :param key: Key of the result
+        :type key: typing.Hashable
+        :return: The cached result, None if it is not cached
+        :rtype: any
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, result):
+        """
+        Cache a result, evicting the least recently used results until the cache fits
+        within its memory bound. Results larger than the bound are not cached.
+
+        :param key: Key of the result
+        :type key: typing.Hashable
+        :param result: The result to cache
+        :type result: any
+        """
+        size = QueryCache.estimate_size(result)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+
+    def clear(self):
+        """
+        Remove every result from this cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Get statistics on how this cache is used.
+
+        :return: A map of statistic name to its value
+        :rtype: dict[str, int]
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def estimate_size(result):
+        """
+        Estimate how much memory a query result takes up.
+
+        :param result: Rows returned by a query, a tuple of (headers, rows), or a map of column name to column
+        :type result: list[tuple[any]] | tuple[list[str], list[tuple[any]]] | dict[str, numpy.ndarray]
+        :return: Estimated size in bytes
+        :rtype: int
+        """
+        if isinstance(result, dict):
+            return sum(column.nbytes for column in result.values())
+        if isinstance(result, tuple):
+            return sum(QueryCache.estimate_size(part) for part in result)
+        size = sys.getsizeof(result)
+        for row in result:
+            size += sys.getsizeof(row)
+            if isinstance(row, tuple):
+                size += sum(sys.getsizeof(value) for value in row)
+        return size
+
+
+class QueryProfiler:
+    """
+    Records how long queries take and how SQLite runs them, grouped by the method that
+    issued them. Query plans flagged as full table scans or temporary B-trees point at
+    queries missing an index.
+    """
+
+    def __init__(self):
+        self._sites = dict()
+        self._plans = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def call_site():
+        """
+        Find the function that issued the query being run, skipping the methods of DB
+        that run queries for others.
+
+        :return: Name of the function, prefixed with its module outside of this module
+        :rtype: str
+        """
+        frame = sys._getframe(1)
+        while frame is not None and (
+            frame.f_code.co_name in QUERY_FUNCTIONS + ("call_site",)
+            and frame.f_globals.get("__name__") == __name__
+        ):
+            frame = frame.f_back
+        if frame is None:
+            return "<unknown>"
+
+        module = frame.f_globals.get("__name__")
+        name = frame.f_code.co_name
+        return name if module == __name__ else f"{module}.{name}"
+
+    def _site(self, call_site):
+        return self._sites.setdefault(
+            call_site,
+            {"calls": 0, "cached": 0, "seconds": 0.0, "rows": 0, "flags": set()},
+        )
+
+    def explain(self, connection, query, params):
+        """
+        Get the plan SQLite uses to run a query. Plans are kept per query text.
+
+        :param connection: Connection to run EXPLAIN QUERY PLAN on
+        :type connection: sqlite3.Connection
+        :param query: sql query to explain
+        :type query: str
+        :param params: parameters to pass to sql query
+        :type params: tuple[any]
+        :return: Details of each step of the plan
+        :rtype: list[str]
+        """
+        with self._lock:
+            plan = self._plans.get(query)
+        if plan is None:
+            try:
+                plan = [
+                    row[3]
+                    for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params)
+                ]
+            except sqlite3.Error:
+                plan = []
+            with self._lock:
+                self._plans[query] = plan
+        return plan
+
+    @staticmethod
+    def flag(plan):
+        """
+        Find the steps of a query plan worth looking at: full table scans and temporary
+        B-trees built for sorting or grouping.
+
+        :param plan: Details of each step of the plan
+        :type plan: list[str]
+        :return: The flagged steps
+        :rtype: list[str]
+        """
+        return [
+            detail
+            for detail in plan
+            if (detail.startswith("SCAN ") and " USING " not in detail)
+            or "TEMP B-TREE" in detail
+        ]
+
+    def record(self, call_site, connection, query, params, seconds, rows):
+        """
+        Record a query that was run.
+
+        :param call_site: Function that issued the query
+        :type call_site: str
+        :param connection: Connection the query was run on
+        :type connection: sqlite3.Connection
+        :param query: sql query that was run
+        :type query: str
+        :param params: parameters passed to sql query
+        :type params: tuple[any]
+        :param seconds: Wall time the query took
+        :type seconds: float
+        :param rows: Number of rows returned
+        :type rows: int
+        """
+        flags = QueryProfiler.flag(self.explain(connection, query, params))
+        with self._lock:
+            site = self._site(call_site)
+            site["calls"] += 1
+            site["seconds"] += seconds
+            site["rows"] += rows
+            site["flags"].update(flags)
+
+    def record_cached(self, call_site):
+        """
+        Record a query answered from the query cache.
+
+        :param call_site: Function that issued the query
+        :type call_site: str
+        """
+        with self._lock:
+            site = self._site(call_site)
+            site["calls"] += 1
+            site["cached"] += 1
+
+    def stats(self):
+        """
+        Get the recorded statistics of each call site.
+
+        :return: A map of call site to its number of calls, calls answered from the
+            cache, total seconds, total rows and flagged query plan steps
+        :rtype: dict[str, dict[str, any]]
+        """
+        with self._lock:
+            return {
+                call_site: dict(site, flags=sorted(site["flags"]))
+                for call_site, site in self._sites.items()
+            }
+
+    def report(self):
+        """
+        Describe the recorded queries, slowest call site first.
+
+        :return: The report, one line per call site followed by its flagged plan steps
+        :rtype: str
+        """
+        stats = self.stats()
+        if not stats:
+            return "No queries recorded"
+
+        lines = []
+        for call_site, site in sorted(
+            stats.items(), key=lambda item: item[1]["seconds"], reverse=True
+        ):
+            lines.append(
+                f"{call_site}: {site['calls']:,} calls, {site['seconds']:.3f} s, "
+                f"{site['rows']:,} rows, {site['cached']:,} cached"
+            )
+            lines.extend(f"    {flag}" for flag in site["flags"])
+        return "\n".join(lines)
+
+    def dump(self, file=None):
+        """
+        Write the report to a file.
+
+        :param file: File to write to, standard error if None
+        :type file: typing.TextIO | None
+        """
+        print("Query profile:", self.report(), sep="\n", file=file or sys.stderr)
+
+    def clear(self):
+        """
+        Forget every recorded query.
+        """
+        with self._lock:
+            self._sites.clear()
+
+
+def tod_to_seconds(tod):
+    """
+    Convert a time of day as stored in the database to seconds since midnight. This
+    follows the same rules as parsing with TOD_FORMAT, so the hour is read as is and the
+    AM/PM marker is ignored.
+
+    :param tod: The time of day to convert
+    :type tod: str | None
+    :return: Seconds since midnight, None if the time of day could not be parsed
+    :rtype: int | None
+    """
+    try:
+        time = datetime.strptime(tod, TOD_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+class TimeTable:
+    """
+    Interns the times of day of a database, so each distinct TOD string is parsed only
+    once. Observations and calls of a race share a handful of timestamps, so parsing
+    then costs as much as the number of distinct times rather than the number of rows.
+    This can be used from any thread.
+    """
+
+    def __init__(self):
+        self._seconds = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._seconds)
+
+    def seconds(self, tod):
+        """
+        Convert a time of day to seconds since midnight, like tod_to_seconds.
+
+        :param tod: The time of day to convert
+        :type tod: str | None
+        :return: Seconds since midnight, None if the time of day could not be parsed
+        :rtype: int | None
+        """
+        try:
+            value = self._seconds[tod]
+        except KeyError:
+            # Two threads may both parse a new time, which is harmless
+            value = self._seconds[tod] = tod_to_seconds(tod)
+            self.misses += 1
+            return value
+        self.hits += 1
+        return value
+
+    def seconds_of(self, tods):
+        """
+        Convert many times of day to seconds since midnight.
+
+        :param tods: The times of day to convert
+        :type tods: typing.Iterable[str | None]
+        :return: Seconds since midnight of each, None where it could not be parsed
+        :rtype: list[int | None]
+        """
+        return [self.seconds(tod) for tod in tods]
+
+
+def hash_database(db_path, chunk_size=1024 * 1024):
+    """
+    Hash the contents of a database file.
+
+    :param db_path: Path to the database file
+    :type db_path: str
+    :param chunk_size: Number of bytes read at a time
+    :type chunk_size: int
+    :return: SHA-256 hash of the file, as hex
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(db_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def optimized_path(db_path):
+    """
+    Get the path of the optimized working copy of a database.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :return: Path to the optimized working copy
+    :rtype: str
+    """
+    root, _ = os.path.splitext(db_path)
+    return root + OPTIMIZED_SUFFIX
+
+
+def find_optimized_copy(db_path):
+    """
+    Find the optimized working copy of a database, as long as it is up to date with the
+    original database file.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :return: Path to the optimized working copy, None if there is no up to date copy
+    :rtype: str | None
+    """
+    copy_path = optimized_path(db_path)
+    if not os.path.isfile(copy_path):
+        return None
+
+    source_stat = os.stat(db_path)
+    try:
+        connection = ConnectionProfile(mmap_size=0).connect(copy_path)
+        try:
+            source = connection.execute(
+                "SELECT Size, ModifiedTime FROM EnduranceSource"
+            ).fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+
+    if source != (source_stat.st_size, source_stat.st_mtime_ns):
+        return None
+    return copy_path
+
+
+def optimize_database(db_path, output_path=None):
+    """
+    Create an optimized working copy of a database, leaving the original untouched. The
+    copy has covering indexes for the queries in this module, a precomputed TODSeconds
+    column holding the time of day as seconds since midnight, and ANALYZE statistics.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :param output_path: Where to write the copy, next to the original if None
+    :type output_path: str | None
+    :return: Path to the optimized working copy
+    :rtype: str
+    """
+    output_path = output_path or optimized_path(db_path)
+    temp_path = output_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    source_stat = os.stat(db_path)
+    source = ConnectionProfile().connect(db_path)
+    copy = sqlite3.connect(temp_path)
+    try:
+        source.backup(copy)
+        copy.create_function("TOD_SECONDS", 1, TimeTable().seconds, deterministic=True)
+        with copy:
+            for table in ("VideoObservation", "JudgeCall"):
+                columns = [
+                    row[1] for row in copy.execute(f"PRAGMA table_info({table})")
+                ]
+                if "TODSeconds" not in columns:
+                    copy.execute(f"ALTER TABLE {table} ADD COLUMN TODSeconds INTEGER")
+                copy.execute(f"UPDATE {table} SET TODSeconds = TOD_SECONDS(TOD)")
+            for name, definition in OPTIMIZED_INDEXES.items():
+                copy.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+            copy.execute("DROP TABLE IF EXISTS EnduranceSource")
+            copy.execute(
+                "CREATE TABLE EnduranceSource (Path TEXT, Size INTEGER, ModifiedTime INTEGER)"
+            )
+            copy.execute(
+                "INSERT INTO EnduranceSource VALUES (?, ?, ?)",
+                (
+                    os.path.abspath(db_path),
+                    source_stat.st_size,
+                    source_stat.st_mtime_ns,
+                ),
+            )
+        copy.execute("ANALYZE")
+    finally:
+        source.close()
+        copy.close()
+
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+class Roster:
+    """
+    The athletes and judges of a race.
+
+    :param race_id: ID of the race
+    :type race_id: int
+    :param athlete_rows: Rows of (Bib number, IDAthlete, First name, Last name, Country code,
+        Gender, Finishing time, Finishing place, Finished) for each bib of the race
+    :type athlete_rows: list[tuple[any]]
+    :param judge_rows: Rows of (IDJudge, First name, Last name, Country code) for each judge
+        that made a call in the race
+    :type judge_rows: list[tuple[any]]
+    """
+
+    def __init__(self, race_id, athlete_rows, judge_rows):
+        self.race_id = race_id
+        self.athlete_rows = athlete_rows
+        self.judge_rows = judge_rows
+        self.athletes = {row[0]: row for row in athlete_rows}
+
+    @property
+    def judges(self):
+        """
+        The judges that made a call in the race, ordered by ID.
+
+        :rtype: list[tuple[any]]
+        """
+        return self.judge_rows
+
+    def athlete_name(self, bib_num):
+        """
+        Get the name of the athlete wearing a bib, empty if there is no record of them.
+
+        :param bib_num: Bib number of the athlete
+        :type bib_num: int
+        :return: Last name and first name of the athlete
+        :rtype: tuple[str, str]
+        """
+        athlete = self.athletes.get(bib_num)
+        if athlete is None or athlete[1] is None:
+            return "", ""
+        return athlete[3], athlete[2]
 
 
 class DB:
     """
-    Class that handles retrieving data from the SQLite database.
+    Class that handles retrieving data from the SQLite database. If an up to date
+    optimized working copy of the database exists, it is used instead of the original.
 
     :param db_path: Path to the database file
     :type db_path: str
+    :param prefer_optimized: Whether to use the optimized working copy when there is one
+    :type prefer_optimized: bool
+    :param profile: Settings used to open the database, read only defaults if None
+    :type profile: ConnectionProfile | None
+    :param pool_size: Max number of connections that threads can use at the same time
+    :type pool_size: int
+    :param cache_bytes: Max estimated size of cached query results, 0 to disable caching
+    :type cache_bytes: int
     """
 
-    def __init__(self, db_path):
-        self.connection = sqlite3.connect(db_path)
+    def __init__(
+        self,
+        db_path,
+        prefer_optimized=True,
+        profile=None,
+        pool_size=4,
+        cache_bytes=64 * 1024 * 1024,
+    ):
+        self.source_path = db_path
+        self.path = (prefer_optimized and find_optimized_copy(db_path)) or db_path
+        self.profile = profile or ConnectionProfile()
+        # Shared by every connection, so a time of day is parsed once per database
+        self.times = TimeTable()
+        self._pool = ConnectionPool(self._open_connection, pool_size)
+
+        self.cache = QueryCache(cache_bytes)
+        self._file_signature = self._get_file_signature()
+        self._data_versions = dict()
+        self._change_lock = threading.Lock()
+        self.generation = 0
+
+        self._rosters = dict()
+
+        self.profiler = None
+        if os.environ.get(PROFILE_VARIABLE):
+            self.enable_profiling()
+
+        with self.connection() as connection:
+            self.connection_settings = self.profile.describe(connection)
+        logger.info("Opened %s with %s", self.path, self.connection_settings)
 
-    def __del__(self):
-        self.connection.close()
+        # Optimized databases carry the time of day as seconds in TODSeconds
+        self.optimized = all(
+            "TODSeconds" in self.get_columns(table)
+            for table in ("VideoObservation", "JudgeCall")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open_connection(self):
+        connection = self.profile.connect(self.path, check_same_thread=False)
+        # Lets queries sort and compare the text TOD columns as real times
+        connection.create_function(
+            "TOD_SECONDS", 1, self.times.seconds, deterministic=True
+        )
+        return connection
+
+    def connection(self):
+        """
+        Check out a connection to this database for the duration of a with block. This
+        can be used from any thread.
+
+        :return: A connection only used by this thread until the block ends
+        :rtype: typing.ContextManager[sqlite3.Connection]
+        """
+        return self._pool.connection()
+
+    def enable_profiling(self, profiler=None, dump_at_exit=True):
+        """
+        Start recording every query run on this database.
+
+        :param profiler: Profiler to record to, a new one if None
+        :type profiler: QueryProfiler | None
+        :param dump_at_exit: Whether to write the report of the profiler when Python exits
+        :type dump_at_exit: bool
+        :return: The profiler queries are recorded to
+        :rtype: QueryProfiler
+        """
+        self.profiler = profiler or QueryProfiler()
+        if dump_at_exit:
+            atexit.unregister(self.profiler.dump)
+            atexit.register(self.profiler.dump)
+        return self.profiler
+
+    def disable_profiling(self):
+        """
+        Stop recording queries run on this database.
+        """
+        if self.profiler is not None:
+            atexit.unregister(self.profiler.dump)
+        self.profiler = None
+
+    def close(self):
+        """
+        Close every connection to this database. Queries can not be run afterwards.
+        """
+        self._pool.close()
+        self.cache.clear()
+
+    def _get_file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def check_for_changes(self, connection):
+        """
+        Check if the database changed since the last query, and if so, drop every cached
+        query result. Changes are detected through the modification time and size of the
+        database file, as well as PRAGMA data_version of the given connection.
+
+        :param connection: A connection checked out from this database
+        :type connection: sqlite3.Connection
+        :return: True if the database changed, False otherwise
+        :rtype: bool
+        """
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        file_signature = self._get_file_signature()
+        with self._change_lock:
+            previous_version = self._data_versions.get(id(connection), data_version)
+            self._data_versions[id(connection)] = data_version
+            changed = (
+                data_version != previous_version
+                or file_signature != self._file_signature
+            )
+            self._file_signature = file_signature
+            if changed:
+                self.generation += 1
+        if changed:
+            logger.info("%s changed, clearing cached query results", self.path)
+            self.cache.clear()
+        return changed
+
+    def get_generation(self):
+        """
+        Check the database for changes, and get a number that goes up every time it
+        changes. Anything derived from the database while the number stays the same is
+        still up to date.
+
+        :return: The generation of the database
+        :rtype: int
+        """
+        with self.connection() as connection:
+            self.check_for_changes(connection)
+        return self.generation
 
     def execute_lookup_query(self, query, params):
         """
@@ -23,13 +967,18 @@ class DB:
         :type query: str
         :param params: parameters to pass to sql query
         :type params: tuple[any]
-        :return: Data returned from sql query
+        :return: Data returned from sql query, which must not be modified as it is cached
         :rtype: list[tuple[any]]
         """
-        cursor = self.connection.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchall()
-        cursor.close()
+        key = ("rows", query, tuple(params))
+        with self.connection() as connection:
+            self.check_for_changes(connection)
+            result = self.cache.get(key)
+            if result is None:
+                _, result = self._fetch_all(connection, query, params)
+                self.cache.put(key, result)
+            elif self.profiler is not None:
+                self.profiler.record_cached(QueryProfiler.call_site())
 
         return result
 
@@ -41,16 +990,274 @@ class DB:
         :type query: str
         :param params: parameters to pass to sql query
         :type params: tuple[any]
-        :return: Data returned from sql query
-        :rtype: list[tuple[any]]
+        :return: Headers and data returned from sql query, which must not be modified as they are cached
+        :rtype: tuple[list[str], list[tuple[any]]]
         """
-        cursor = self.connection.cursor()
+        key = ("headers", query, tuple(params))
+        with self.connection() as connection:
+            self.check_for_changes(connection)
+            cached = self.cache.get(key)
+            if cached is None:
+                cached = self._fetch_all(connection, query, params)
+                self.cache.put(key, cached)
+            elif self.profiler is not None:
+                self.profiler.record_cached(QueryProfiler.call_site())
+
+        return cached
+
+    def _fetch_all(self, connection, query, params):
+        # Runs a query, recording it when profiling
+        start = time.perf_counter()
+        cursor = connection.cursor()
         cursor.execute(query, params)
-        result = cursor.fetchall()
-        headers = [item[0] for item in cursor.description]
+        rows = cursor.fetchall()
+        headers = [item[0] for item in cursor.description or ()]
         cursor.close()
+        if self.profiler is not None:
+            self.profiler.record(
+                QueryProfiler.call_site(),
+                connection,
+                query,
+                params,
+                time.perf_counter() - start,
+                len(rows),
+            )
+        return headers, rows
+
+    def stream_query(self, query, params, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Executes the sql query, yielding the rows in batches as they are fetched instead of
+        all at once. Results are not cached. A connection stays checked out until the
+        generator is exhausted or closed.
+
+        :param query: sql query to run
+        :type query: str
+        :param params: parameters to pass to sql query
+        :type params: tuple[any]
+        :param batch_size: Max number of rows in each batch
+        :type batch_size: int
+        :return: Batches of rows returned from sql query
+        :rtype: typing.Iterator[list[tuple[any]]]
+        """
+        for _, rows in self._stream_batches(query, params, batch_size):
+            if rows:
+                yield rows
+
+    def stream_columnar_query(
+        self, query, params, dtypes, batch_size=DEFAULT_BATCH_SIZE
+    ):
+        """
+        Executes the sql query, yielding the rows in chunks of one typed NumPy array per
+        column as they are fetched. Results are not cached. An empty result still yields
+        one chunk of empty columns. A connection stays checked out until the generator is
+        exhausted or closed.
+
+        :param query: sql query to run
+        :type query: str
+        :param params: parameters to pass to sql query
+        :type params: tuple[any]
+        :param dtypes: Type of each column in the result, NULL values become NaN in float columns
+        :type dtypes: list[numpy.dtype]
+        :param batch_size: Max number of rows in each chunk
+        :type batch_size: int
+        :return: Chunks mapping column name to the values of that column
+        :rtype: typing.Iterator[dict[str, numpy.ndarray]]
+        """
+        for names, rows in self._stream_batches(query, params, batch_size):
+            values = zip(*rows) if rows else [()] * len(names)
+            yield {
+                name: np.array(column, dtype=dtype)
+                for name, column, dtype in zip(names, values, dtypes)
+            }
+
+    def _stream_batches(self, query, params, batch_size):
+        # Yields the column names with each batch, and at least one (possibly empty) batch.
+        # When profiling, only the time spent in SQLite is recorded.
+        call_site = QueryProfiler.call_site() if self.profiler is not None else None
+        seconds = 0.0
+        count = 0
+        with self.connection() as connection:
+            self.check_for_changes(connection)
+            cursor = connection.cursor()
+            try:
+                start = time.perf_counter()
+                cursor.execute(query, params)
+                names = [item[0] for item in cursor.description]
+                rows = cursor.fetchmany(batch_size)
+                seconds += time.perf_counter() - start
+                count += len(rows)
+                yield names, rows
+                while len(rows) == batch_size:
+                    start = time.perf_counter()
+                    rows = cursor.fetchmany(batch_size)
+                    seconds += time.perf_counter() - start
+                    count += len(rows)
+                    if rows:
+                        yield names, rows
+            finally:
+                cursor.close()
+                if self.profiler is not None and call_site is not None:
+                    self.profiler.record(
+                        call_site, connection, query, params, seconds, count
+                    )
+
+    def execute_columnar_query(self, query, params, dtypes):
+        """
+        Executes the sql query, returning the result as one typed NumPy array per column.
+        Rows are converted a batch at a time, so the whole result is never held as Python
+        tuples at once, and each batch is copied into arrays that grow in place, so the
+        batches and the whole result are never held at once either.
+
+        :param query: sql query to run
+        :type query: str
+        :param params: parameters to pass to sql query
+        :type params: tuple[any]
+        :param dtypes: Type of each column in the result, NULL values become NaN in float
+            columns, only numeric types are supported
+        :type dtypes: list[numpy.dtype]
+        :return: A map of column name to the values of that column, which are read only as they are cached
+        :rtype: dict[str, numpy.ndarray]
+        """
+        key = ("columns", query, tuple(params), tuple(dtypes))
+        with self.connection() as connection:
+            self.check_for_changes(connection)
+            columns = self.cache.get(key)
+        if columns is not None and self.profiler is not None:
+            self.profiler.record_cached(QueryProfiler.call_site())
+        if columns is None:
+            count = 0
+            for chunk in self.stream_columnar_query(query, params, dtypes):
+                size = len(next(iter(chunk.values()), ()))
+                if columns is None:
+                    columns = chunk
+                    count = size
+                    continue
+
+                # Grow by half at a time, resizing reallocates in place where it can
+                capacity = len(next(iter(columns.values())))
+                if count + size > capacity:
+                    capacity = max(count + size, capacity + capacity // 2)
+                    for column in columns.values():
+                        column.resize(capacity, refcheck=False)
+                for name, column in columns.items():
+                    column[count : count + size] = chunk[name]
+                count += size
+
+            for column in columns.values():
+                column.resize(count, refcheck=False)
+                column.flags.writeable = False
+            self.cache.put(key, columns)
+
+        return columns
 
-        return headers, result
+    def get_columns(self, table):
+        """
+        Get the names of the columns of a table.
+
+        :param table: Name of the table
+        :type table: str
+        :return: Column names of the table, empty if the table does not exist
+        :rtype: list[str]
+        """
+        return [
+            column[1]
+            for column in self.execute_lookup_query(f"PRAGMA table_info({table})", ())
+        ]
+
+    def tod_seconds(self, table=None):
+        """
+        Get the SQL expression for the time of day of a row as seconds since midnight.
+        Uses the precomputed TODSeconds column of optimized databases, and the TOD_SECONDS
+        function registered on the connection otherwise.
+
+        :param table: Name or alias of the table the TOD column belongs to, if needed
+        :type table: str | None
+        :return: SQL expression evaluating to the time of day in seconds
+        :rtype: str
+        """
+        prefix = f"{table}." if table else ""
+        if self.optimized:
+            return f"{prefix}TODSeconds"
+        return f"TOD_SECONDS({prefix}TOD)"
+
+    def time_range_filter(self, start=None, end=None, table=None):
+        """
+        Get an SQL condition limiting rows to a range of times of day, to be appended to
+        a WHERE clause.
+
+        :param start: Earliest time of day in seconds since midnight, unbounded if None
+        :type start: int | None
+        :param end: Latest time of day in seconds since midnight, unbounded if None
+        :type end: int | None
+        :param table: Name or alias of the table the TOD column belongs to, if needed
+        :type table: str | None
+        :return: The condition and its parameters
+        :rtype: tuple[str, tuple[int]]
+        """
+        condition = ""
+        params = ()
+        if start is not None:
+            condition += f" AND {self.tod_seconds(table)} >= ?"
+            params += (start,)
+        if end is not None:
+            condition += f" AND {self.tod_seconds(table)} <= ?"
+            params += (end,)
+        return condition, params
+
+    @staticmethod
+    def rowid_range_filter(rowid_range=None):
+        """
+        Get an SQL condition limiting rows to a range of rowids, to be appended to a
+        WHERE clause. Rows are only ever appended to the tables this app reads, so a
+        range of rowids holds the rows added between two high water marks.
+
+        :param rowid_range: Rowid after which rows start and rowid at which they end, or
+            None to not limit rows
+        :type rowid_range: tuple[int, int] | None
+        :return: The condition and its parameters
+        :rtype: tuple[str, tuple[int]]
+        """
+        if rowid_range is None:
+            return "", ()
+        return " AND rowid > ? AND rowid <= ?", tuple(rowid_range)
+
+    @staticmethod
+    def bib_filter(bibs=None, table=None):
+        """
+        Get an SQL condition limiting rows to some athletes, to be appended to a WHERE
+        clause.
+
+        :param bibs: Bib numbers of the athletes, or None to not limit rows
+        :type bibs: list[int] | None
+        :param table: Name or alias of the table the BibNumber column belongs to, if needed
+        :type table: str | None
+        :return: The condition and its parameters
+        :rtype: tuple[str, tuple[int]]
+        """
+        if bibs is None:
+            return "", ()
+        prefix = f"{table}." if table else ""
+        placeholders = ", ".join("?" * len(bibs))
+        return f" AND {prefix}BibNumber IN ({placeholders})", tuple(bibs)
+
+    def get_high_water_marks(self):
+        """
+        Get the highest rowid of the tables that are appended to while a race is
+        underway. The result is cached until the database changes, so this is cheap to
+        poll.
+
+        :return: Map of VideoObservation and JudgeCall to their highest rowid, 0 if empty
+        :rtype: dict[str, int]
+        """
+        marks = self.execute_lookup_query(
+            "SELECT (SELECT MAX(rowid) FROM VideoObservation), "
+            "(SELECT MAX(rowid) FROM JudgeCall)",
+            (),
+        )[0]
+        return {
+            "VideoObservation": marks[0] or 0,
+            "JudgeCall": marks[1] or 0,
+        }
 
     @staticmethod
     def single_query_result(query_result):
@@ -131,189 +1338,44 @@ class DB:
         )
         return result
 
-    # Queries for tables in the report
-    def get_judge_infraction_summary_by_race(self, race_id):
-        """
-        Judge infraction data.
-
-        :return: Judge infraction data
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT FirstName AS 'Judge First Name', LastName AS 'Judge Last Name',"
-            "SUM(CASE WHEN Color = 'Red' AND Infraction = '~' THEN 1 ELSE 0 END) AS `Red ~`,"
-            "SUM(CASE WHEN Color = 'Red' AND Infraction = '<' THEN 1 ELSE 0 END) AS `Red <`,"
-            "SUM(CASE WHEN Color = 'Yellow' AND Infraction = '~' THEN 1 ELSE 0 END) AS 'Yellow ~',"
-            "SUM(CASE WHEN Color = 'Yellow' AND Infraction = '<' THEN 1 ELSE 0 END) AS 'Yellow <' "
-            "FROM Judge J "
-            "JOIN JudgeCall JC ON J.IDJudge = JC.IDJudge "
-            "WHERE IDRace = ? "
-            "GROUP by J.IDJudge "
-            "ORDER BY J.FirstName, J.LastName",
-            (race_id,),
-        )
-
-    def get_athlete_judge_infraction_summary_by_race(self, race_id):
-        """
-        Judge/Athlete infraction data.
-
-        :return: Judge/Athlete infraction data
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT B.BibNumber AS 'Bib Number', A.FirstName AS 'Athlete First Name', A.LastName AS 'Athlete Last Name', "
-            "J.FirstName AS 'Judge First Name', J.LastName AS 'Judge Last Name', "
-            "(CASE WHEN Color = 'Yellow' AND Infraction = '~' THEN 'x' ELSE NULL END) AS `Yellow ~`,"
-            "(CASE WHEN Color = 'Red' AND Infraction = '~' THEN 'x' ELSE NULL END) AS `Red ~`,"
-            "(CASE WHEN Color = 'Yellow' AND Infraction = '<' THEN 'x' ELSE NULL END) AS `Yellow <`,"
-            "(CASE WHEN Color = 'Red' AND Infraction = '<' THEN 'x' ELSE NULL END) AS `Red <` "
-            "FROM Judge J "
-            "JOIN JudgeCall JC ON J.IDJudge = JC.IDJudge "
-            "JOIN Bib B ON JC.BibNumber = B.BibNumber "
-            "JOIN Athlete A ON B.IDAthlete = A.IDAthlete "
-            "WHERE JC.IDRace = ? "
-            "GROUP BY A.IDAthlete, J.IDJudge "
-            "ORDER BY B.BibNumber, J.FirstName, J.LastName",
-            (race_id,),
-        )
-
-    def get_athlete_infraction_summary_by_race(self, race_id):
-        """
-        Athlete infraction data.
-
-        :return: Athlete infraction data
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT B.BibNumber AS 'Bib Number', A.FirstName AS 'Athlete First Name', A.LastName AS 'Athlete First Name',"
-            "SUM(CASE WHEN Color = 'Yellow' AND Infraction = '~' THEN 1 ELSE 0 END) AS `Yellow ~`,"
-            "SUM(CASE WHEN Color = 'Yellow' AND Infraction = '<' THEN 1 ELSE 0 END) AS `Yellow <`,"
-            "SUM(CASE WHEN Color = 'Red' AND Infraction = '~' THEN 1 ELSE 0 END) AS `Red ~`,"
-            "SUM(CASE WHEN Color = 'Red' AND Infraction = '<' THEN 1 ELSE 0 END) AS `Red <` "
-            "FROM JudgeCall JC "
-            "JOIN Bib B ON JC.BibNumber = B.BibNumber "
-            "JOIN Athlete A ON B.IDAthlete = A.IDAthlete "
-            "WHERE JC.IDRace = ? "
-            "GROUP BY A.IDAthlete "
-            "ORDER BY B.BibNumber ",
-            (race_id,),
-        )
-
-    def get_red_without_yellow_summary_by_race(self, race_id):
-        """
-        Get data where there is a red card but no yellow card.
-
-        :return: Data where there is a red card but no yellow card
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT FirstName AS 'Judge First Name', LastName AS 'Judge Last Name', "
-            "        SUM(CASE WHEN Color = 'Red' AND Infraction = '~' AND NOT EXISTS ("
-            "                SELECT * FROM JudgeCall J2"
-            "                WHERE J1.IDJudge = J2.IDJudge AND J1.IDRace = J2.IDRace AND J1.BibNumber = J2.BibNumber AND J2.Infraction = '~' AND J2.Color = 'Yellow' AND J2.TOD < J1.TOD LIMIT 1)"
-            "        THEN 1 ELSE 0 END) AS `# of ~ Red cards without Yellow`,"
-            "        SUM(CASE WHEN Color = 'Red' AND Infraction = '<' AND NOT EXISTS ("
-            "                SELECT * FROM JudgeCall J2"
-            "                WHERE J1.IDJudge = J2.IDJudge AND J1.IDRace = J2.IDRace AND J1.BibNumber = J2.BibNumber AND J2.Infraction = '<' AND J2.Color = 'Yellow' AND J2.TOD < J1.TOD LIMIT 1)"
-            "        THEN 1 ELSE 0 END) AS `# of < Red cards without Yellow` "
-            "FROM JudgeCall J1 "
-            "JOIN Judge J ON J1.IDJudge = J.IDJudge "
-            "WHERE IDRace = ? "
-            "Group By J1.IDJudge "
-            "Order By FirstName, LastName",
-            (race_id,),
-        )
-
-    def get_yellow_without_red_summary_by_race(self, race_id):
-        """
-        Get data where there is a yellow card but no red card.
-
-        :return: Data where there is a yellow card but no red card
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT FirstName AS 'Judge First Name', LastName AS 'Judge Last Name', "
-            "        SUM(CASE WHEN Color = 'Yellow' AND Infraction = '~' AND NOT EXISTS ("
-            "                SELECT * FROM JudgeCall J2"
-            "                WHERE J1.IDJudge = J2.IDJudge AND J1.IDRace = J2.IDRace AND J1.BibNumber = J2.BibNumber AND J2.Infraction = '~' AND J2.Color = 'Red' AND J1.TOD < J2.TOD LIMIT 1)"
-            "        THEN 1 ELSE 0 END) AS `# of ~ Yellow not followed by a Red`,"
-            "        SUM(CASE WHEN Color = 'Yellow' AND Infraction = '<' AND NOT EXISTS ("
-            "                SELECT * FROM JudgeCall J2"
-            "                WHERE J1.IDJudge = J2.IDJudge AND J1.IDRace = J2.IDRace AND J1.BibNumber = J2.BibNumber AND J2.Infraction = '<' AND J2.Color = 'Red' AND J1.TOD < J2.TOD LIMIT 1)"
-            "        THEN 1 ELSE 0 END) AS `# of < Yellow not followed by a Red` "
-            "FROM JudgeCall J1 "
-            "JOIN Judge J ON J1.IDJudge = J.IDJudge "
-            "WHERE IDRace = ? "
-            "Group By J1.IDJudge "
-            "Order By FirstName, LastName",
-            (race_id,),
-        )
+    def get_race_judge_count(self, race_id):
+        """Query this database for the number of judges assigned to a race. Databases
+        without a RaceJudge table, or without judges assigned to the race, count every
+        judge that made a call in the race instead.
 
-    def get_judge_consistency_report_by_race(self, race_id):
-        return self.execute_lookup_query_with_headers(
-            """SELECT Judge.FirstName AS 'Judge First Name', Judge.LastName AS 'Judge Last Name', 
-     MAX(CASE WHEN Infraction='~' AND Color='Red' THEN MajorityNumber Else 0 END) 'Majority Matched Red ~', 
-     MAX(CASE WHEN Infraction='<' AND Color='Red' THEN MajorityNumber Else 0 END) 'Majority Matched Red <', 
-     MAX(CASE WHEN Infraction='~' AND Color='Yellow' THEN MajorityNumber Else 0 END) 'Majority Matched Yellow ~', 
-     MAX(CASE WHEN Infraction='<' AND Color='Yellow'THEN MajorityNumber Else 0 END) 'Majority Matched Yellow <' 
-     FROM 
-          (SELECT JudgeCall.IDJudge, COUNT(JudgeCall.BibNumber) AS MajorityNumber, 
-          JudgeCall.Infraction, 
-          JudgeCall.Color 
-     FROM 
-          JudgeCall 
-     INNER JOIN 
-          (SELECT JudgeCall.BibNumber, JudgeCall.IDRace, JudgeCall.Color, JudgeCall.Infraction 
-     FROM 
-          JudgeCall 
-     WHERE 
-          JudgeCall.IDRace = ? GROUP BY JudgeCall.BibNumber, 
-          JudgeCall.IDRace, 
-          JudgeCall.Color, 
-          JudgeCall.Infraction HAVING (COUNT(JudgeCall.Infraction))>=(SELECT COUNT(idJudge)/2 FROM RaceJudge 
-     WHERE 
-          RaceJudge.IDRace = ?)) MajorityCallPerAthlete ON (JudgeCall.Infraction = MajorityCallPerAthlete.Infraction) 
-          AND (JudgeCall.Color = MajorityCallPerAthlete.Color) 
-          AND (JudgeCall.BibNumber = MajorityCallPerAthlete.BibNumber) 
-          AND (JudgeCall.IDRace = MajorityCallPerAthlete.IDRace) 
-          GROUP BY JudgeCall.IDJudge, JudgeCall.Color, JudgeCall.Infraction) MajorityCallByJudge 
-          LEFT JOIN Judge ON Judge.IDJudge=MajorityCallByJudge.IDJudge 
-          GROUP BY MajorityCallByJudge.IDJudge ORDER BY Judge.LastName, Judge.FirstName""",
-            (race_id, race_id),
-        )
+        :param race_id: Race ID for this query
+        :type race_id: int
 
-    def get_per_athlete_calls_summary_by_race(self, race_id):
+        :returns: The number of judges in the race
+        :rtype: int
         """
-        Get data per athlete call.
+        if self.get_columns("RaceJudge"):
+            count = self.execute_lookup_query(
+                "SELECT COUNT(IDJudge) FROM RaceJudge WHERE IDRace = ?", (race_id,)
+            )[0][0]
+            if count:
+                return count
 
-        :return: Data per athlete call
-        :rtype: list[tuple[any]]
-        """
-        return self.execute_lookup_query_with_headers(
-            "SELECT B.BibNumber AS 'Bib Number', A.FirstName AS 'Athlete First Name', A.LastName AS 'Athlete Last Name',"
-            "SUM(CASE WHEN Color = 'Yellow' THEN 1 ELSE 0 END) AS '# of Yellow Paddles',"
-            "SUM(CASE WHEN Color = 'Red' THEN 1 ELSE 0 END) AS '# of Red Cards' "
-            "FROM JudgeCall JC "
-            "JOIN Bib B ON JC.BibNumber = B.BibNumber "
-            "JOIN Athlete A ON B.IDAthlete = A.IDAthlete "
-            "WHERE JC.IDRace = ? "
-            "GROUP BY A.IDAthlete "
-            "ORDER BY B.BibNumber",
+        return self.execute_lookup_query(
+            "SELECT COUNT(DISTINCT IDJudge) FROM JudgeCall WHERE IDRace = ?",
             (race_id,),
-        )
+        )[0][0]
 
     def get_bibs_by_race(self, race_id):
-        """Query this database for all bib numbers of a race.
+        """Query this database for all bib numbers of a race, of the athletes that
+        get_loc_columns_by_race has LOC values for.
 
         :param race_id: Race ID for this query
         :type race_id: int
 
-        :returns: A list of bib numbers
+        :returns: A list of bib numbers, in order
         :rtype: list[tuple[any]]
         """
         return self.execute_lookup_query(
             "SELECT DISTINCT BibNumber FROM VideoObservation "
-            "WHERE IDRace = ? AND LOCAverage IS NOT NULL",
+            "WHERE IDRace = ? AND BibNumber IS NOT NULL AND LOCAverage IS NOT NULL "
+            f"AND {self.tod_seconds()} IS NOT NULL "
+            "ORDER BY BibNumber",
             (race_id,),
         )
 
@@ -330,10 +1392,91 @@ class DB:
         """
         return self.execute_lookup_query(
             "SELECT LOCAverage, TOD as Time FROM VideoObservation "
-            "WHERE IDRace = ? AND BibNumber = ? AND LOCAverage IS NOT NULL",
+            "WHERE IDRace = ? AND BibNumber = ? AND LOCAverage IS NOT NULL "
+            f"ORDER BY {self.tod_seconds()}",
             (race_id, bib_num),
         )
 
+    def get_loc_columns_by_race(
+        self, race_id, start=None, end=None, rowid_range=None, bibs=None
+    ):
+        """Query this database for LOC information of every athlete in a race, as columns.
+        Observations without a LOC value or a valid time of day are left out.
+
+        :param race_id: Race ID for this query
+        :type race_id: int
+        :param start: Only include observations from this time of day on, in seconds since midnight
+        :type start: int | None
+        :param end: Only include observations up to this time of day, in seconds since midnight
+        :type end: int | None
+        :param rowid_range: Only include observations after the first rowid up to the second
+        :type rowid_range: tuple[int, int] | None
+        :param bibs: Only include observations of these athletes
+        :type bibs: list[int] | None
+
+        :returns: Columns BibNumber (int64), LOCAverage (float32) and TODSeconds (int64), ordered by bib number and time
+        :rtype: dict[str, numpy.ndarray]
+        """
+        time_range, time_params = self.time_range_filter(start, end)
+        rowids, rowid_params = self.rowid_range_filter(rowid_range)
+        athletes, bib_params = self.bib_filter(bibs)
+        return self.execute_columnar_query(
+            f"SELECT BibNumber, LOCAverage, {self.tod_seconds()} AS TODSeconds "
+            "FROM VideoObservation "
+            "WHERE IDRace = ? AND BibNumber IS NOT NULL AND LOCAverage IS NOT NULL "
+            f"AND {self.tod_seconds()} IS NOT NULL{time_range}{rowids}{athletes} "
+            f"ORDER BY BibNumber, {self.tod_seconds()}",
+            (race_id, *time_params, *rowid_params, *bib_params),
+            [np.int64, np.float32, np.int64],
+        )
+
+    def get_judge_call_columns_by_race(
+        self, race_id, start=None, end=None, rowid_range=None, bibs=None
+    ):
+        """Query this database for every judge call made in a race, as columns. Colors and
+        infractions are encoded as their position in COLORS and INFRACTIONS, or -1 if they are
+        not known. Bib numbers, judges and times of day that are missing are -1 as well.
+
+        :param race_id: Race ID for this query
+        :type race_id: int
+        :param start: Only include calls from this time of day on, in seconds since midnight
+        :type start: int | None
+        :param end: Only include calls up to this time of day, in seconds since midnight
+        :type end: int | None
+        :param rowid_range: Only include calls after the first rowid up to the second
+        :type rowid_range: tuple[int, int] | None
+        :param bibs: Only include calls against these athletes
+        :type bibs: list[int] | None
+
+        :returns: Columns BibNumber (int64), IDJudge (int64), ColorCode (int8), InfractionCode (int8) and
+            TODSeconds (int64), ordered by bib number, judge and time
+        :rtype: dict[str, numpy.ndarray]
+        """
+        color_code = " ".join(
+            f"WHEN '{color}' THEN {code}" for code, color in enumerate(COLORS)
+        )
+        infraction_code = " ".join(
+            f"WHEN '{infraction}' THEN {code}"
+            for code, infraction in enumerate(INFRACTIONS)
+        )
+        time_range, time_params = self.time_range_filter(start, end)
+        rowids, rowid_params = self.rowid_range_filter(rowid_range)
+        athletes, bib_params = self.bib_filter(bibs, "JudgeCall")
+        return self.execute_columnar_query(
+            "SELECT COALESCE(BibNumber, -1) AS BibNumber, "
+            "COALESCE(IDJudge, -1) AS IDJudge, "
+            f"CASE Color {color_code} ELSE -1 END AS ColorCode, "
+            f"CASE Infraction {infraction_code} ELSE -1 END AS InfractionCode, "
+            f"COALESCE({self.tod_seconds('JudgeCall')}, -1) AS TODSeconds "
+            "FROM JudgeCall "
+            f"WHERE IDRace = ?{time_range}{rowids}{athletes} "
+            # Missing values sort first, like the -1 they are replaced with
+            "ORDER BY JudgeCall.BibNumber, JudgeCall.IDJudge, "
+            f"{self.tod_seconds('JudgeCall')}",
+            (race_id, *time_params, *rowid_params, *bib_params),
+            [np.int64, np.int64, np.int8, np.int8, np.int64],
+        )
+
     def get_judge_data_by_race_and_bib(self, race_id, bib_num):
         """Query this database for judge data matching the given race ID and bib number.
 
@@ -347,7 +1490,8 @@ class DB:
         """
         return self.execute_lookup_query(
             "SELECT TOD AS Time, IDJudge, Infraction, Color FROM JudgeCall "
-            "WHERE IDRace = ? AND BibNumber = ?",
+            "WHERE IDRace = ? AND BibNumber = ? "
+            f"ORDER BY {self.tod_seconds()}",
             (race_id, bib_num),
         )
 
@@ -360,13 +1504,46 @@ class DB:
         :returns: A list of tuple, where each tuple contains information for a particular judge
         :rtype: list[tuple[any]]
         """
+        # Only the calls of this race are looked at, instead of grouping every call
         return self.execute_lookup_query(
-            "SELECT Judge.* FROM Judge "
-            "JOIN JudgeCall ON Judge.IDJudge = JudgeCall.IDJudge "
-            "WHERE JudgeCall.IDRace = ? GROUP BY Judge.IDJudge",
+            "SELECT IDJudge, FirstName, LastName, CountryCode FROM Judge "
+            "WHERE IDJudge IN (SELECT IDJudge FROM JudgeCall WHERE IDRace = ?) "
+            "ORDER BY IDJudge",
             (race_id,),
         )
 
+    def get_roster(self, race_id):
+        """Query this database for every athlete and judge of a race. The roster is kept
+        for as long as this database does not change.
+
+        :param race_id: ID of the race
+        :type race_id: int
+
+        :returns: The athletes and judges of the race
+        :rtype: Roster
+        """
+        athlete_rows = self.execute_lookup_query(
+            "SELECT B.BibNumber, A.IDAthlete, A.FirstName, A.LastName, A.CountryCode, "
+            "A.Gender, B.FinishingTime, B.FinishingPlace, B.Finished "
+            "FROM Bib B "
+            "LEFT JOIN Athlete A ON A.IDAthlete = B.IDAthlete "
+            "WHERE B.IDRace = ? "
+            "ORDER BY B.BibNumber",
+            (race_id,),
+        )
+        judge_rows = self.get_judge_by_race(race_id)
+
+        # Cached query results stay the same objects until the database changes
+        roster = self._rosters.get(race_id)
+        if (
+            roster is None
+            or roster.athlete_rows is not athlete_rows
+            or roster.judge_rows is not judge_rows
+        ):
+            roster = Roster(race_id, athlete_rows, judge_rows)
+            self._rosters[race_id] = roster
+        return roster
+
     def get_races(self):
         """Query this database for all races.
 
@@ -394,6 +1571,7 @@ class DB:
         """
         return self.execute_lookup_query(
             "SELECT TOD FROM JudgeCall "
-            "WHERE BibNumber = ? AND IDRace = ? AND IDJudge = ? AND Color = ? AND Infraction = ?",
+            "WHERE BibNumber = ? AND IDRace = ? AND IDJudge = ? AND Color = ? AND Infraction = ? "
+            f"ORDER BY {self.tod_seconds()}",
             (bib, race_id, judge_id, color, infraction),
         )
@@ -0,0 +1,196 @@
+import logging
+import sqlite3
+import time
+
+import pandas as pd
+
+from endurance.db import SCHEMA, TOD_FORMAT, TimeTable
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+IMPORT_TABLES = ("VideoObservation", "JudgeCall")
+"""Tables that exports can be imported into"""
+
+IMPORT_CHUNK_SIZE = 50_000
+"""Number of rows read from an export and inserted at a time"""
+
+MAX_REPORTED_ERRORS = 5
+"""Number of invalid rows listed when an export is rejected"""
+
+logger = logging.getLogger(__name__)
+
+
+class ImportFormatError(ValueError):
+    """Raised when an export can not be imported, nothing of it is imported then."""
+
+
+def detect_table(columns):
+    """
+    Detect which table an export belongs to from its columns.
+
+    :param columns: Column names of the export
+    :type columns: list[str]
+    :raises ImportFormatError: If the columns do not match any table
+    :return: Name of the table
+    :rtype: str
+    """
+    if "LOCAverage" in columns:
+        return "VideoObservation"
+    if "Color" in columns and "Infraction" in columns:
+        return "JudgeCall"
+    raise ImportFormatError(
+        "Could not tell which table the export belongs to, it needs either a "
+        "LOCAverage column or Color and Infraction columns"
+    )
+
+
+def read_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Read a CSV or Parquet export in chunks, so the whole file is never in memory.
+
+    :param path: Path to the export, Parquet if it ends with .parquet, CSV otherwise
+    :type path: str
+    :param chunk_size: Max number of rows in each chunk
+    :type chunk_size: int
+    :raises ImportFormatError: If the export is Parquet and pyarrow is not installed
+    :return: The chunks of the export
+    :rtype: typing.Iterator[pandas.DataFrame]
+    """
+    if path.lower().endswith(".parquet"):
+        if parquet is None:
+            raise ImportFormatError("Importing Parquet files requires pyarrow")
+        for batch in parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={"TOD": str})
+
+
+def _prepare_chunk(chunk, columns, first_row, times):
+    """
+    Validate a chunk of an export and convert it to rows of the table.
+
+    :param chunk: The chunk to convert
+    :type chunk: pandas.DataFrame
+    :param columns: Columns of the table, in order
+    :type columns: list[str]
+    :param first_row: Row number of the first row of the chunk in the export
+    :type first_row: int
+    :param times: Times of day parsed so far in the export
+    :type times: TimeTable
+    :raises ImportFormatError: If a time of day does not match TOD_FORMAT
+    :return: Rows to insert into the table
+    :rtype: list[tuple[any]]
+    """
+    # Only the distinct times of day are parsed
+    codes, distinct = pd.factorize(chunk["TOD"])
+    distinct_seconds = pd.array(times.seconds_of(distinct), dtype="Int64")
+    seconds = pd.Series(
+        distinct_seconds.take(codes, allow_fill=True), index=chunk.index
+    )
+    invalid = seconds.isna().to_numpy().nonzero()[0]
+    if len(invalid):
+        examples = ", ".join(
+            f"row {first_row + index}: {chunk['TOD'].iloc[index]!r}"
+            for index in invalid[:MAX_REPORTED_ERRORS]
+        )
+        raise ImportFormatError(
+            f"{len(invalid)} times of day do not match {TOD_FORMAT!r} ({examples})"
+        )
+
+    frame = pd.DataFrame(
+        {
+            column: chunk[column] if column in chunk else None
+            for column in columns
+            if column != "TODSeconds"
+        }
+    )
+    if "TODSeconds" in columns:
+        frame["TODSeconds"] = seconds
+    frame = frame[columns].astype(object)
+    return list(frame.where(frame.notna(), None).itertuples(index=False, name=None))
+
+
+def import_export(path, db_path, table=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import a CSV or Parquet export into a table of a database, creating the table if
+    needed. The export is read in chunks and inserted in a single transaction, with
+    WAL journaling and synchronous writes off for the duration of the import.
+
+    :param path: Path to the export
+    :type path: str
+    :param db_path: Path to the database
+    :type db_path: str
+    :param table: Table to import into, detected from the columns of the export if None
+    :type table: str | None
+    :param chunk_size: Number of rows read and inserted at a time
+    :type chunk_size: int
+    :raises ImportFormatError: If the export can not be imported
+    :return: Number of rows imported and the time it took in seconds
+    :rtype: tuple[int, float]
+    """
+    start = time.perf_counter()
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = OFF")
+
+    rows = 0
+    times = TimeTable()
+    try:
+        connection.execute("BEGIN")
+        columns = None
+        for chunk in read_chunks(path, chunk_size):
+            if columns is None:
+                table = table or detect_table(list(chunk.columns))
+                columns = _prepare_table(connection, table, list(chunk.columns))
+
+            connection.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                _prepare_chunk(chunk, columns, rows + 1, times),
+            )
+            rows += len(chunk)
+            logger.info("Imported %s rows of %s", rows, path)
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        # Leave the database as it was found, so it can still be opened read only
+        connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        connection.close()
+
+    return rows, time.perf_counter() - start
+
+
+def _prepare_table(connection, table, export_columns):
+    """
+    Create a table if it does not exist yet, and find which of its columns to fill.
+
+    :param connection: Connection to the database
+    :type connection: sqlite3.Connection
+    :param table: Name of the table
+    :type table: str
+    :param export_columns: Column names of the export
+    :type export_columns: list[str]
+    :raises ImportFormatError: If the export misses a column every row needs
+    :return: Columns of the table to insert into, in order
+    :rtype: list[str]
+    """
+    if table not in IMPORT_TABLES:
+        raise ImportFormatError(f"Can not import into {table}")
+    missing = [
+        column
+        for column in ("IDRace", "BibNumber", "TOD")
+        if column not in export_columns
+    ]
+    if missing:
+        raise ImportFormatError(f"The export is missing {', '.join(missing)}")
+
+    definitions = ", ".join(f"{name} {kind}" for name, kind in SCHEMA[table].items())
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definitions})")
+    # Optimized copies and warehouses also hold the time of day in seconds
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
@@ -1,4 +1,5 @@
 from enum import IntEnum, IntFlag, auto
+from functools import partial
 
 import matplotlib.dates
 import numpy as np
@@ -21,24 +22,32 @@ class JudgeCallType(IntEnum):
 
 class AthletePlotGroup:
     """
-    A group of plots for a particular athlete.
+    A group of plots for a particular athlete. The plots can be left to be made the
+    first time this group is selected, so athletes that are never displayed are never
+    plotted.
 
-    :param loc_plot: The LOC data of this athlete as a line plot
-    :type loc_plot: matplotlib.lines.Line2D
+    :param loc_plot: The LOC data of this athlete as a line plot, None to make it with
+        create_plots
+    :type loc_plot: matplotlib.lines.Line2D | None
     :param annotation: Annotation to display judge data on the line plot
-    :type annotation: matplotlib.text.Annotation
+    :type annotation: matplotlib.text.Annotation | None
+    :param create_plots: Makes the line plot and the annotation of this athlete
+    :type create_plots: typing.Callable[[], tuple] | None
     """
 
-    def __init__(self, loc_plot, annotation=None):
+    def __init__(self, loc_plot=None, annotation=None, create_plots=None):
         self.loc_plot = loc_plot
         self.annotation = annotation
+        self.create_plots = create_plots
         self.judge_call_plots = list()
 
     def select(self):
         """
-        Select this plot group to be displayed. Also adds athlete selection to the
-        judge call plot groups belonging to this group.
+        Select this plot group to be displayed, plotting it if it was not plotted yet.
+        Also adds athlete selection to the judge call plot groups belonging to this group.
         """
+        if self.loc_plot is None:
+            self.loc_plot, self.annotation = self.create_plots()
         self.loc_plot.set_visible(True)
         for call_group in self.judge_call_plots:
             call_group.select(JudgeCallPlotGroup.Selection.ATHLETE)
@@ -48,7 +57,8 @@ class AthletePlotGroup:
         Deselect this plot group and hide it. Also removes athlete selection from the
         judge call plot groups belonging to this group.
         """
-        self.loc_plot.set_visible(False)
+        if self.loc_plot is not None:
+            self.loc_plot.set_visible(False)
         for call_group in self.judge_call_plots:
             call_group.deselect(JudgeCallPlotGroup.Selection.ATHLETE)
 
@@ -59,7 +69,7 @@ class AthletePlotGroup:
         :return: True if any plot in this group is visible, False otherwise
         :rtype: bool
         """
-        return self.loc_plot.get_visible()
+        return self.loc_plot is not None and self.loc_plot.get_visible()
 
     def add_judge_call_plot_group(self, plot_group):
         """
@@ -82,12 +92,15 @@ class AthletePlotGroup:
 
 class JudgeCallPlotGroup:
     """
-    A group of plots for judge calls of a particular judge and call type.
-
-    :param yellow: The yellow judge calls plot
-    :type yellow: matplotlib.collections.PathCollection
-    :param red: The red judge calls plot
-    :type red: matplotlib.collections.PathCollection
+    A group of plots for judge calls of a particular judge and call type. The plots can
+    be left to be made the first time this group becomes visible.
+
+    :param yellow: The yellow judge calls plot, None to make it with create_plots
+    :type yellow: matplotlib.collections.PathCollection | None
+    :param red: The red judge calls plot, None to make it with create_plots
+    :type red: matplotlib.collections.PathCollection | None
+    :param create_plots: Makes the yellow and the red judge calls plots
+    :type create_plots: typing.Callable[[], tuple] | None
     """
 
     class Selection(IntFlag):
@@ -101,23 +114,27 @@ class JudgeCallPlotGroup:
         ATHLETE = 0b100
         ALL = 0b111
 
-    def __init__(self, yellow, red):
+    def __init__(self, yellow=None, red=None, create_plots=None):
         self.yellow = yellow
         self.red = red
+        self.create_plots = create_plots
         self.selected = JudgeCallPlotGroup.Selection.NONE
 
     def select(self, selection):
         """
-        Select this plot group in some way. The plot group will not become visible
-        until this group has been selected by everything.
+        Select this plot group in some way. The plot group will not become visible, or
+        be plotted, until this group has been selected by everything.
 
         :param selection: Which method to select
         :type selection: JudgeCallPlotGroup.Selection
         """
         self.selected = self.selected | selection
         visible = self.selected == JudgeCallPlotGroup.Selection.ALL
-        self.yellow.set_visible(visible)
-        self.red.set_visible(visible)
+        if visible and self.yellow is None:
+            self.yellow, self.red = self.create_plots()
+        if self.yellow is not None:
+            self.yellow.set_visible(visible)
+            self.red.set_visible(visible)
 
     def deselect(self, selection):
         """
@@ -127,8 +144,9 @@ class JudgeCallPlotGroup:
         :type selection: JudgeCallPlotGroup.Selection
         """
         self.selected = self.selected & (~selection)
-        self.yellow.set_visible(False)
-        self.red.set_visible(False)
+        if self.yellow is not None:
+            self.yellow.set_visible(False)
+            self.red.set_visible(False)
 
     def get_visible(self):
         """
@@ -137,15 +155,19 @@ class JudgeCallPlotGroup:
         :return: True if this group is visible, False otherwise
         :rtype: bool
         """
+        if self.yellow is None:
+            return False
         return self.yellow.get_visible() or self.red.get_visible()
 
     def get_plots(self):
         """
-        Get all plots belonging to this group
+        Get all plots belonging to this group, none if it was not plotted yet.
 
         :return: The plots belonging to this group
         :rtype: tuple[matplotlib.collections.PathCollection]
         """
+        if self.yellow is None:
+            return ()
         return self.yellow, self.red
 
 
@@ -175,6 +197,17 @@ class LocGraph:
         self.athlete_plots = dict()
         self.call_type_plots = dict()
         self.judge_plots = dict()
+        self.judge_call_plots = dict()
+
+        # Data and selections so far, to plot data appended later the same way, and to
+        # plot athletes and judge calls once they are displayed
+        self.athletes = dict()
+        self.athlete_colors = dict()
+        self.loc_values = dict()
+        self.call_values = dict()
+        self.judges = dict()
+        self.selected_judges = set()
+        self.shown_call_types = set()
 
     def reset(self):
         """
@@ -185,6 +218,13 @@ class LocGraph:
         self.athlete_plots = dict()
         self.call_type_plots = dict()
         self.judge_plots = dict()
+        self.judge_call_plots = dict()
+        self.athletes = dict()
+        self.athlete_colors = dict()
+        self.loc_values = dict()
+        self.call_values = dict()
+        self.judges = dict()
+        self.selected_judges = set()
 
     def get_figure(self):
         """
@@ -216,9 +256,12 @@ class LocGraph:
         # Set up a list of visible lines to draw the legend from
         visible_lines = [self.max_loc_line]
 
-        for bib in self.athlete_plots:
+        # Go through athletes in race order, whichever order they were plotted in
+        for bib in self.athletes:
+            plot = self.athlete_plots.get(bib)
+            if plot is None:
+                continue
             visible = bib in selected_bibs
-            plot = self.athlete_plots[bib]
             if visible:
                 visible_lines.append(plot)
                 plot.select()
@@ -237,6 +280,10 @@ class LocGraph:
         :param show: Whether the user wants to see this type of judge call or not
         :type show: bool
         """
+        if show:
+            self.shown_call_types.add(call_type)
+        else:
+            self.shown_call_types.discard(call_type)
         if call_type not in self.call_type_plots:
             return
         if show:
@@ -253,6 +300,7 @@ class LocGraph:
         :param selected_judges: List of judge ids to be displayed
         :type selected_judges: list[int]
         """
+        self.selected_judges = set(selected_judges)
         for judge in self.judge_plots:
             if judge in selected_judges:
                 for plot_group in self.judge_plots[judge]:
@@ -261,27 +309,37 @@ class LocGraph:
                 for plot_group in self.judge_plots[judge]:
                     plot_group.deselect(JudgeCallPlotGroup.Selection.JUDGE)
 
-    def plot(self, loc_values, judge_data, athletes, judges):
+    def plot(self, dataset, athletes, judges):
         """
-        Plot the given LOC values as well as judge calls, and make them invisible.
+        Set up this graph for a race, adding its LOC values and judge calls. Athletes and
+        judge calls are only plotted once they are displayed, so what a race costs
+        depends on what is shown. Only athletes in the dataset are added, the others can
+        be added later with add_athletes.
 
-        :param loc_values: The LOC values to graph
-        :type loc_values: dict[int, pandas.DataFrame]
-        :param judge_data: The judge calls to graph
-        :type judge_data: dict[int, dict[int, pandas.DataFrame]]
-        :param athletes: Information for each athlete that is graphed
+        :param dataset: The LOC values and judge calls to graph
+        :type dataset: RaceDataset
+        :param athletes: Information for each athlete of the race
         :type athletes: list[tuple[str, str, int]]
         :param judges: A dictionary of judge ids and names for the judges involved in this race
         :type judges: dict[int, str]
         """
-        # setup colormap to avoid duplicate colors
+        self.judges = judges
+
+        # setup colormap to avoid duplicate colors, athletes keep their color however
+        # late they are plotted
         colors = pyplot.cm.nipy_spectral(np.linspace(0, 1, len(athletes)))
-        self.ax.set_prop_cycle("color", colors)
+        self.athletes = {
+            bib_number: (last_name, first_name)
+            for last_name, first_name, bib_number in athletes
+        }
+        self.athlete_colors = dict(zip(self.athletes, colors))
 
         # Set plot title and axis labels
         self.ax.set_title(f"Walker LOC over Time w/ Max LOC = {self.max_loc} ms")
         self.ax.set_ylabel("Walker LOC (ms)")
         self.ax.set_xlabel("Time")
+        # Times come as matplotlib dates
+        self.ax.xaxis_date()
         self.ax.xaxis.set_major_formatter(mpl_dates.DateFormatter("%H:%M:%S %p"))
 
         # Draw max LOC cutoff line
@@ -289,96 +347,286 @@ class LocGraph:
             self.ax.axhline(y=self.max_loc, color="r", label="Max LOC")
         )
 
-        for index, (last_name, first_name, bib_number) in enumerate(athletes):
-            walker_data = loc_values[bib_number]
-            loc_plot = self.ax.plot(
-                walker_data["Time"],
-                walker_data["LOCAverage"],
-                label=f"{last_name}, {first_name} ({bib_number})",
-                marker="o",
+        self.add_athletes(dataset, [int(bib_number) for bib_number in dataset.bibs])
+
+        # Create a legend for the plot
+        self.ax.legend(handles=[self.max_loc_line.loc_plot])
+
+    def add_athletes(self, dataset, bibs):
+        """
+        Add the LOC values and judge calls of athletes of the race that are not on this
+        graph yet. They are plotted once displayed, and the judge calls follow the
+        current selections.
+
+        :param dataset: The LOC values and judge calls of at least these athletes
+        :type dataset: RaceDataset
+        :param bibs: Bib numbers of the athletes to add
+        :type bibs: list[int]
+        """
+        for bib_number in bibs:
+            if bib_number in self.athlete_plots or bib_number not in self.athletes:
+                continue
+            times, loc_values = dataset.athlete_loc(bib_number)
+            self.loc_values[bib_number] = (times, loc_values)
+            self.update_limits(times, loc_values)
+            self.athlete_plots[bib_number] = AthletePlotGroup(
+                create_plots=partial(self.plot_athlete, bib_number)
+            )
+
+            for judge_id, per_judge_calls in dataset.plotted_calls(bib_number).items():
+                if judge_id not in self.judges:
+                    continue
+                for call_type, (yellow, red) in per_judge_calls.items():
+                    self.add_judge_calls(bib_number, judge_id, call_type, yellow, red)
+
+        self.ax.autoscale_view()
+
+    def update_limits(self, times, loc_values):
+        """
+        Make room on the axes for points that may not be plotted yet, so the axes do
+        not change as athletes and judge calls are displayed.
+
+        :param times: Times of the points, as matplotlib dates
+        :type times: numpy.ndarray
+        :param loc_values: LOC values of the points
+        :type loc_values: numpy.ndarray
+        """
+        if len(times):
+            self.ax.update_datalim(np.column_stack([times, loc_values]))
+
+    def plot_athlete(self, bib_number):
+        """
+        Plot the LOC line of an athlete added to this graph, and the annotation showing
+        their judge calls, both invisible.
+
+        :param bib_number: Bib number of the athlete
+        :type bib_number: int
+        :return: The LOC line and the annotation of the athlete
+        :rtype: tuple[matplotlib.lines.Line2D, matplotlib.text.Annotation]
+        """
+        last_name, first_name = self.athletes[bib_number]
+        times, loc_values = self.loc_values[bib_number]
+        loc_plot = self.ax.plot(
+            times,
+            loc_values,
+            label=f"{last_name}, {first_name} ({bib_number})",
+            color=self.athlete_colors[bib_number],
+            marker="o",
+            visible=False,
+        )[-1]
+
+        annotation = self.ax.annotate(
+            "",
+            xy=(0, 0),
+            ha="left",
+            bbox=dict(boxstyle="round", fc="w"),
+            arrowprops=dict(
+                arrowstyle="->",
+                connectionstyle="angle,angleA=0,angleB=90,rad=10",
+            ),
+            visible=False,
+        )
+        return loc_plot, annotation
+
+    def add_judge_calls(self, bib_number, judge_id, call_type, yellow, red):
+        """
+        Add the yellow and red calls of a judge and call type against an athlete, on the
+        LOC line of the athlete. The calls follow the current selections, and are
+        plotted once they are displayed.
+
+        :param bib_number: Bib number of the athlete
+        :type bib_number: int
+        :param judge_id: ID of the judge
+        :type judge_id: int
+        :param call_type: The type of the calls
+        :type call_type: JudgeCallType
+        :param yellow: Times of the yellow calls, as matplotlib dates, and their LOC
+            values on the LOC line of the athlete
+        :type yellow: tuple[numpy.ndarray, numpy.ndarray]
+        :param red: Times and LOC values of the red calls
+        :type red: tuple[numpy.ndarray, numpy.ndarray]
+        :return: The plot group of the calls
+        :rtype: JudgeCallPlotGroup
+        """
+        key = (bib_number, judge_id, call_type)
+        self.call_values[key] = (yellow, red)
+        self.update_limits(*yellow)
+        self.update_limits(*red)
+
+        plot = JudgeCallPlotGroup(create_plots=partial(self.plot_judge_calls, key))
+        self.call_type_plots.setdefault(call_type, list()).append(plot)
+        self.judge_plots.setdefault(judge_id, list()).append(plot)
+        self.judge_call_plots[key] = plot
+        self.athlete_plots[bib_number].add_judge_call_plot_group(plot)
+
+        selection = JudgeCallPlotGroup.Selection.NONE
+        if self.athlete_plots[bib_number].get_visible():
+            selection |= JudgeCallPlotGroup.Selection.ATHLETE
+        if judge_id in self.selected_judges:
+            selection |= JudgeCallPlotGroup.Selection.JUDGE
+        if call_type in self.shown_call_types:
+            selection |= JudgeCallPlotGroup.Selection.TYPE
+        plot.select(selection)
+        return plot
+
+    def plot_judge_calls(self, key):
+        """
+        Plot the yellow and red calls added to this graph of a judge and call type
+        against an athlete, both invisible.
+
+        :param key: Bib number of the athlete, ID of the judge and type of the calls
+        :type key: tuple[int, int, JudgeCallType]
+        :return: The yellow and the red calls plots
+        :rtype: tuple[matplotlib.collections.PathCollection]
+        """
+        _, judge_id, call_type = key
+        judge_name = self.judges[judge_id]
+        (yellow_times, yellow_loc), (red_times, red_loc) = self.call_values[key]
+        if call_type == JudgeCallType.LOC:
+            yellow_plot = self.ax.scatter(
+                x=yellow_times,
+                y=yellow_loc,
+                label=f"LOC Yellow Card\n - {judge_name}",
+                color="y",
+                marker=r"$\sim$",
+                visible=False,
+            )
+            red_plot = self.ax.scatter(
+                x=red_times,
+                y=red_loc,
+                label=f"LOC Red Card\n - {judge_name}",
+                color="r",
+                marker=r"$\sim$",
                 visible=False,
-            )[-1]
-
-            annotation = self.ax.annotate(
-                "",
-                xy=(0, 0),
-                ha="left",
-                bbox=dict(boxstyle="round", fc="w"),
-                arrowprops=dict(
-                    arrowstyle="->",
-                    connectionstyle="angle,angleA=0,angleB=90,rad=10",
-                ),
+            )
+        elif call_type == JudgeCallType.BENT_KNEE:
+            yellow_plot = self.ax.scatter(
+                x=yellow_times,
+                y=yellow_loc,
+                label=f"Bent Knee Yellow Card\n - {judge_name}",
+                color="y",
+                marker="$>$",
                 visible=False,
             )
+            red_plot = self.ax.scatter(
+                x=red_times,
+                y=red_loc,
+                label=f"Bent Knee Red Card\n - {judge_name}",
+                color="r",
+                marker="$>$",
+                visible=False,
+            )
+        else:
+            raise RuntimeError("Unknown judge call type while plotting.")
+        return yellow_plot, red_plot
 
-            self.athlete_plots[bib_number] = AthletePlotGroup(loc_plot, annotation)
-
-            per_athlete_judge_calls = judge_data[bib_number]
-
-            for judge_id in per_athlete_judge_calls:
-                per_judge_calls = per_athlete_judge_calls[judge_id]
-                judge_name = judges[judge_id]
-                for call_type in per_judge_calls:
-                    yellow_data = per_judge_calls[call_type][0]
-                    red_data = per_judge_calls[call_type][1]
-                    yellow_data["LOCAverage"] = np.interp(
-                        # Converts the datetimes to seconds since epoch, which is how
-                        # matplotlib converts these internally
-                        (yellow_data["Time"].astype("int64") // 10**9).tolist(),
-                        (walker_data["Time"].astype("int64") // 10**9).tolist(),
-                        walker_data["LOCAverage"].tolist(),
-                    )
-                    red_data["LOCAverage"] = np.interp(
-                        # Converts the datetimes to seconds since epoch, which is how
-                        # matplotlib converts these internally
-                        (red_data["Time"].astype("int64") // 10**9).tolist(),
-                        (walker_data["Time"].astype("int64") // 10**9).tolist(),
-                        walker_data["LOCAverage"].tolist(),
-                    )
-                    if call_type == JudgeCallType.LOC:
-                        yellow_plot = self.ax.scatter(
-                            x=yellow_data["Time"],
-                            y=yellow_data["LOCAverage"],
-                            label=f"LOC Yellow Card\n - {judge_name}",
-                            color="y",
-                            marker=r"$\sim$",
-                            visible=False,
-                        )
-                        red_plot = self.ax.scatter(
-                            x=red_data["Time"],
-                            y=red_data["LOCAverage"],
-                            label=f"LOC Red Card\n - {judge_name}",
-                            color="r",
-                            marker=r"$\sim$",
-                            visible=False,
-                        )
-                    elif call_type == JudgeCallType.BENT_KNEE:
-                        yellow_plot = self.ax.scatter(
-                            x=yellow_data["Time"],
-                            y=yellow_data["LOCAverage"],
-                            label=f"Bent Knee Yellow Card\n - {judge_name}",
-                            color="y",
-                            marker="$>$",
-                            visible=False,
-                        )
-                        red_plot = self.ax.scatter(
-                            x=red_data["Time"],
-                            y=red_data["LOCAverage"],
-                            label=f"Bent Knee Red Card\n - {judge_name}",
-                            color="r",
-                            marker="$>$",
-                            visible=False,
+    def can_append(self, dataset):
+        """
+        Check if new data only involves athletes and judges of the race on this graph.
+
+        :param dataset: New LOC values and judge calls
+        :type dataset: RaceDataset
+        :return: True if the data can be appended, False if the race has to be plotted again
+        :rtype: bool
+        """
+        return dataset.plotted_bibs() <= set(
+            self.athletes
+        ) and dataset.plotted_judges() <= set(self.judges)
+
+    def append(self, dataset):
+        """
+        Append new LOC values and judge calls to this graph, extending the plots made so
+        far rather than plotting anything again. Only athletes and judges of the race on
+        this graph can be appended, see can_append. Data of athletes not added yet is
+        left out, it is loaded along with the rest of their data once they are added.
+
+        New LOC values are merged into the LOC lines in time order, as observations can
+        be recorded late. The calls against the athletes they change are then placed on
+        the merged lines again, in one pass for the whole graph.
+
+        :param dataset: New LOC values and judge calls, recorded after the ones added
+        :type dataset: RaceDataset
+        """
+        changed = set()
+        for bib_number in dataset.bibs:
+            bib_number = int(bib_number)
+            if bib_number not in self.athlete_plots:
+                continue
+            new_times, new_loc = dataset.athlete_loc(bib_number)
+            self.update_limits(new_times, new_loc)
+            times, loc_values = self.loc_values[bib_number]
+            # Values of the same time go after the ones added before, as in the database
+            positions = np.searchsorted(times, new_times, side="right")
+            times = np.insert(times, positions, new_times)
+            loc_values = np.insert(loc_values, positions, new_loc)
+            self.loc_values[bib_number] = (times, loc_values)
+            changed.add(bib_number)
+            loc_plot = self.athlete_plots[bib_number].loc_plot
+            if loc_plot is not None:
+                loc_plot.set_data(times, loc_values)
+
+        # Times of the yellow and red calls to place, with the calls added before
+        placed_times = {
+            key: tuple(times for times, _ in calls)
+            for key, calls in self.call_values.items()
+        }
+        call_times = {
+            key: times for key, times in placed_times.items() if key[0] in changed
+        }
+        for bib_number in self.athlete_plots:
+            for judge_id, per_judge_calls in dataset.plotted_calls(bib_number).items():
+                for call_type, calls in per_judge_calls.items():
+                    key = (bib_number, judge_id, call_type)
+                    new_times = tuple(times for times, _ in calls)
+                    added_times = call_times.get(key, placed_times.get(key))
+                    if added_times is not None:
+                        new_times = tuple(
+                            np.concatenate(times)
+                            for times in zip(added_times, new_times)
                         )
-                    else:
-                        raise RuntimeError("Unknown judge call type while plotting.")
+                    call_times[key] = new_times
+        if not call_times:
+            self.ax.autoscale_view()
+            return
 
-                    plot = JudgeCallPlotGroup(yellow_plot, red_plot)
-                    self.call_type_plots.setdefault(call_type, list()).append(plot)
-                    self.judge_plots.setdefault(judge_id, list()).append(plot)
-                    self.athlete_plots[bib_number].add_judge_call_plot_group(plot)
+        # Every call is placed at once, the graph takes the dataset class from the
+        # dataset as race_data imports this module
+        keys = list(call_times)
+        times = [times for key in keys for times in call_times[key]]
+        lengths = [len(key_times) for key_times in times]
+        # Calls against athletes without LOC values yet are left off the graph, as
+        # there is no line to place them on
+        lines = dataset.from_loc_lines(
+            dataset.race_id,
+            {
+                key[0]: self.loc_values[key[0]]
+                for key in keys
+                if len(self.loc_values[key[0]][0])
+            },
+        )
+        loc_values = lines.loc_at(
+            np.repeat([key[0] for key in keys for _ in range(2)], lengths),
+            np.concatenate(times),
+        )
+        loc_values = np.split(loc_values, np.cumsum(lengths)[:-1])
 
-        # Create a legend for the plot
-        self.ax.legend(handles=[self.max_loc_line.loc_plot])
+        for index, key in enumerate(keys):
+            yellow, red = (
+                (times[index * 2 + color], loc_values[index * 2 + color])
+                for color in range(2)
+            )
+            plot = self.judge_call_plots.get(key)
+            if plot is None:
+                self.add_judge_calls(*key, yellow, red)
+                continue
+
+            self.update_limits(*yellow)
+            self.update_limits(*red)
+            self.call_values[key] = (yellow, red)
+            for scatter, values in zip(plot.get_plots(), (yellow, red)):
+                scatter.set_offsets(np.column_stack(values))
+
+        self.ax.autoscale_view()
 
     def redraw_annotation(self, plot_group, pos, text, previous_annotation=None):
         """
@@ -6,17 +6,20 @@ import os
 import matplotlib
 from PyQt6.QtWidgets import QApplication
 
+from endurance import cli
 from endurance.ui.main_window import MainWindow
 
-matplotlib.use("QtAgg")
-
 
 def main():
-    """Entry point for this app.
+    """Entry point for this app. Runs a command line command instead if one is given.
 
     :returns: 0 if the app exited properly, an error code otherwise
     :rtype: int
     """
+    if cli.find_command(sys.argv[1:]) is not None:
+        return cli.main(sys.argv[1:])
+
+    matplotlib.use("QtAgg")
     app = QApplication(sys.argv)
 
     script_dir = os.path.dirname(__file__)
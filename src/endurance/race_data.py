@@ -0,0 +1,648 @@
+import logging
+import threading
+
+from collections import OrderedDict
+
+import matplotlib.dates
+import numpy as np
+
+from endurance.db import COLORS, INFRACTIONS, QueryCache
+from endurance.loc_graph import JudgeCallType
+
+INFRACTION_CALL_TYPES = {"~": JudgeCallType.LOC, "<": JudgeCallType.BENT_KNEE}
+"""Maps the infraction recorded in the database to the type of judge call on the graph"""
+
+TOD_ORIGIN = np.datetime64("1900-01-01", "s")
+"""Date that times of day are placed on, the same one pandas uses when parsing them"""
+
+TOD_ORIGIN_DATE = matplotlib.dates.date2num(TOD_ORIGIN)
+"""TOD_ORIGIN as a matplotlib date"""
+
+SECONDS_PER_DAY = 24 * 60 * 60
+"""Number of seconds in a day, times of day are always below this"""
+
+
+LOAD_STEPS = 3
+"""Number of steps reported to the progress callback of load_race"""
+
+RACE_CACHE_BYTES = 256 * 1024 * 1024
+"""Default max estimated size of the races kept by a RaceCache"""
+
+logger = logging.getLogger(__name__)
+
+
+class LoadCancelled(Exception):
+    """Raised when loading is stopped because its cancellation token was cancelled."""
+
+
+class CancellationToken:
+    """
+    Lets one thread ask another to stop loading. Loading code checks the token between
+    steps, so a cancelled load stops at the next check.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """
+        Ask the load using this token to stop.
+        """
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """
+        Whether the load using this token was asked to stop.
+
+        :rtype: bool
+        """
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """
+        Stop the load using this token if it was asked to stop.
+
+        :raises LoadCancelled: If the token was cancelled
+        """
+        if self.cancelled:
+            raise LoadCancelled()
+
+
+def seconds_to_dates(seconds):
+    """
+    Convert times of day in seconds since midnight to matplotlib dates, which can be
+    plotted without any further conversion.
+
+    :param seconds: Times of day in seconds since midnight
+    :type seconds: numpy.ndarray
+    :return: The times of day as days since the matplotlib epoch
+    :rtype: numpy.ndarray
+    """
+    return TOD_ORIGIN_DATE + seconds / SECONDS_PER_DAY
+
+
+class RaceDataset:
+    """
+    Every LOC value and judge call of a race, held in a few contiguous arrays instead of
+    a data frame per athlete and judge. Observations are ordered by bib and time, and
+    calls by bib, judge and time, so the rows of an athlete, or of a judge against an
+    athlete, are a contiguous slice found through offsets, like the rows of a CSR
+    matrix. Slices are views, nothing is copied when reading them.
+
+    Calls keep -1 for a bib, judge, color, infraction or time that is not known, so
+    reports can count every call while the graph only plots complete ones.
+
+    :param race_id: ID of the race
+    :type race_id: int
+    :param loc: Columns from DB.get_loc_columns_by_race, no observations if None
+    :type loc: dict[str, numpy.ndarray] | None
+    :param calls: Columns from DB.get_judge_call_columns_by_race, no calls if None
+    :type calls: dict[str, numpy.ndarray] | None
+    """
+
+    def __init__(self, race_id, loc=None, calls=None):
+        self.race_id = race_id
+
+        if loc is None:
+            loc = {
+                "BibNumber": np.empty(0, np.int64),
+                "LOCAverage": np.empty(0, np.float32),
+                "TODSeconds": np.empty(0, np.int64),
+            }
+        self.loc_values = loc["LOCAverage"].astype(np.float32, copy=False)
+        self.loc_times = seconds_to_dates(loc["TODSeconds"])
+        self.bibs, self.loc_offsets = RaceDataset._offsets(loc["BibNumber"])
+
+        if calls is None:
+            calls = {
+                name: np.empty(0, dtype)
+                for name, dtype in (
+                    ("BibNumber", np.int64),
+                    ("IDJudge", np.int64),
+                    ("ColorCode", np.int8),
+                    ("InfractionCode", np.int8),
+                    ("TODSeconds", np.int64),
+                )
+            }
+        self.call_bibs = calls["BibNumber"]
+        self.call_judges = calls["IDJudge"]
+        self.call_colors = calls["ColorCode"]
+        self.call_infractions = calls["InfractionCode"]
+        self.call_seconds = calls["TODSeconds"]
+        self.call_times = seconds_to_dates(self.call_seconds)
+
+        # Runs of calls by the same judge against the same athlete, and the runs of
+        # each athlete
+        boundaries = np.flatnonzero(
+            (np.diff(self.call_bibs) != 0) | (np.diff(self.call_judges) != 0)
+        )
+        starts = np.concatenate([[0], boundaries + 1]) if len(self.call_bibs) else []
+        self.group_offsets = np.append(starts, len(self.call_bibs)).astype(np.int64)
+        self.group_judges = self.call_judges[self.group_offsets[:-1]]
+        self.call_bib_values, self.group_bib_offsets = RaceDataset._offsets(
+            self.call_bibs[self.group_offsets[:-1]]
+        )
+
+        # Where each call sits on the LOC line of its athlete, for the whole race at once
+        self.call_loc = self.loc_at(self.call_bibs, self.call_times)
+
+    @classmethod
+    def from_loc_lines(cls, race_id, lines):
+        """
+        Make a dataset holding only LOC lines already in matplotlib dates, such as the
+        lines on a graph, so calls can be placed on them with loc_at.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :param lines: Map of bib number to the times, as matplotlib dates, and the LOC
+            values of the athlete, in time order
+        :type lines: dict[int, tuple[numpy.ndarray, numpy.ndarray]]
+        :return: The dataset, without any calls
+        :rtype: RaceDataset
+        """
+        dataset = cls(race_id)
+        bibs = sorted(lines)
+        if bibs:
+            dataset.bibs = np.array(bibs, np.int64)
+            dataset.loc_offsets = np.append(
+                0, np.cumsum([len(lines[bib][0]) for bib in bibs])
+            ).astype(np.int64)
+            dataset.loc_times = np.concatenate([lines[bib][0] for bib in bibs])
+            dataset.loc_values = np.concatenate([lines[bib][1] for bib in bibs]).astype(
+                np.float32, copy=False
+            )
+        return dataset
+
+    @staticmethod
+    def _offsets(keys):
+        """
+        Find the distinct values of a sorted array and where each of them starts.
+
+        :param keys: Sorted keys
+        :type keys: numpy.ndarray
+        :return: The distinct keys, and offsets where the rows of each key start followed
+            by the number of rows
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        values, starts = np.unique(keys, return_index=True)
+        return values, np.append(starts, len(keys)).astype(np.int64)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays of this dataset, in bytes.
+
+        :rtype: int
+        """
+        return sum(
+            array.nbytes
+            for array in (
+                self.loc_values,
+                self.loc_times,
+                self.bibs,
+                self.loc_offsets,
+                self.call_bibs,
+                self.call_judges,
+                self.call_colors,
+                self.call_infractions,
+                self.call_seconds,
+                self.call_times,
+                self.call_loc,
+                self.group_offsets,
+                self.group_judges,
+                self.call_bib_values,
+                self.group_bib_offsets,
+            )
+        )
+
+    def athlete_loc(self, bib):
+        """
+        Get the LOC values of an athlete, in time order.
+
+        :param bib: Bib number of the athlete
+        :type bib: int
+        :return: Views of the times, as matplotlib dates, and the LOC values
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
+        """
+        index = np.searchsorted(self.bibs, bib)
+        if index == len(self.bibs) or self.bibs[index] != bib:
+            return self.loc_times[:0], self.loc_values[:0]
+        start, end = self.loc_offsets[index], self.loc_offsets[index + 1]
+        return self.loc_times[start:end], self.loc_values[start:end]
+
+    def loc_at(self, bibs, times):
+        """
+        Interpolate the LOC values of athletes at some times, the way numpy.interp does
+        on the LOC line of each athlete, but in one pass over the whole race. Every
+        athlete's times are shifted past the times of the athletes before them, so a
+        single search over all observations finds the observations around each time.
+
+        :param bibs: Bib number of the athlete of each time
+        :type bibs: numpy.ndarray
+        :param times: Times to interpolate at, as matplotlib dates
+        :type times: numpy.ndarray
+        :return: The interpolated LOC values, NaN for athletes without LOC values
+        :rtype: numpy.ndarray
+        """
+        result = np.full(len(times), np.nan)
+        if not len(times) or not len(self.bibs):
+            return result
+
+        # Athletes without LOC values have an empty slice, and nothing to interpolate on
+        athletes = np.minimum(np.searchsorted(self.bibs, bibs), len(self.bibs) - 1)
+        known = (self.bibs[athletes] == bibs) & (
+            self.loc_offsets[athletes + 1] > self.loc_offsets[athletes]
+        )
+        athletes = athletes[known]
+        times = np.asarray(times, np.float64)[known]
+        if not len(times):
+            return result
+
+        origin = min(self.loc_times.min(), times.min())
+        stride = max(self.loc_times.max(), times.max()) - origin + 1
+        loc_athletes = np.repeat(np.arange(len(self.bibs)), np.diff(self.loc_offsets))
+        shifted_loc_times = (self.loc_times - origin) + loc_athletes * stride
+        shifted_times = (times - origin) + athletes * stride
+
+        # The last observation at or before each time, kept within its athlete
+        first = self.loc_offsets[athletes]
+        last = self.loc_offsets[athletes + 1] - 1
+        before = np.searchsorted(shifted_loc_times, shifted_times, side="right") - 1
+        before = np.clip(before, first, last)
+
+        loc_values = self.loc_values.astype(np.float64)
+        values = loc_values[before]
+        between = (times > self.loc_times[before]) & (before < last)
+        left = before[between]
+        slopes = (loc_values[left + 1] - loc_values[left]) / (
+            self.loc_times[left + 1] - self.loc_times[left]
+        )
+        values[between] = (
+            slopes * (times[between] - self.loc_times[left]) + loc_values[left]
+        )
+        result[known] = values
+        return result
+
+    def judge_calls(self, bib):
+        """
+        Get the calls each judge made against an athlete.
+
+        :param bib: Bib number of the athlete
+        :type bib: int
+        :return: Map of judge ID to the slice of the call arrays holding their calls
+        :rtype: dict[int, slice]
+        """
+        index = np.searchsorted(self.call_bib_values, bib)
+        if index == len(self.call_bib_values) or self.call_bib_values[index] != bib:
+            return dict()
+        first, last = self.group_bib_offsets[index], self.group_bib_offsets[index + 1]
+        return {
+            int(self.group_judges[group]): slice(
+                self.group_offsets[group], self.group_offsets[group + 1]
+            )
+            for group in range(first, last)
+        }
+
+    def plotted_calls(self, bib):
+        """
+        Get the complete calls each judge made against an athlete, by call type.
+
+        :param bib: Bib number of the athlete
+        :type bib: int
+        :return: Map of judge ID to a map of call type to the yellow and the red calls,
+            each as their times, as matplotlib dates, and their LOC values on the LOC
+            line of the athlete
+        :rtype: dict[int, dict[JudgeCallType, tuple[tuple[numpy.ndarray, numpy.ndarray]]]]
+        """
+        yellow = COLORS.index("Yellow")
+        plotted = dict()
+        for judge_id, rows in self.judge_calls(bib).items():
+            if judge_id < 0:
+                continue
+            colors = self.call_colors[rows]
+            infractions = self.call_infractions[rows]
+            complete = (colors >= 0) & (self.call_seconds[rows] >= 0)
+            times = self.call_times[rows]
+            loc_values = self.call_loc[rows]
+            for code, infraction in enumerate(INFRACTIONS):
+                of_type = complete & (infractions == code)
+                if not of_type.any():
+                    continue
+                plotted.setdefault(judge_id, dict())[
+                    INFRACTION_CALL_TYPES[infraction]
+                ] = tuple(
+                    (times[of_color], loc_values[of_color])
+                    for of_color in (
+                        of_type & (colors == yellow),
+                        of_type & (colors != yellow),
+                    )
+                )
+        return plotted
+
+    def plotted_bibs(self):
+        """
+        Get the athletes with LOC values or complete calls in this dataset.
+
+        :return: Bib numbers of the athletes
+        :rtype: set[int]
+        """
+        return {int(bib) for bib in self.bibs} | {
+            int(bib)
+            for bib in self.call_bib_values
+            if bib >= 0 and self.plotted_calls(int(bib))
+        }
+
+    def plotted_judges(self):
+        """
+        Get the judges with complete calls in this dataset.
+
+        :return: IDs of the judges
+        :rtype: set[int]
+        """
+        return {
+            judge_id
+            for bib in self.call_bib_values
+            if bib >= 0
+            for judge_id in self.plotted_calls(int(bib))
+        }
+
+
+def load_race_dataset(db, race_id, marks=None, bibs=None):
+    """
+    Load every LOC value and judge call of a race, or of some of its athletes, with one
+    query each.
+
+    :param db: The database to load from
+    :type db: DB
+    :param race_id: The ID of the race to load
+    :type race_id: int
+    :param marks: High water marks to load rows up to, see DB.get_high_water_marks,
+        every row if None
+    :type marks: dict[str, int] | None
+    :param bibs: Bib numbers of the athletes to load, every athlete if None
+    :type bibs: list[int] | None
+    :return: The LOC values and judge calls of the race
+    :rtype: RaceDataset
+    """
+    loc_range = call_range = None
+    if marks is not None:
+        loc_range = (0, marks["VideoObservation"])
+        call_range = (0, marks["JudgeCall"])
+    return RaceDataset(
+        race_id,
+        db.get_loc_columns_by_race(race_id, rowid_range=loc_range, bibs=bibs),
+        db.get_judge_call_columns_by_race(race_id, rowid_range=call_range, bibs=bibs),
+    )
+
+
+def load_race(db, race_id, token=None, progress=None, marks=None, lazy=False):
+    """
+    Load everything needed to plot a race. This can be run from any thread.
+
+    A lazy load only finds out which athletes and judges the race has, and leaves the
+    dataset empty. The LOC values and judge calls of an athlete are then loaded with
+    load_race_dataset once needed.
+
+    :param db: The database to load from
+    :type db: DB
+    :param race_id: The ID of the race to load
+    :type race_id: int
+    :param token: Token checked between steps to stop loading early
+    :type token: CancellationToken | None
+    :param progress: Called with the number of finished steps out of LOAD_STEPS
+    :type progress: typing.Callable[[int], None] | None
+    :param marks: High water marks to load rows up to, see DB.get_high_water_marks,
+        every row if None
+    :type marks: dict[str, int] | None
+    :param lazy: Whether to leave out the LOC values and judge calls
+    :type lazy: bool
+    :raises LoadCancelled: If the token was cancelled before loading finished
+    :return: A tuple containing the dataset of the race, athletes, and judges
+    :rtype: tuple
+    """
+
+    def step(finished):
+        if token is not None:
+            token.raise_if_cancelled()
+        if progress is not None:
+            progress(finished)
+
+    step(0)
+    if lazy:
+        dataset = RaceDataset(race_id)
+        bibs = [row[0] for row in db.get_bibs_by_race(race_id)]
+    else:
+        dataset = load_race_dataset(db, race_id, marks)
+        bibs = dataset.bibs
+    step(1)
+
+    roster = db.get_roster(race_id)
+    step(2)
+
+    # get athlete information
+    athletes = [(*roster.athlete_name(int(bib)), int(bib)) for bib in bibs]
+    judges = roster.judges
+    step(3)
+
+    return dataset, athletes, judges
+
+
+def load_race_update(db, race_id, previous_marks, marks):
+    """
+    Load the LOC values and judge calls of a race added to the database between two
+    sets of high water marks, see DB.get_high_water_marks.
+
+    :param db: The database to load from
+    :type db: DB
+    :param race_id: The ID of the race to load new rows of
+    :type race_id: int
+    :param previous_marks: High water marks of the rows already loaded
+    :type previous_marks: dict[str, int]
+    :param marks: High water marks of the rows to load up to
+    :type marks: dict[str, int]
+    :return: The new LOC values and judge calls
+    :rtype: RaceDataset
+    """
+    return RaceDataset(
+        race_id,
+        db.get_loc_columns_by_race(
+            race_id,
+            rowid_range=(previous_marks["VideoObservation"], marks["VideoObservation"]),
+        ),
+        db.get_judge_call_columns_by_race(
+            race_id, rowid_range=(previous_marks["JudgeCall"], marks["JudgeCall"])
+        ),
+    )
+
+
+class RaceCache:
+    """
+    A least recently used cache of loaded races, ready to plot, bounded by an estimate
+    of the memory they take up. Races are kept per database, and only while the database
+    does not change. This can be used from any thread, and a race loaded by two threads
+    at once is only loaded once.
+
+    :param max_bytes: Max estimated size of all cached races, 0 to disable caching
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes=RACE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._loading = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, db, race_id):
+        """
+        Get a race from the cache, without loading it.
+
+        :param db: The database the race was loaded from
+        :type db: DB
+        :param race_id: The ID of the race
+        :type race_id: int
+        :return: The high water marks the race was loaded up to, and the race as
+            returned by load_race, or None if it is not cached or the database changed
+            since
+        :rtype: tuple[dict[str, int], tuple] | None
+        """
+        key = (db.path, race_id)
+        generation = db.get_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def load(self, db, race_id, token=None, progress=None, lazy=False):
+        """
+        Get a race from the cache, loading it with load_race if it is not cached or the
+        database changed since.
+
+        Races loaded lazily are not cached, and do not wait for another thread loading
+        the same race in full.
+
+        :param db: The database to load from
+        :type db: DB
+        :param race_id: The ID of the race to load
+        :type race_id: int
+        :param token: Token checked between steps to stop loading early
+        :type token: CancellationToken | None
+        :param progress: Called with the number of finished steps out of LOAD_STEPS
+        :type progress: typing.Callable[[int], None] | None
+        :param lazy: Whether to load the race lazily if it is not cached, see load_race
+        :type lazy: bool
+        :raises LoadCancelled: If the token was cancelled before loading finished
+        :return: The high water marks the race was loaded up to, and the race as
+            returned by load_race
+        :rtype: tuple[dict[str, int], tuple]
+        """
+        if lazy:
+            cached = self.get(db, race_id)
+            if cached is not None:
+                if progress is not None:
+                    progress(LOAD_STEPS)
+                return cached
+            marks = db.get_high_water_marks()
+            return marks, load_race(db, race_id, token, progress, marks, lazy=True)
+
+        key = (db.path, race_id)
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # Wait for another thread loading the same race, it is then cached
+        with loading:
+            generation = db.get_generation()
+            cached = self.get(db, race_id)
+            if cached is not None:
+                if progress is not None:
+                    progress(LOAD_STEPS)
+                return cached
+
+            marks = db.get_high_water_marks()
+            data = load_race(db, race_id, token, progress, marks)
+            self.put(key, generation, marks, data)
+        return marks, data
+
+    def put(self, key, generation, marks, data):
+        """
+        Cache a race, evicting the least recently used races until the cache fits in its
+        memory bound. Races that are larger than the bound on their own are not cached.
+
+        :param key: Path of the database and ID of the race
+        :type key: tuple[str, int]
+        :param generation: Generation of the database the race was loaded at
+        :type generation: int
+        :param marks: High water marks the race was loaded up to
+        :type marks: dict[str, int]
+        :param data: The race, as returned by load_race
+        :type data: tuple
+        """
+        size = RaceCache.estimate_size(data)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[3]
+            self._entries[key] = (generation, marks, data, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted[3]
+            logger.info(
+                "Cached race %s, %s races in %s bytes", key, len(self), self.nbytes
+            )
+
+    def clear(self):
+        """
+        Drop every cached race.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Get statistics on how this cache is used.
+
+        :return: A map of statistic name to its value
+        :rtype: dict[str, int]
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @staticmethod
+    def estimate_size(data):
+        """
+        Estimate how much memory a loaded race takes up.
+
+        :param data: The race, as returned by load_race
+        :type data: tuple
+        :return: Estimated size in bytes
+        :rtype: int
+        """
+        dataset, athletes, judges = data
+        return (
+            dataset.nbytes
+            + QueryCache.estimate_size(athletes)
+            + QueryCache.estimate_size(judges)
+        )
@@ -0,0 +1,709 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from endurance.db import COLORS, INFRACTIONS, ConnectionProfile, hash_database
+from endurance.race_data import SECONDS_PER_DAY, RaceDataset
+
+CALL_KINDS = {
+    "Red ~": ("Red", "~"),
+    "Red <": ("Red", "<"),
+    "Yellow ~": ("Yellow", "~"),
+    "Yellow <": ("Yellow", "<"),
+}
+"""Maps the name of a kind of judge call to its (color, infraction)"""
+
+SUMMARY_SUFFIX = ".summaries.db"
+"""Suffix given to the file that stores precomputed reports of a database"""
+
+
+def _plain(value):
+    """
+    Convert a value from a data frame to a plain Python value, with missing values as None.
+
+    :param value: The value to convert
+    :type value: any
+    :return: The converted value
+    :rtype: any
+    """
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _names(codes, names):
+    """
+    Decode values encoded as their position in a list of names.
+
+    :param codes: Positions of the values, -1 for values that are not known
+    :type codes: numpy.ndarray
+    :param names: The names the positions refer to
+    :type names: list[str]
+    :return: The names, None for values that are not known
+    :rtype: numpy.ndarray
+    """
+    return np.array([*names, None], dtype=object)[codes]
+
+
+def _to_rows(frame):
+    """
+    Convert a data frame to rows of plain Python values.
+
+    :param frame: The data frame to convert
+    :type frame: pandas.DataFrame
+    :return: The rows of the data frame
+    :rtype: list[tuple[any]]
+    """
+    return [
+        tuple(_plain(value) for value in row)
+        for row in frame.itertuples(index=False, name=None)
+    ]
+
+
+class ConsensusEngine:
+    """
+    Decides which judge calls agree with the majority of judges. A call agrees with the
+    majority when enough calls of the same color and infraction were made against the
+    same athlete, the call itself included.
+
+    :param quorum: Number of matching calls needed, half of the judges of the race if None
+    :type quorum: int | None
+    :param tolerance: Max number of seconds between matching calls, the whole race if None
+    :type tolerance: float | None
+    """
+
+    def __init__(self, quorum=None, tolerance=None):
+        self.quorum = quorum
+        self.tolerance = tolerance
+        self._support_key = None
+        self._support = None
+
+    @property
+    def is_default(self):
+        """
+        Whether the engine uses the default quorum and tolerance.
+
+        :rtype: bool
+        """
+        return self.quorum is None and self.tolerance is None
+
+    def required_calls(self, judge_count):
+        """
+        Number of matching calls needed to form a majority.
+
+        :param judge_count: Number of judges in the race
+        :type judge_count: int
+        :return: The quorum
+        :rtype: int
+        """
+        return judge_count // 2 if self.quorum is None else self.quorum
+
+    def support(self, calls):
+        """
+        Count the calls matching each call. This only depends on the tolerance, so it is
+        kept for as long as the same calls are passed in and the tolerance is unchanged.
+
+        :param calls: Judge calls with BibNumber, Color, Infraction and TODSeconds
+        :type calls: pandas.DataFrame
+        :return: Number of matching calls for each call
+        :rtype: numpy.ndarray
+        """
+        key = (id(calls), self.tolerance)
+        if key == self._support_key and self._support[0] is calls:
+            return self._support[1]
+
+        groups = (
+            calls.groupby(
+                ["BibNumber", "Color", "Infraction"], dropna=False, sort=False
+            )
+            .ngroup()
+            .to_numpy(dtype="int64")
+        )
+        if self.tolerance is None:
+            support = np.bincount(groups)[groups] if len(groups) else groups
+        else:
+            # Lay the groups out one after another on a single time axis, far enough
+            # apart that windows never reach into the next group, then count the calls
+            # in each window with two binary searches. Calls without a time never match.
+            times = calls["TODSeconds"].to_numpy(dtype="float64")
+            timed = ~np.isnan(times)
+            span = SECONDS_PER_DAY + 2 * self.tolerance + 1
+            positions = groups[timed] * span + times[timed]
+            ordered = np.sort(positions)
+            support = np.zeros(len(calls), dtype="int64")
+            support[timed] = np.searchsorted(
+                ordered, positions + self.tolerance, side="right"
+            ) - np.searchsorted(ordered, positions - self.tolerance, side="left")
+
+        self._support_key = key
+        self._support = (calls, support)
+        return support
+
+    def majority(self, calls, judge_count):
+        """
+        Find the calls that agree with the majority of judges.
+
+        :param calls: Judge calls with BibNumber, Color, Infraction and TODSeconds
+        :type calls: pandas.DataFrame
+        :param judge_count: Number of judges in the race
+        :type judge_count: int
+        :return: Whether each call agrees with the majority
+        :rtype: numpy.ndarray
+        """
+        return self.support(calls) >= self.required_calls(judge_count)
+
+
+class ReportEngine:
+    """
+    Computes the reports shown in the table window. The judge calls of a race are loaded
+    once into memory, together with the judges and athletes involved, and every report is
+    computed from them.
+
+    :param db: The database to compute reports from
+    :type db: DB
+    :param consensus: Decides which calls agree with the majority, defaults if None
+    :type consensus: ConsensusEngine | None
+    """
+
+    def __init__(self, db, consensus=None):
+        self.db = db
+        self.consensus = consensus or ConsensusEngine()
+        self._race_id = None
+        self._columns = None
+        self._roster = None
+        self._calls = None
+
+    def get_calls(self, race_id):
+        """
+        Get the judge calls of a race, with the judges and athletes involved taken from
+        the roster of the race. They are only loaded again when the race or the database
+        changes.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: The judge calls, with one boolean column per kind of call in CALL_KINDS
+        :rtype: pandas.DataFrame
+        """
+        columns = self.db.get_judge_call_columns_by_race(race_id)
+        roster = self.db.get_roster(race_id)
+        # The database hands out the same cached columns until anything changes
+        if (
+            race_id == self._race_id
+            and columns is self._columns
+            and roster is self._roster
+        ):
+            return self._calls
+        dataset = RaceDataset(race_id, calls=columns)
+
+        judges = pd.DataFrame(
+            [judge[:3] for judge in roster.judges],
+            columns=["IDJudge", "JudgeFirstName", "JudgeLastName"],
+        ).drop_duplicates("IDJudge")
+        judges["HasJudge"] = 1
+        athletes = pd.DataFrame(
+            [athlete[:4] for athlete in roster.athlete_rows],
+            columns=["BibNumber", "IDAthlete", "AthleteFirstName", "AthleteLastName"],
+        ).drop_duplicates("BibNumber")
+
+        calls = (
+            pd.DataFrame(
+                {
+                    "IDJudge": dataset.call_judges,
+                    "BibNumber": dataset.call_bibs,
+                    "Color": _names(dataset.call_colors, COLORS),
+                    "Infraction": _names(dataset.call_infractions, INFRACTIONS),
+                    "TODSeconds": np.where(
+                        dataset.call_seconds >= 0, dataset.call_seconds, np.nan
+                    ),
+                },
+                copy=False,
+            )
+            .merge(judges, on="IDJudge", how="left")
+            .merge(athletes, on="BibNumber", how="left")
+        )
+        calls["HasJudge"] = calls["HasJudge"].fillna(0).astype("int64")
+        for kind, (color, infraction) in CALL_KINDS.items():
+            calls[kind] = (calls["Color"] == color) & (
+                calls["Infraction"] == infraction
+            )
+
+        self._race_id = race_id
+        self._columns = columns
+        self._roster = roster
+        self._calls = calls
+        return calls
+
+    def _judge_calls(self, race_id):
+        calls = self.get_calls(race_id)
+        return calls[calls["HasJudge"] == 1]
+
+    def _athlete_calls(self, race_id):
+        calls = self.get_calls(race_id)
+        return calls[calls["IDAthlete"].notna()]
+
+    @staticmethod
+    def _per_judge(calls, columns, headers):
+        summary = (
+            calls.groupby(
+                ["IDJudge", "JudgeFirstName", "JudgeLastName"],
+                dropna=False,
+                sort=False,
+            )[columns]
+            .sum()
+            .reset_index()
+            .sort_values(["JudgeFirstName", "JudgeLastName", "IDJudge"])
+        )
+        return headers, _to_rows(
+            summary[["JudgeFirstName", "JudgeLastName", *columns]].astype(
+                {column: "int64" for column in columns}
+            )
+        )
+
+    @staticmethod
+    def _per_athlete(calls, columns, headers):
+        summary = (
+            calls.groupby(
+                ["IDAthlete", "BibNumber", "AthleteFirstName", "AthleteLastName"],
+                dropna=False,
+                sort=False,
+            )[columns]
+            .sum()
+            .reset_index()
+            .sort_values(["BibNumber", "IDAthlete"])
+        )
+        return headers, _to_rows(
+            summary[
+                ["BibNumber", "AthleteFirstName", "AthleteLastName", *columns]
+            ].astype({column: "int64" for column in columns})
+        )
+
+    def judge_infraction_summary(self, race_id):
+        """
+        Number of each kind of call made by each judge.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        columns = ["Red ~", "Red <", "Yellow ~", "Yellow <"]
+        return ReportEngine._per_judge(
+            self._judge_calls(race_id),
+            columns,
+            ["Judge First Name", "Judge Last Name", *columns],
+        )
+
+    def athlete_infraction_summary(self, race_id):
+        """
+        Number of each kind of call made against each athlete.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        columns = ["Yellow ~", "Yellow <", "Red ~", "Red <"]
+        return ReportEngine._per_athlete(
+            self._athlete_calls(race_id),
+            columns,
+            ["Bib Number", "Athlete First Name", "Athlete First Name", *columns],
+        )
+
+    def athlete_judge_infraction_summary(self, race_id):
+        """
+        Kinds of calls each judge made against each athlete.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        calls = self._athlete_calls(race_id)
+        calls = calls[calls["HasJudge"] == 1]
+        columns = ["Yellow ~", "Red ~", "Yellow <", "Red <"]
+        summary = (
+            calls.groupby(
+                [
+                    "IDAthlete",
+                    "BibNumber",
+                    "AthleteFirstName",
+                    "AthleteLastName",
+                    "IDJudge",
+                    "JudgeFirstName",
+                    "JudgeLastName",
+                ],
+                dropna=False,
+                sort=False,
+            )[columns]
+            .any()
+            .reset_index()
+            .sort_values(["BibNumber", "JudgeFirstName", "JudgeLastName", "IDJudge"])
+        )
+        for column in columns:
+            summary[column] = summary[column].map({True: "x", False: None})
+
+        return [
+            "Bib Number",
+            "Athlete First Name",
+            "Athlete Last Name",
+            "Judge First Name",
+            "Judge Last Name",
+            *columns,
+        ], _to_rows(
+            summary[
+                [
+                    "BibNumber",
+                    "AthleteFirstName",
+                    "AthleteLastName",
+                    "JudgeFirstName",
+                    "JudgeLastName",
+                    *columns,
+                ]
+            ]
+        )
+
+    def red_without_yellow_summary(self, race_id):
+        """
+        Number of red cards each judge gave without giving the athlete a yellow paddle for
+        the same infraction earlier.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        calls = self._judge_calls(race_id).copy()
+        keys = ["IDJudge", "BibNumber", "Infraction"]
+        # A red card was preceded by a yellow paddle if the first matching paddle came before it
+        first_yellow = (
+            calls[calls["Color"] == "Yellow"]
+            .groupby(keys, dropna=False)["TODSeconds"]
+            .min()
+            .rename("FirstYellow")
+        )
+        calls = calls.join(first_yellow, on=keys)
+        without_yellow = (calls["Color"] == "Red") & ~(
+            calls["FirstYellow"] < calls["TODSeconds"]
+        )
+        columns = ["# of ~ Red cards without Yellow", "# of < Red cards without Yellow"]
+        calls[columns[0]] = without_yellow & (calls["Infraction"] == "~")
+        calls[columns[1]] = without_yellow & (calls["Infraction"] == "<")
+
+        return ReportEngine._per_judge(
+            calls, columns, ["Judge First Name", "Judge Last Name", *columns]
+        )
+
+    def yellow_without_red_summary(self, race_id):
+        """
+        Number of yellow paddles each judge gave without giving the athlete a red card for
+        the same infraction later.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        calls = self._judge_calls(race_id).copy()
+        keys = ["IDJudge", "BibNumber", "Infraction"]
+        # A yellow paddle was followed by a red card if the last matching card came after it
+        last_red = (
+            calls[calls["Color"] == "Red"]
+            .groupby(keys, dropna=False)["TODSeconds"]
+            .max()
+            .rename("LastRed")
+        )
+        calls = calls.join(last_red, on=keys)
+        without_red = (calls["Color"] == "Yellow") & ~(
+            calls["TODSeconds"] < calls["LastRed"]
+        )
+        columns = [
+            "# of ~ Yellow not followed by a Red",
+            "# of < Yellow not followed by a Red",
+        ]
+        calls[columns[0]] = without_red & (calls["Infraction"] == "~")
+        calls[columns[1]] = without_red & (calls["Infraction"] == "<")
+
+        return ReportEngine._per_judge(
+            calls, columns, ["Judge First Name", "Judge Last Name", *columns]
+        )
+
+    def per_athlete_calls_summary(self, race_id):
+        """
+        Number of yellow paddles and red cards given to each athlete.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        calls = self._athlete_calls(race_id).copy()
+        columns = ["# of Yellow Paddles", "# of Red Cards"]
+        calls[columns[0]] = calls["Color"] == "Yellow"
+        calls[columns[1]] = calls["Color"] == "Red"
+
+        return ReportEngine._per_athlete(
+            calls,
+            columns,
+            ["Bib Number", "Athlete First Name", "Athlete Last Name", *columns],
+        )
+
+    def judge_consistency_report(self, race_id):
+        """
+        Number of each kind of call each judge made that matched the majority of judges,
+        as decided by the consensus engine.
+
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        calls = self.get_calls(race_id)
+        majority = calls[
+            self.consensus.majority(calls, self.db.get_race_judge_count(race_id))
+        ]
+
+        columns = [
+            "Majority Matched Red ~",
+            "Majority Matched Red <",
+            "Majority Matched Yellow ~",
+            "Majority Matched Yellow <",
+        ]
+        majority = majority.rename(
+            columns={kind: f"Majority Matched {kind}" for kind in CALL_KINDS}
+        )
+        summary = (
+            majority.groupby(
+                ["IDJudge", "JudgeFirstName", "JudgeLastName"],
+                dropna=False,
+                sort=False,
+            )[columns]
+            .sum()
+            .reset_index()
+            .sort_values(
+                ["JudgeLastName", "JudgeFirstName", "IDJudge"], na_position="first"
+            )
+        )
+
+        return ["Judge First Name", "Judge Last Name", *columns], _to_rows(
+            summary[["JudgeFirstName", "JudgeLastName", *columns]].astype(
+                {column: "int64" for column in columns}
+            )
+        )
+
+
+REPORTS = {
+    "Judge Infraction Summary": ReportEngine.judge_infraction_summary,
+    "Athlete Infraction Summary": ReportEngine.athlete_infraction_summary,
+    "Athlete Judge Infraction Summary": ReportEngine.athlete_judge_infraction_summary,
+    "Red Cards Without Yellow Summary": ReportEngine.red_without_yellow_summary,
+    "Yellow Cards Without Red Summary": ReportEngine.yellow_without_red_summary,
+    "Per Athlete Calls Summary": ReportEngine.per_athlete_calls_summary,
+    "Judge Consistency Report": ReportEngine.judge_consistency_report,
+}
+"""Every report shown in the table window, by name"""
+
+CONSENSUS_REPORTS = ("Judge Consistency Report",)
+"""Names of the reports that depend on the settings of the consensus engine"""
+
+
+def summary_store_path(db_path):
+    """
+    Get the path of the file that stores precomputed reports of a database.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :return: Path to the summary store
+    :rtype: str
+    """
+    root, _ = os.path.splitext(db_path)
+    return root + SUMMARY_SUFFIX
+
+
+def find_summary_store(db_path):
+    """
+    Find the summary store of a database, as long as it was built from the current
+    contents of the database file. The file is only hashed when its size or modification
+    time differ from when the store was built.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :return: Path to the summary store, None if there is no up to date store
+    :rtype: str | None
+    """
+    store_path = summary_store_path(db_path)
+    if not os.path.isfile(store_path):
+        return None
+
+    try:
+        connection = ConnectionProfile(mmap_size=0).connect(store_path)
+        try:
+            size, modified_time, content_hash = connection.execute(
+                "SELECT Size, ModifiedTime, Hash FROM EnduranceSource"
+            ).fetchone()
+        finally:
+            connection.close()
+    except (sqlite3.Error, TypeError):
+        return None
+
+    source_stat = os.stat(db_path)
+    if (size, modified_time) == (source_stat.st_size, source_stat.st_mtime_ns):
+        return store_path
+    if size != source_stat.st_size or content_hash != hash_database(db_path):
+        return None
+
+    # The file was only touched, so the store takes its new modification time and the
+    # file is not hashed again until it changes. A store that can not be written to is
+    # still up to date, it is only checked by hash every time.
+    try:
+        store = sqlite3.connect(store_path, timeout=1)
+        try:
+            with store:
+                store.execute(
+                    "UPDATE EnduranceSource SET Size = ?, ModifiedTime = ?",
+                    (source_stat.st_size, source_stat.st_mtime_ns),
+                )
+        finally:
+            store.close()
+    except sqlite3.Error:
+        pass
+    return store_path
+
+
+def build_summary_store(db, output_path=None):
+    """
+    Compute every report in REPORTS for every race of a database and store them next to
+    the original database file, keyed by a hash of its contents. Reports that can not be
+    computed for a database are left out, and computed on demand instead. A store next
+    to the database that is still up to date is kept as it is.
+
+    :param db: The database to compute reports from
+    :type db: DB
+    :param output_path: Where to write the store, next to the original database if None
+    :type output_path: str | None
+    :return: Path to the summary store
+    :rtype: str
+    """
+    if output_path is None:
+        existing_path = find_summary_store(db.source_path)
+        if existing_path is not None:
+            return existing_path
+        output_path = summary_store_path(db.source_path)
+    temp_path = output_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    source_stat = os.stat(db.source_path)
+    content_hash = hash_database(db.source_path)
+    engine = ReportEngine(db)
+
+    store = sqlite3.connect(temp_path)
+    try:
+        with store:
+            store.execute(
+                "CREATE TABLE EnduranceSource "
+                "(Path TEXT, Size INTEGER, ModifiedTime INTEGER, Hash TEXT)"
+            )
+            store.execute(
+                "INSERT INTO EnduranceSource VALUES (?, ?, ?, ?)",
+                (
+                    os.path.abspath(db.source_path),
+                    source_stat.st_size,
+                    source_stat.st_mtime_ns,
+                    content_hash,
+                ),
+            )
+            store.execute(
+                "CREATE TABLE Summary (Report TEXT, IDRace INTEGER, Headers TEXT, "
+                "Rows TEXT, PRIMARY KEY (Report, IDRace)) WITHOUT ROWID"
+            )
+            for race in db.get_races():
+                for name, report in REPORTS.items():
+                    try:
+                        headers, rows = report(engine, race[0])
+                    except sqlite3.Error:
+                        continue
+                    store.execute(
+                        "INSERT INTO Summary VALUES (?, ?, ?, ?)",
+                        (name, race[0], json.dumps(headers), json.dumps(rows)),
+                    )
+    finally:
+        store.close()
+
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+class SummaryStore:
+    """
+    Read only access to the precomputed reports of a database. Reports stop being served
+    once the original database file changes.
+
+    :param db_path: Path to the original database file
+    :type db_path: str
+    :param store_path: Path to an up to date summary store of the database
+    :type store_path: str
+    """
+
+    def __init__(self, db_path, store_path):
+        self.source_path = db_path
+        self.path = store_path
+        self._source_stat = SummaryStore._stat(db_path)
+        self._connection = ConnectionProfile(mmap_size=0).connect(store_path)
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def open(db_path):
+        """
+        Open the summary store of a database if there is an up to date one.
+
+        :param db_path: Path to the original database file
+        :type db_path: str
+        :return: The summary store, None if there is no up to date store
+        :rtype: SummaryStore | None
+        """
+        store_path = find_summary_store(db_path)
+        if store_path is None:
+            return None
+        return SummaryStore(db_path, store_path)
+
+    def get(self, report, race_id):
+        """
+        Get a precomputed report.
+
+        :param report: Name of the report in REPORTS
+        :type report: str
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report, None if it was not precomputed or the
+            database changed since
+        :rtype: tuple[list[str], list[tuple[any]]] | None
+        """
+        if self._connection is None or (
+            SummaryStore._stat(self.source_path) != self._source_stat
+        ):
+            return None
+
+        summary = self._connection.execute(
+            "SELECT Headers, Rows FROM Summary WHERE Report = ? AND IDRace = ?",
+            (report, race_id),
+        ).fetchone()
+        if summary is None:
+            return None
+
+        headers, rows = summary
+        return json.loads(headers), [tuple(row) for row in json.loads(rows)]
+
+    def close(self):
+        """
+        Close the summary store.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
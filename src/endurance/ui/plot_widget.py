@@ -1,16 +1,29 @@
+import sqlite3
+
 import matplotlib.backends.backend_qt5agg as mlp_backend
-import pandas as pd
 
-from PyQt6 import QtWidgets
+from PyQt6 import QtWidgets, QtCore
 from PyQt6.QtGui import QIntValidator
 from PyQt6.QtWidgets import QFileDialog
 
-from endurance.loc_graph import LocGraph, JudgeCallType
+from endurance.loc_graph import LocGraph
+from endurance.race_data import (
+    CancellationToken,
+    LOAD_STEPS,
+    RaceCache,
+    load_race_dataset,
+    load_race_update,
+)
+from endurance.reports import build_summary_store
 from endurance.ui.double_list import DoubleListWidget
 from endurance.ui.graph_window import GraphWindow
+from endurance.ui.race_loader import RaceLoader, RacePrefetcher
 from endurance.ui.table_window import TableWindow
 
-from endurance.db import DB
+from endurance.db import DB, optimize_database
+
+LIVE_REFRESH_MS = 2000
+"""Time between checks for new rows in live mode, in milliseconds"""
 
 
 class PlotWidget(QtWidgets.QWidget):
@@ -25,11 +38,36 @@ class PlotWidget(QtWidgets.QWidget):
     def __init__(self, db):
         super().__init__()
 
+        self.db = None
         self.graph_window = None
         self.table_window = None
 
         self.toolbar = None
 
+        # Races are loaded one at a time on a worker thread, only the latest load counts
+        self.thread_pool = QtCore.QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.load_token = None
+        self.race_loader = None
+
+        # Loaded races are kept, and the races next to the selected one are loaded
+        # ahead of time on a separate thread
+        self.race_cache = RaceCache()
+        self.prefetch_pool = QtCore.QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(1)
+        self.prefetch_token = None
+
+        # In live mode new rows are picked up past the high water marks of the race
+        self.live_timer = QtCore.QTimer(self)
+        self.live_timer.timeout.connect(lambda: self.poll_live_data())
+        self.live_marks = None
+        self.live_race_id = None
+
+        self.load_progress_bar = QtWidgets.QProgressBar(self)
+        self.load_progress_bar.setRange(0, LOAD_STEPS)
+        self.load_progress_bar.setFormat("Loading race...")
+        self.load_progress_bar.hide()
+
         # Initialize the menu bar for the application
         menu_bar = self.create_menu_bar()
 
@@ -63,9 +101,7 @@ class PlotWidget(QtWidgets.QWidget):
             "Walkers"
         )
         # Connect our redraw function to the selector
-        self.walker_list.item_moved.connect(
-            lambda: self.canvas.redraw_plot(self.walker_list.get_selected_items())
-        )
+        self.walker_list.item_moved.connect(lambda: self.show_selected_walkers())
 
         judge_list_layout, self.judge_list = PlotWidget.make_double_list_layout(
             "Judges", lambda item: item[0]
@@ -93,6 +129,7 @@ class PlotWidget(QtWidgets.QWidget):
         layout.setMenuBar(menu_bar)
         layout.addWidget(self.race_label)
         layout.addWidget(self.race_combo_box)
+        layout.addWidget(self.load_progress_bar)
         layout.addWidget(self.max_loc_label)
         layout.addWidget(self.max_loc_text_box)
         layout.addLayout(selector_layout)
@@ -112,6 +149,21 @@ class PlotWidget(QtWidgets.QWidget):
         if not db:
             return
 
+        # Release the connections to the database we are switching away from, once
+        # nothing uses it anymore
+        if self.db is not None and self.db is not db:
+            if self.table_window is not None:
+                if self.table_window.isVisible():
+                    self.table_window.set_db(db)
+                else:
+                    self.table_window = None
+            self.cancel_race_load()
+            self.cancel_prefetch()
+            self.race_cache.clear()
+            self.db.close()
+            # Keep recording to the same profiler
+            if self.db.profiler is not None:
+                db.enable_profiling(self.db.profiler)
         self.db = db
         races = db.get_races()
 
@@ -155,6 +207,11 @@ class PlotWidget(QtWidgets.QWidget):
             self.graph_window.close_window()
         if self.table_window is not None:
             self.table_window.close_window()
+        self.live_timer.stop()
+        self.cancel_race_load()
+        self.cancel_prefetch()
+        if self.db is not None:
+            self.db.close()
         self.window().close()
 
     def create_menu_bar(self):
@@ -174,6 +231,33 @@ class PlotWidget(QtWidgets.QWidget):
         open_db.triggered.connect(lambda: self.set_db(PlotWidget.db_file_dialog(self)))
         open_db.setShortcut("Ctrl+O")
 
+        # Action to create an optimized working copy of the database.
+        self.optimize_action = file_menu.addAction("Optimize database")
+        self.optimize_action.triggered.connect(lambda: self.optimize_db())
+
+        # Action to precompute every report into a summary store next to the database.
+        precompute_reports = file_menu.addAction("Precompute reports")
+        precompute_reports.triggered.connect(lambda: self.precompute_reports())
+
+        # Action to record how long each query takes.
+        self.profile_action = file_menu.addAction("Profile queries")
+        self.profile_action.setCheckable(True)
+        self.profile_action.toggled.connect(lambda checked: self.set_profiling(checked))
+
+        # Action to keep picking up rows added to the database while a race is underway.
+        self.live_action = file_menu.addAction("Live mode")
+        self.live_action.setCheckable(True)
+        self.live_action.toggled.connect(lambda checked: self.set_live_mode(checked))
+
+        # Action to only load the data of walkers once they are selected.
+        self.lazy_action = file_menu.addAction("Load walkers on demand")
+        self.lazy_action.setCheckable(True)
+        self.lazy_action.toggled.connect(lambda: self.reload_race())
+
+        # Action to show how long each query took.
+        show_profile = file_menu.addAction("Show query profile")
+        show_profile.triggered.connect(lambda: self.show_query_profile())
+
         # Action to exit the application.
         exit_action = file_menu.addAction("Exit")
         exit_action.triggered.connect(lambda: self.close_application())
@@ -181,6 +265,157 @@ class PlotWidget(QtWidgets.QWidget):
 
         return menu_bar
 
+    def optimize_db(self):
+        """
+        Create an optimized working copy of the current database and switch to it. The
+        original database file is left untouched.
+        """
+        if self.db.optimized:
+            QtWidgets.QMessageBox.information(
+                self,
+                "Optimize database",
+                "This database is already optimized.",
+            )
+            return
+
+        # The copy is a snapshot, so live mode would stop seeing new rows on it
+        if self.live_action.isChecked():
+            QtWidgets.QMessageBox.information(
+                self,
+                "Optimize database",
+                "Live mode reads the database as rows are added, turn it off before "
+                "optimizing the database.",
+            )
+            return
+
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.CursorShape.WaitCursor)
+        try:
+            optimize_database(self.db.source_path)
+        except (OSError, sqlite3.Error) as error:
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Error when optimizing database",
+                "We could not create an optimized copy of this database, please make "
+                "sure that you have access to the folder it is in.\n\n"
+                f"{error}",
+            )
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+        self.set_db(DB(self.db.source_path))
+
+    def set_profiling(self, enabled):
+        """
+        Start or stop recording the queries run on the current database. The recorded
+        queries are reported when the application exits.
+
+        :param enabled: Whether to record queries
+        :type enabled: bool
+        """
+        if enabled:
+            self.db.enable_profiling()
+        else:
+            self.db.disable_profiling()
+
+    def set_live_mode(self, enabled):
+        """
+        Start or stop checking the database for new rows every LIVE_REFRESH_MS. New
+        LOC values and judge calls of the current race are added to the graph as they
+        come in, and the table is refreshed.
+
+        :param enabled: Whether to check for new rows
+        :type enabled: bool
+        """
+        # An optimized copy does not see rows added to the original database, so none
+        # is made or used while live
+        self.optimize_action.setEnabled(not enabled)
+        if not enabled:
+            self.live_timer.stop()
+            return
+
+        if self.db.path != self.db.source_path:
+            self.set_db(DB(self.db.source_path, prefer_optimized=False))
+        self.live_timer.start(LIVE_REFRESH_MS)
+
+    def reload_race(self):
+        """
+        Load the current race again, if there is one.
+        """
+        if self.race_combo_box.count():
+            self.init_interface_for_race()
+
+    def poll_live_data(self):
+        """
+        Add the rows that were added to the database since the current race was loaded
+        or last polled. The race is loaded again if new athletes or judges show up.
+        """
+        # The rows of a race still loading are picked up once it is loaded
+        if self.load_token is not None or self.live_marks is None:
+            return
+
+        marks = self.db.get_high_water_marks()
+        if marks == self.live_marks:
+            return
+
+        dataset = load_race_update(self.db, self.live_race_id, self.live_marks, marks)
+        self.live_marks = marks
+        if not len(dataset.loc_times) and not len(dataset.call_times):
+            return
+
+        if not self.graph.can_append(dataset):
+            self.init_interface_for_race()
+            return
+
+        self.canvas.append_race_data(dataset)
+        if self.table_window is not None and self.table_window.isVisible():
+            self.table_window.update_table()
+
+    def show_query_profile(self):
+        """
+        Show how long the recorded queries took, and which of them are missing indexes.
+        """
+        if self.db.profiler is None:
+            QtWidgets.QMessageBox.information(
+                self,
+                "Query profile",
+                "No queries were recorded, turn on File > Profile queries first.",
+            )
+            return
+
+        self.db.profiler.dump()
+        message = QtWidgets.QMessageBox(self)
+        message.setWindowTitle("Query profile")
+        message.setText(
+            "Time spent on queries, by the method that ran them. Steps that scan a "
+            "whole table or build a temporary B-tree are listed under each method."
+        )
+        message.setDetailedText(self.db.profiler.report())
+        message.exec()
+
+    def precompute_reports(self):
+        """
+        Compute every report for every race of the current database and store them next
+        to the original database file, so the table window only has to look them up.
+        """
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.CursorShape.WaitCursor)
+        try:
+            build_summary_store(self.db)
+        except (OSError, sqlite3.Error) as error:
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Error when precomputing reports",
+                "We could not store the precomputed reports of this database, please "
+                "make sure that you have access to the folder it is in.\n\n"
+                f"{error}",
+            )
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+
+        if self.table_window is not None:
+            self.table_window.open_summary_store()
+
     @staticmethod
     def make_double_list_layout(label_text, comparison=None):
         """
@@ -222,44 +457,163 @@ class PlotWidget(QtWidgets.QWidget):
 
         :param race_id: The ID of the race to initialize data for
         :type race_id: int
-        :return: A tuple containing location values, judge data, and athletes
+        :return: A tuple containing the dataset of the race, athletes, and judges
         :rtype: tuple
         """
-        # Get LOC values to plot
-        bibs = [bib[0] for bib in self.db.get_bibs_by_race(race_id)]
-        loc_values = dict()
-        for bib in bibs:
-            loc = self.db.get_loc_by_race_and_bib(race_id, bib)
-            loc_values[bib] = pd.DataFrame(data=loc, columns=["LOCAverage", "Time"])
-            loc_values[bib]["Time"] = pd.to_datetime(
-                loc_values[bib]["Time"], format="%H:%M:%S %p"
-            )
-            # can't sort with sql query because TOD is text for some reason
-            loc_values[bib].sort_values("Time", inplace=True, ignore_index=True)
-
-        # get athlete information
-        athletes = []
-        for bib in bibs:
-            athlete = self.db.get_athlete_by_race_and_bib(race_id, bib)
-            athletes.append((athlete[2], athlete[1], bib))
-
-        judges = self.db.get_judge_by_race(race_id)
-
-        judge_data = self.fetch_judge_data(judges, bibs, race_id)
-
-        return loc_values, judge_data, athletes, judges
+        return self.race_cache.load(self.db, race_id)[1]
 
     def init_interface_for_race(self):
         """
-        Plots the data based on the current race selected.
+        Starts loading the data of the current race selected on a worker thread, dropping
+        any load of a race selected before. The race is plotted once loaded.
         """
         selected_race = self.get_selected_race_id()
         if self.table_window is not None:
             self.table_window.set_selected_race(selected_race)
-        loc_values, judge_data, athletes, judges = self.init_data_for_race(
-            selected_race
+
+        self.cancel_race_load(wait=False)
+        self.load_token = CancellationToken()
+        self.live_marks = None
+        self.race_loader = RaceLoader(
+            self.db,
+            selected_race,
+            self.load_token,
+            self.race_cache,
+            self.lazy_action.isChecked(),
+        )
+        self.race_loader.signals.progress.connect(self.on_race_load_progress)
+        self.race_loader.signals.loaded.connect(self.on_race_loaded)
+        self.race_loader.signals.failed.connect(self.on_race_load_failed)
+
+        self.load_progress_bar.setValue(0)
+        self.load_progress_bar.show()
+        self.thread_pool.start(self.race_loader)
+
+    def cancel_race_load(self, wait=True):
+        """
+        Cancel loading the current race, if it is still loading.
+
+        :param wait: Whether to wait for the worker thread to stop using the database
+        :type wait: bool
+        """
+        if self.load_token is not None:
+            self.load_token.cancel()
+            self.load_token = None
+        self.load_progress_bar.hide()
+        if wait:
+            self.thread_pool.waitForDone()
+
+    def show_selected_walkers(self):
+        """
+        Show the walkers selected in the walker list, plotting the walkers that were not
+        loaded yet. Their data is taken from the current race if it was loaded in full
+        since, and is loaded from the database otherwise.
+        """
+        selected_bibs = self.walker_list.get_selected_items()
+        missing_bibs = [
+            bib for bib in selected_bibs if bib not in self.graph.athlete_plots
+        ]
+        if missing_bibs and self.live_marks is not None:
+            cached = self.race_cache.get(self.db, self.live_race_id)
+            if cached is not None and cached[0] == self.live_marks:
+                dataset = cached[1][0]
+            else:
+                dataset = load_race_dataset(
+                    self.db, self.live_race_id, self.live_marks, missing_bibs
+                )
+            self.canvas.add_athletes(dataset, missing_bibs)
+
+        self.canvas.redraw_plot(selected_bibs)
+
+    def prefetch_races(self):
+        """
+        Load the races next to the selected race in the background, dropping any races
+        still being prefetched for a race selected before. When walkers are loaded on
+        demand, the rest of the selected race is loaded first.
+        """
+        self.cancel_prefetch(wait=False)
+        index = self.race_combo_box.currentIndex()
+        race_ids = [
+            self.race_combo_box.itemData(neighbour)
+            for neighbour in (index + 1, index - 1)
+            if 0 <= neighbour < self.race_combo_box.count()
+        ]
+        if self.lazy_action.isChecked() and self.live_race_id is not None:
+            race_ids.insert(0, self.live_race_id)
+        if not race_ids:
+            return
+
+        self.prefetch_token = CancellationToken()
+        self.prefetch_pool.start(
+            RacePrefetcher(self.db, race_ids, self.prefetch_token, self.race_cache)
+        )
+
+    def cancel_prefetch(self, wait=True):
+        """
+        Stop loading races in the background.
+
+        :param wait: Whether to wait for the prefetch thread to stop using the database
+        :type wait: bool
+        """
+        if self.prefetch_token is not None:
+            self.prefetch_token.cancel()
+            self.prefetch_token = None
+        if wait:
+            self.prefetch_pool.waitForDone()
+
+    def on_race_load_progress(self, token, finished):
+        """
+        Show how far loading the current race is.
+
+        :param token: Token of the load reporting progress
+        :type token: CancellationToken
+        :param finished: Number of finished steps
+        :type finished: int
+        """
+        if token is self.load_token:
+            self.load_progress_bar.setValue(finished)
+
+    def on_race_load_failed(self, token, error):
+        """
+        Report that loading the current race failed.
+
+        :param token: Token of the load that failed
+        :type token: CancellationToken
+        :param error: Description of the error
+        :type error: str
+        """
+        if token is not self.load_token:
+            return
+        self.load_token = None
+        self.live_marks = None
+        self.load_progress_bar.hide()
+        QtWidgets.QMessageBox.critical(
+            self,
+            "Error when loading race",
+            f"We could not load the selected race from the database.\n\n{error}",
         )
 
+    def on_race_loaded(self, token, race_id, data, marks):
+        """
+        Plots the data of a race once loaded, unless another race was selected since.
+
+        :param token: Token of the finished load
+        :type token: CancellationToken
+        :param race_id: ID of the loaded race
+        :type race_id: int
+        :param data: Dataset, athletes, and judges of the race
+        :type data: tuple
+        :param marks: High water marks the race was loaded up to
+        :type marks: dict[str, int]
+        """
+        if token is not self.load_token:
+            return
+        self.load_token = None
+        self.live_marks = marks
+        self.live_race_id = race_id
+        self.load_progress_bar.hide()
+        dataset, athletes, judges = data
+
         # Clear old values
         self.walker_list.clear_items()
 
@@ -275,76 +629,11 @@ class PlotWidget(QtWidgets.QWidget):
         judge_dict = dict(zip(item_ids, items))
         self.judge_list.add_items(items, item_ids)
 
-        self.canvas.plot_new_race(loc_values, judge_data, athletes, judge_dict)
+        self.canvas.plot_new_race(dataset, athletes, judge_dict)
         if self.graph_window is not None:
             self.graph_window.apply_judge_call_selection()
 
-    def fetch_judge_data(self, judges, bibs, race_id):
-        """
-        Fetch judge call data from the database, placing them into various buckets based on the involved bib and judge,
-        as well as their call type. Also performs time conversion.
-
-        :param judges: Judge information for all judges in this race
-        :type judges: list[tuple]
-        :param bibs: All athlete bibs in this race
-        :type bibs: list[int]
-        :param race_id: ID of this race
-        :type race_id: int
-        :returns: A map of judge calls where each judge call is categorized first by bib number, then by judge, finally by their type.
-        :rtype: dict
-        """
-        categorized_judge_calls = dict()
-        for bib in bibs:
-            calls_for_this_athlete = dict()
-            for judge in judges:
-                judge_id = judge[0]
-                calls_for_this_judge = dict()
-                yellow_loc = pd.DataFrame(
-                    data=self.db.get_judge_call_filtered(
-                        bib, race_id, judge_id, "Yellow", "~"
-                    ),
-                    columns=["Time"],
-                )
-                red_loc = pd.DataFrame(
-                    data=self.db.get_judge_call_filtered(
-                        bib, race_id, judge_id, "Red", "~"
-                    ),
-                    columns=["Time"],
-                )
-                yellow_bent = pd.DataFrame(
-                    self.db.get_judge_call_filtered(
-                        bib, race_id, judge_id, "Yellow", "<"
-                    ),
-                    columns=["Time"],
-                )
-                red_bent = pd.DataFrame(
-                    self.db.get_judge_call_filtered(bib, race_id, judge_id, "Red", "<"),
-                    columns=["Time"],
-                )
-                # can't sort with sql query because TOD is text for some reason
-                yellow_loc["Time"] = pd.to_datetime(
-                    yellow_loc["Time"], format="%H:%M:%S %p"
-                )
-                red_loc["Time"] = pd.to_datetime(red_loc["Time"], format="%H:%M:%S %p")
-                yellow_bent["Time"] = pd.to_datetime(
-                    yellow_bent["Time"], format="%H:%M:%S %p"
-                )
-                red_bent["Time"] = pd.to_datetime(
-                    red_bent["Time"], format="%H:%M:%S %p"
-                )
-
-                if yellow_loc.shape[0] > 0 or red_loc.shape[0] > 0:
-                    calls_for_this_judge[JudgeCallType.LOC] = (yellow_loc, red_loc)
-                if yellow_bent.shape[0] > 0 or red_bent.shape[0] > 0:
-                    calls_for_this_judge[JudgeCallType.BENT_KNEE] = (
-                        yellow_bent,
-                        red_bent,
-                    )
-                if len(calls_for_this_judge) > 0:
-                    calls_for_this_athlete[judge_id] = calls_for_this_judge
-            categorized_judge_calls[bib] = calls_for_this_athlete
-
-        return categorized_judge_calls
+        self.prefetch_races()
 
     def save_current_graph(self):
         """
@@ -396,21 +685,41 @@ class MplCanvas(mlp_backend.FigureCanvasQTAgg):
         self.mpl_connect("motion_notify_event", self.graph.on_hover)
         self.draw_idle()
 
-    def plot_new_race(self, loc_values, judge_data, athletes, judges):
+    def plot_new_race(self, dataset, athletes, judges):
         """
         Plot this graph based on new race data, removing all existing plots
 
-        :param loc_values: The LOC values to graph
-        :type loc_values: dict[int, pandas.DataFrame]
-        :param judge_data: The judge calls to graph
-        :type judge_data: dict[int, dict[int, pandas.DataFrame]]
+        :param dataset: The LOC values and judge calls to graph
+        :type dataset: RaceDataset
         :param athletes: Information for each athlete that is graphed
         :type athletes: list[tuple[str, str, int]]
         :param judges: A dictionary of judge ids and names for the judges involved in this race
         :type judges: dict[int, str]
         """
         self.graph.reset()
-        self.graph.plot(loc_values, judge_data, athletes, judges)
+        self.graph.plot(dataset, athletes, judges)
+        self.draw_idle()
+
+    def append_race_data(self, dataset):
+        """
+        Add new LOC values and judge calls of the current race to this graph.
+
+        :param dataset: The new LOC values and judge calls
+        :type dataset: RaceDataset
+        """
+        self.graph.append(dataset)
+        self.draw_idle()
+
+    def add_athletes(self, dataset, bibs):
+        """
+        Add athletes of the current race that are not on this graph yet.
+
+        :param dataset: The LOC values and judge calls of at least these athletes
+        :type dataset: RaceDataset
+        :param bibs: Bib numbers of the athletes to add
+        :type bibs: list[int]
+        """
+        self.graph.add_athletes(dataset, bibs)
         self.draw_idle()
 
     def redraw_loc(self, loc):
@@ -0,0 +1,101 @@
+import logging
+
+from PyQt6 import QtCore
+
+from endurance.race_data import LoadCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class RaceLoaderSignals(QtCore.QObject):
+    """Signals emitted by a RaceLoader, delivered on the thread the receiver lives on."""
+
+    progress = QtCore.pyqtSignal(object, int)
+    """Emitted with the token of the load and the number of finished steps"""
+
+    loaded = QtCore.pyqtSignal(object, object, object, object)
+    """Emitted with the token of the load, the ID of the race, the loaded data and the
+    high water marks it was loaded up to"""
+
+    failed = QtCore.pyqtSignal(object, str)
+    """Emitted with the token of the load and a description of the error"""
+
+
+class RaceLoader(QtCore.QRunnable):
+    """
+    Loads the data of a race on a thread pool, through a cache of loaded races. Nothing
+    is emitted once the token is cancelled, so results of stale loads never reach the
+    receiver.
+
+    :param db: The database to load from
+    :type db: DB
+    :param race_id: The ID of the race to load
+    :type race_id: int
+    :param token: Token to stop loading early
+    :type token: CancellationToken
+    :param cache: Cache to take the race from, or to add it to
+    :type cache: RaceCache
+    :param lazy: Whether to only load the athletes and judges of the race if it is not
+        cached, see load_race
+    :type lazy: bool
+    """
+
+    def __init__(self, db, race_id, token, cache, lazy=False):
+        super().__init__()
+        self.db = db
+        self.race_id = race_id
+        self.token = token
+        self.cache = cache
+        self.lazy = lazy
+        self.signals = RaceLoaderSignals()
+
+    def run(self):
+        try:
+            marks, data = self.cache.load(
+                self.db,
+                self.race_id,
+                self.token,
+                lambda finished: self.signals.progress.emit(self.token, finished),
+                self.lazy,
+            )
+        except LoadCancelled:
+            return
+        except Exception as error:
+            if not self.token.cancelled:
+                self.signals.failed.emit(self.token, str(error))
+            return
+
+        if not self.token.cancelled:
+            self.signals.loaded.emit(self.token, self.race_id, data, marks)
+
+
+class RacePrefetcher(QtCore.QRunnable):
+    """
+    Loads races into a cache on a thread pool ahead of time, so they show up at once
+    when selected. Races that fail to load are skipped, they fail again when selected.
+
+    :param db: The database to load from
+    :type db: DB
+    :param race_ids: IDs of the races to load, in order
+    :type race_ids: list[int]
+    :param token: Token to stop loading early
+    :type token: CancellationToken
+    :param cache: Cache to add the races to
+    :type cache: RaceCache
+    """
+
+    def __init__(self, db, race_ids, token, cache):
+        super().__init__()
+        self.db = db
+        self.race_ids = race_ids
+        self.token = token
+        self.cache = cache
+
+    def run(self):
+        for race_id in self.race_ids:
+            try:
+                self.cache.load(self.db, race_id, self.token)
+            except LoadCancelled:
+                return
+            except Exception:
+                logger.exception("Could not prefetch race %s", race_id)
@@ -1,4 +1,10 @@
 from PyQt6 import QtWidgets, QtCore, QtGui
+from endurance.reports import (
+    ReportEngine,
+    SummaryStore,
+    CONSENSUS_REPORTS,
+    REPORTS,
+)
 from endurance.table_to_ppt import generate_powerpoint
 
 
@@ -12,6 +18,9 @@ class TableWindow(QtWidgets.QWidget):
         self.show_table_button = show_table_button
 
         self.db = db
+        self.report_engine = ReportEngine(db)
+        self.summary_store = None
+        self.open_summary_store()
         self._data = None
         self._headers = None
 
@@ -32,27 +41,34 @@ class TableWindow(QtWidgets.QWidget):
         report_label = QtWidgets.QLabel("Report:")
         report_label.setBuddy(self.report_combo_box)
 
+        # Reports are read from the summary store if precomputed, otherwise every report
+        # is computed from the same in-memory judge calls of the race
         self.summaries = {
-            "Judge Infraction Summary": self.db.get_judge_infraction_summary_by_race,
-            "Athlete Infraction Summary": self.db.get_athlete_infraction_summary_by_race,
-            "Athlete Judge Infraction Summary": self.db.get_athlete_judge_infraction_summary_by_race,
-            "Red Cards Without Yellow Summary": self.db.get_red_without_yellow_summary_by_race,
-            "Yellow Cards Without Red Summary": self.db.get_yellow_without_red_summary_by_race,
-            "Per Athlete Calls Summary": self.db.get_per_athlete_calls_summary_by_race,
-            "Judge Consistency Report": self.db.get_judge_consistency_report_by_race,
+            name: (lambda race_id, name=name: self.get_report(name, race_id))
+            for name in REPORTS
         }
         for key in self.summaries.keys():
             self.report_combo_box.addItem(key, key)
         self.report_combo_box.currentIndexChanged.connect(
-            lambda _: self.initialize_table(
-                *(
-                    self.summaries[self.report_combo_box.currentData()](
-                        self.selected_race
-                    )
-                )
-            )
+            lambda _: self.refresh_table()
         )
 
+        # Initialize spin boxes to adjust when judges count as a majority
+        self.quorum_spin_box = QtWidgets.QSpinBox()
+        self.quorum_spin_box.setRange(0, 99)
+        self.quorum_spin_box.setSpecialValueText("Half of judges")
+        quorum_label = QtWidgets.QLabel("Quorum:")
+        quorum_label.setBuddy(self.quorum_spin_box)
+        self.quorum_spin_box.valueChanged.connect(lambda _: self.set_consensus())
+
+        self.tolerance_spin_box = QtWidgets.QSpinBox()
+        self.tolerance_spin_box.setRange(0, 3600)
+        self.tolerance_spin_box.setSuffix(" s")
+        self.tolerance_spin_box.setSpecialValueText("Whole race")
+        tolerance_label = QtWidgets.QLabel("Time Tolerance:")
+        tolerance_label.setBuddy(self.tolerance_spin_box)
+        self.tolerance_spin_box.valueChanged.connect(lambda _: self.set_consensus())
+
         # Initialize line edit for filtering
         self.line_edit = QtWidgets.QLineEdit()
         self.line_edit.textChanged.connect(
@@ -76,13 +92,15 @@ class TableWindow(QtWidgets.QWidget):
         export_button.clicked.connect(lambda: self.export())
 
         # Initialize table
-        self.initialize_table(
-            *(self.summaries[self.report_combo_box.currentData()](self.selected_race))
-        )
+        self.refresh_table()
 
         layout = QtWidgets.QGridLayout()
         layout.addWidget(report_label, 0, 0)
         layout.addWidget(self.report_combo_box, 1, 0)
+        layout.addWidget(quorum_label, 0, 1)
+        layout.addWidget(self.quorum_spin_box, 1, 1)
+        layout.addWidget(tolerance_label, 0, 2)
+        layout.addWidget(self.tolerance_spin_box, 1, 2)
         layout.addWidget(line_edit_label, 2, 0, 1, 1)
         layout.addWidget(self.line_edit, 3, 0, 1, 2)
         layout.addWidget(column_label, 2, 2, 1, 1)
@@ -95,6 +113,80 @@ class TableWindow(QtWidgets.QWidget):
 
         self.setLayout(total_layout)
 
+    def set_db(self, db):
+        """
+        Switch to computing reports from another database, keeping the consensus
+        settings, and show the current report from it.
+
+        :param db: The database to switch to
+        :type db: DB
+        """
+        self.db = db
+        self.report_engine = ReportEngine(db, self.report_engine.consensus)
+        self.open_summary_store()
+        self.update_table()
+
+    def open_summary_store(self):
+        """
+        Start reading reports from the summary store of the database, if it is up to date.
+        """
+        if self.summary_store is not None:
+            self.summary_store.close()
+        self.summary_store = SummaryStore.open(self.db.source_path)
+
+    def get_report(self, name, race_id):
+        """
+        Get a report for a race, from the summary store if it was precomputed.
+
+        :param name: Name of the report in REPORTS
+        :type name: str
+        :param race_id: ID of the race
+        :type race_id: int
+        :return: Headers and rows of the report
+        :rtype: tuple[list[str], list[tuple[any]]]
+        """
+        # Stored reports were computed with the default consensus settings
+        if self.summary_store is not None and (
+            name not in CONSENSUS_REPORTS or self.report_engine.consensus.is_default
+        ):
+            summary = self.summary_store.get(name, race_id)
+            if summary is not None:
+                return summary
+        return REPORTS[name](self.report_engine, race_id)
+
+    def set_consensus(self):
+        """
+        Apply the quorum and time tolerance from the spin boxes to the consensus engine,
+        recomputing the current report if it depends on them. The judge calls of the race
+        are already in memory, so this does not query the database again.
+        """
+        consensus = self.report_engine.consensus
+        consensus.quorum = self.quorum_spin_box.value() or None
+        consensus.tolerance = self.tolerance_spin_box.value() or None
+        if self.report_combo_box.currentData() in CONSENSUS_REPORTS:
+            self.refresh_table()
+
+    def refresh_table(self):
+        """
+        Re-set table with the selected report for the selected race.
+        """
+        report = self.report_combo_box.currentData()
+        consensus_report = report in CONSENSUS_REPORTS
+        self.quorum_spin_box.setEnabled(consensus_report)
+        self.tolerance_spin_box.setEnabled(consensus_report)
+        self.initialize_table(*(self.summaries[report](self.selected_race)))
+
+    def update_table(self):
+        """
+        Re-set table with the selected report, to pick up new rows in the database,
+        keeping the filter the user entered.
+        """
+        filter_text = self.line_edit.text()
+        filter_column = self.column_combo_box.currentIndex()
+        self.refresh_table()
+        self.column_combo_box.setCurrentIndex(filter_column)
+        self.line_edit.setText(filter_text)
+
     def set_selected_race(self, race_id):
         """
         Re-set table with data for currently selected race in main window.
@@ -103,9 +195,7 @@ class TableWindow(QtWidgets.QWidget):
         :type race_id: int
         """
         self.selected_race = race_id
-        self.initialize_table(
-            *(self.summaries[self.report_combo_box.currentData()](race_id))
-        )
+        self.refresh_table()
 
     def initialize_table(self, headers, data):
         """
@@ -176,6 +266,9 @@ class TableWindow(QtWidgets.QWidget):
         Overrides the closeEvent function to close the window and show the show table button.
         """
         self.show_table_button.show()
+        if self.summary_store is not None:
+            self.summary_store.close()
+            self.summary_store = None
         self.close()
         event.accept()
 
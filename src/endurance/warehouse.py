@@ -0,0 +1,255 @@
+import glob
+import logging
+import os
+import sqlite3
+
+from concurrent.futures import ProcessPoolExecutor
+
+from endurance.db import (
+    OPTIMIZED_INDEXES,
+    OPTIMIZED_SUFFIX,
+    SCHEMA,
+    ConnectionProfile,
+    TimeTable,
+    hash_database,
+)
+from endurance.reports import SUMMARY_SUFFIX
+
+ID_NAMESPACE = 1_000_000
+"""IDs from a source database are offset by its source ID times this in the warehouse"""
+
+NAMESPACED_COLUMNS = ("ID", "IDAthlete", "IDEvent", "IDJudge", "IDRace")
+"""Columns holding IDs that are only unique within one source database"""
+
+SOURCE_COLUMNS = {
+    "Athlete": "IDAthlete",
+    "Bib": "IDRace",
+    "Event": "IDEvent",
+    "Judge": "IDJudge",
+    "JudgeCall": "IDRace",
+    "Race": "IDRace",
+    "VideoObservation": "IDRace",
+    "RaceJudge": "IDRace",
+}
+"""Namespaced column that tells which source database a row of each table came from"""
+
+TIMED_TABLES = ("VideoObservation", "JudgeCall")
+"""Tables that get a precomputed TODSeconds column in the warehouse"""
+
+logger = logging.getLogger(__name__)
+
+
+class NamespaceError(ValueError):
+    """Raised when IDs of a source database do not fit in its range of warehouse IDs."""
+
+
+def namespace_id(source_id, value):
+    """
+    Get the warehouse ID of an ID from a source database.
+
+    :param source_id: ID of the source database in the warehouse
+    :type source_id: int
+    :param value: ID within the source database
+    :type value: int | None
+    :return: The ID within the warehouse, None if value is None
+    :rtype: int | None
+    """
+    return None if value is None else source_id * ID_NAMESPACE + value
+
+
+def find_event_databases(directory, exclude=()):
+    """
+    Find the event databases in a directory, leaving out files this app derives from
+    databases.
+
+    :param directory: Directory to search
+    :type directory: str
+    :param exclude: Paths to leave out
+    :type exclude: list[str]
+    :return: Paths of the event databases, sorted
+    :rtype: list[str]
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(directory, "*.db"))
+        if os.path.abspath(path) not in excluded
+        and not path.endswith((OPTIMIZED_SUFFIX, SUMMARY_SUFFIX))
+    )
+
+
+def _hash_source(path):
+    return path, hash_database(path)
+
+
+def _read_source(path, source_id):
+    """
+    Read every table of a source database, with IDs namespaced for the warehouse.
+
+    :param path: Path to the source database
+    :type path: str
+    :param source_id: ID of the source database in the warehouse
+    :type source_id: int
+    :raises NamespaceError: If an ID is negative or not below ID_NAMESPACE, as it would
+        clash with the IDs of another source database
+    :return: Map of table name to the rows to insert, in the column order of the warehouse
+    :rtype: dict[str, list[tuple[any]]]
+    """
+    tables = dict()
+    times = TimeTable()
+    connection = ConnectionProfile(mmap_size=0).connect(path)
+    try:
+        for table, columns in SCHEMA.items():
+            source_columns = [
+                row[1] for row in connection.execute(f"PRAGMA table_info({table})")
+            ]
+            if not source_columns:
+                continue
+
+            checked = [
+                column
+                for column in columns
+                if column in NAMESPACED_COLUMNS and column in source_columns
+            ]
+            for column in checked:
+                low, high = connection.execute(
+                    f"SELECT MIN({column}), MAX({column}) FROM {table}"
+                ).fetchone()
+                if low is not None and (low < 0 or high >= ID_NAMESPACE):
+                    raise NamespaceError(
+                        f"{path} has {table}.{column} values outside 0 to "
+                        f"{ID_NAMESPACE - 1:,}, which the warehouse can not keep apart "
+                        "from the IDs of other databases"
+                    )
+
+            # Columns the source does not have are left NULL
+            selected = ", ".join(
+                column if column in source_columns else "NULL" for column in columns
+            )
+            rows = connection.execute(f"SELECT {selected} FROM {table}").fetchall()
+
+            namespaced = [
+                index
+                for index, column in enumerate(columns)
+                if column in NAMESPACED_COLUMNS
+            ]
+            tod = list(columns).index("TOD") if table in TIMED_TABLES else None
+            converted = []
+            for row in rows:
+                row = list(row)
+                for index in namespaced:
+                    row[index] = namespace_id(source_id, row[index])
+                if tod is not None:
+                    row.append(times.seconds(row[tod]))
+                converted.append(tuple(row))
+            tables[table] = converted
+    finally:
+        connection.close()
+    return tables
+
+
+def _create_warehouse(connection):
+    for table, columns in SCHEMA.items():
+        definitions = [f"{column} {kind}" for column, kind in columns.items()]
+        if table in TIMED_TABLES:
+            definitions.append("TODSeconds INTEGER")
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(definitions)})"
+        )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS WarehouseSource (IDSource INTEGER PRIMARY KEY, "
+        "Path TEXT UNIQUE, Hash TEXT, Rows INTEGER)"
+    )
+
+
+def _remove_source(connection, source_id):
+    for table, column in SOURCE_COLUMNS.items():
+        connection.execute(
+            f"DELETE FROM {table} WHERE {column} >= ? AND {column} < ?",
+            (source_id * ID_NAMESPACE, (source_id + 1) * ID_NAMESPACE),
+        )
+
+
+def build_warehouse(db_paths, warehouse_path, workers=None):
+    """
+    Merge many event databases into a single indexed warehouse database, which can be
+    opened with DB like any other database. Source databases are hashed and read by a
+    pool of processes. Databases already in the warehouse with the same contents are
+    skipped, and databases whose contents changed replace their previous rows.
+
+    IDs from source database n become n * ID_NAMESPACE + ID, so IDs from different
+    events never clash.
+
+    :param db_paths: Paths to the event databases
+    :type db_paths: list[str]
+    :param warehouse_path: Path to the warehouse database, created if it does not exist
+    :type warehouse_path: str
+    :param workers: Number of processes to use, the number of CPUs if None
+    :type workers: int | None
+    :return: Paths of the ingested and the skipped databases, and the number of rows
+        ingested, under "ingested", "skipped" and "rows"
+    :rtype: dict[str, any]
+    """
+    db_paths = [os.path.abspath(path) for path in db_paths]
+    connection = sqlite3.connect(warehouse_path)
+    try:
+        with connection:
+            _create_warehouse(connection)
+        sources = {
+            path: (source_id, content_hash)
+            for source_id, path, content_hash in connection.execute(
+                "SELECT IDSource, Path, Hash FROM WarehouseSource"
+            )
+        }
+        known_hashes = {content_hash for _, content_hash in sources.values()}
+        next_id = max((source_id for source_id, _ in sources.values()), default=0) + 1
+
+        result = {"ingested": [], "skipped": [], "rows": 0}
+        with ProcessPoolExecutor(workers) as executor:
+            pending = []
+            for path, content_hash in executor.map(_hash_source, db_paths):
+                if content_hash in known_hashes:
+                    result["skipped"].append(path)
+                    continue
+                known_hashes.add(content_hash)
+                if path in sources:
+                    source_id = sources[path][0]
+                else:
+                    source_id, next_id = next_id, next_id + 1
+                pending.append((path, source_id, content_hash))
+
+            read = executor.map(
+                _read_source,
+                [path for path, _, _ in pending],
+                [source_id for _, source_id, _ in pending],
+            )
+            for (path, source_id, content_hash), tables in zip(pending, read):
+                rows = sum(len(table_rows) for table_rows in tables.values())
+                with connection:
+                    _remove_source(connection, source_id)
+                    for table, table_rows in tables.items():
+                        if not table_rows:
+                            continue
+                        placeholders = ", ".join("?" * len(table_rows[0]))
+                        connection.executemany(
+                            f"INSERT INTO {table} VALUES ({placeholders})", table_rows
+                        )
+                    connection.execute(
+                        "INSERT OR REPLACE INTO WarehouseSource VALUES (?, ?, ?, ?)",
+                        (source_id, path, content_hash, rows),
+                    )
+                logger.info("Ingested %s rows from %s", rows, path)
+                result["ingested"].append(path)
+                result["rows"] += rows
+
+        if result["ingested"]:
+            with connection:
+                for name, definition in OPTIMIZED_INDEXES.items():
+                    connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"
+                    )
+            connection.execute("ANALYZE")
+    finally:
+        connection.close()
+
+    return result
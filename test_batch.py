@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from endurance.batch import main, render_database, render_race
+
+
+def test_render_race_saves_race_and_walker_graphs(race_db_path, tmp_path):
+    saved, failed = render_race(race_db_path, 1, str(tmp_path), ("png", "pdf"))
+
+    assert failed == []
+    assert sorted(os.path.basename(path) for path in saved) == [
+        "all_walkers.pdf",
+        "all_walkers.png",
+        "walker_12.pdf",
+        "walker_12.png",
+        "walker_7.pdf",
+        "walker_7.png",
+    ]
+    with open(tmp_path / "race_1" / "walker_7.png", "rb") as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+
+
+def test_render_database_renders_every_race(race_db_path, tmp_path):
+    result = render_database(race_db_path, str(tmp_path), ["png"], workers=2)
+
+    assert result["failed"] == []
+    assert [os.path.relpath(path, tmp_path) for path in result["saved"]] == [
+        os.path.join("race_1", "all_walkers.png"),
+        os.path.join("race_1", "walker_12.png"),
+        os.path.join("race_1", "walker_7.png"),
+        os.path.join("race_2", "all_walkers.png"),
+        os.path.join("race_2", "walker_7.png"),
+        os.path.join("race_2", "walker_9.png"),
+    ]
+
+
+def test_batch_reports_throughput(race_db_path, tmp_path, capsys):
+    assert main([race_db_path, "-o", str(tmp_path), "-r", "2", "-j", "1"]) == 0
+
+    assert capsys.readouterr().out.startswith(f"Rendered 3 graphs to {tmp_path} in ")
+    assert main([str(tmp_path / "missing.db")]) == 1
+
+
+def test_batch_does_not_import_qt():
+    code = "import sys, endurance.batch; print(any('PyQt' in m for m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert output.stdout.strip() == "False"
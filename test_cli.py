@@ -0,0 +1,30 @@
+import logging
+import os
+import sys
+
+import pytest
+
+from endurance import cli, main
+
+
+@pytest.mark.parametrize("verbose_first", [True, False])
+def test_main_runs_commands_with_verbose(
+    race_db_path, tmp_path, monkeypatch, capsys, verbose_first
+):
+    command = ["warehouse", os.path.dirname(race_db_path), str(tmp_path / "all.sqlite")]
+    argv = ["-v", *command] if verbose_first else [*command, "-v"]
+    configs = []
+    monkeypatch.setattr(logging, "basicConfig", lambda **kwargs: configs.append(kwargs))
+    monkeypatch.setattr(sys, "argv", ["endurance", *argv])
+
+    assert main.main() == 0
+
+    assert capsys.readouterr().out.startswith("Ingested 1 and skipped 0")
+    assert configs == [{"level": logging.INFO}]
+
+
+def test_find_command():
+    assert cli.find_command(["-v", "import", "a.db", "b.csv"]) == "import"
+    assert cli.find_command(["-platform", "offscreen"]) is None
+    assert cli.find_command([]) is None
+    assert not cli.make_parser().parse_args(["import", "a.db", "b.csv"]).verbose
@@ -0,0 +1,329 @@
+import os
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PureWindowsPath
+
+import numpy as np
+import pytest
+
+from endurance.db import (
+    COLORS,
+    INFRACTIONS,
+    ConnectionProfile,
+    DB,
+    QueryCache,
+    TimeTable,
+    optimize_database,
+    optimized_path,
+    tod_to_seconds,
+)
+from endurance.race_data import load_race_dataset
+
+
+def test_tod_to_seconds():
+    assert tod_to_seconds("10:02:03 AM") == 36123
+    assert tod_to_seconds("13:00:00 PM") == 46800
+    assert tod_to_seconds(None) is None
+    assert tod_to_seconds("not a time") is None
+
+
+def test_time_table_parses_each_time_once():
+    times = TimeTable()
+
+    assert times.seconds_of(["10:02:03 AM", None, "10:02:03 AM", "nope"]) == [
+        36123,
+        None,
+        36123,
+        None,
+    ]
+    assert len(times) == 3
+    assert (times.misses, times.hits) == (3, 1)
+
+
+def test_db_parses_times_through_its_time_table(race_db_path):
+    db = DB(race_db_path)
+
+    db.get_loc_columns_by_race(1)
+    db.get_judge_call_columns_by_race(1)
+
+    # Race 1 has 6 observations and 8 calls, at 12 distinct times of day
+    assert len(db.times) == 12
+    assert db.times.hits > 0
+
+
+def test_optimize_database_creates_indexed_copy(race_db_path):
+    with open(race_db_path, "rb") as f:
+        original = f.read()
+
+    copy_path = optimize_database(race_db_path)
+
+    assert copy_path == optimized_path(race_db_path)
+    with open(race_db_path, "rb") as f:
+        assert f.read() == original
+
+    connection = sqlite3.connect(copy_path)
+    indexes = {
+        row[0]
+        for row in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )
+    }
+    assert {"VideoObservation_Race_Bib", "JudgeCall_Race_Judge"} <= indexes
+    assert connection.execute(
+        "SELECT TODSeconds FROM VideoObservation WHERE ID = 1"
+    ).fetchone() == (36120,)
+    assert connection.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+    connection.close()
+
+
+def test_db_prefers_up_to_date_optimized_copy(race_db_path):
+    assert DB(race_db_path).path == race_db_path
+
+    copy_path = optimize_database(race_db_path)
+    db = DB(race_db_path)
+    assert db.path == copy_path
+    assert db.optimized
+    assert DB(race_db_path, prefer_optimized=False).path == race_db_path
+
+    # Once the original changes, the copy is stale and no longer used
+    stat = os.stat(race_db_path)
+    os.utime(race_db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    db = DB(race_db_path)
+    assert db.path == race_db_path
+    assert not db.optimized
+
+
+def test_get_loc_columns_by_race_is_time_ordered(race_db_path):
+    db = DB(race_db_path)
+
+    columns = db.get_loc_columns_by_race(1)
+
+    assert list(zip(columns["BibNumber"], columns["TODSeconds"])) == [
+        (7, tod_to_seconds("09:58:00 AM")),
+        (7, tod_to_seconds("10:02:00 AM")),
+        (7, tod_to_seconds("10:06:00 AM")),
+        (12, tod_to_seconds("09:59:00 AM")),
+        (12, tod_to_seconds("10:01:00 AM")),
+    ]
+
+
+def test_get_judge_call_columns_by_race_time_range(race_db_path):
+    db = DB(race_db_path)
+
+    columns = db.get_judge_call_columns_by_race(
+        1, start=tod_to_seconds("10:00:00 AM"), end=tod_to_seconds("10:03:00 AM")
+    )
+
+    # Ordered by bib, then judge, then time
+    assert list(
+        zip(columns["BibNumber"], columns["IDJudge"], columns["TODSeconds"])
+    ) == [
+        (7, 1, tod_to_seconds("10:00:00 AM")),
+        (7, 2, tod_to_seconds("10:03:00 AM")),
+        (12, 1, tod_to_seconds("10:01:30 AM")),
+        (12, 2, tod_to_seconds("10:00:30 AM")),
+        (12, 2, tod_to_seconds("10:02:00 AM")),
+    ]
+
+
+def test_tod_seconds_function_is_registered(race_db_path):
+    db = DB(race_db_path)
+
+    assert db.execute_lookup_query("SELECT TOD_SECONDS(?)", ("01:00:05 AM",)) == [
+        (3605,)
+    ]
+
+
+def test_db_opens_read_only_with_profile(race_db_path):
+    db = DB(race_db_path, profile=ConnectionProfile(mmap_size=0, cache_size=-1024))
+
+    assert db.connection_settings["read_only"]
+    assert db.connection_settings["query_only"] == 1
+    assert db.connection_settings["cache_size"] == -1024
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute_lookup_query("DELETE FROM Judge", ())
+
+
+def test_connection_profile_uri_keeps_network_shares_in_the_path():
+    share = PureWindowsPath(r"\\server\share\races\champs.db")
+    assert ConnectionProfile.file_uri(share) == "file:////server/share/races/champs.db"
+    assert (
+        ConnectionProfile.file_uri(PureWindowsPath(r"C:\races\champs.db"))
+        == "file:///C:/races/champs.db"
+    )
+
+    # SQLite takes URIs without an authority, a missing file is all that fails here
+    with pytest.raises(sqlite3.OperationalError, match="unable to open"):
+        sqlite3.connect(
+            ConnectionProfile.file_uri(share) + "?mode=ro", uri=True
+        ).execute("SELECT 1")
+    with pytest.raises(sqlite3.OperationalError, match="authority"):
+        sqlite3.connect(share.as_uri() + "?mode=ro", uri=True)
+
+
+def test_db_can_be_queried_from_many_threads(race_db_path):
+    with DB(race_db_path, pool_size=2) as db:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda race: load_race_dataset(db, race).loc_values, [1, 2] * 20
+                )
+            )
+
+    np.testing.assert_array_equal(results[0], results[2])
+    assert len(results[0]) == 5
+    assert len(results[1]) == 4
+
+
+def test_closed_db_refuses_queries(race_db_path):
+    db = DB(race_db_path)
+    db.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.get_races()
+
+
+def test_query_results_are_cached(race_db_path):
+    db = DB(race_db_path)
+
+    first = db.get_races()
+    second = db.get_races()
+
+    assert first is second
+    assert db.cache.hits == 1
+    assert db.cache.stats()["entries"] > 0
+
+
+def test_query_cache_is_invalidated_when_database_changes(race_db_path):
+    db = DB(race_db_path)
+    assert len(db.get_races()) == 2
+
+    writer = sqlite3.connect(race_db_path)
+    writer.execute(
+        "INSERT INTO Race VALUES (3, 1, '2024-05-02', '09:00:00', 35, 'km', 'Men')"
+    )
+    writer.commit()
+    writer.close()
+
+    assert len(db.get_races()) == 3
+
+
+def test_query_cache_stays_within_memory_bound():
+    cache = QueryCache(max_bytes=2000)
+
+    for index in range(50):
+        cache.put(index, [(index, "row")])
+
+    assert cache.nbytes <= 2000
+    assert cache.get(0) is None
+    assert cache.get(49) == [(49, "row")]
+
+
+def test_columnar_queries_return_typed_arrays(race_db_path):
+    db = DB(race_db_path)
+
+    loc = db.get_loc_columns_by_race(1)
+    calls = db.get_judge_call_columns_by_race(2)
+
+    assert loc["BibNumber"].dtype == np.int64
+    assert loc["LOCAverage"].dtype == np.float32
+    assert list(loc["TODSeconds"]) == [35880, 36120, 36360, 35940, 36060]
+    assert not loc["LOCAverage"].flags.writeable
+
+    assert calls["ColorCode"].dtype == np.int8
+    assert [COLORS[code] for code in calls["ColorCode"]] == ["Yellow", "Red"]
+    assert [INFRACTIONS[code] for code in calls["InfractionCode"]] == ["~", "<"]
+
+
+def test_stream_query_yields_batches(race_db_path):
+    db = DB(race_db_path)
+    query = "SELECT ID FROM VideoObservation ORDER BY ID"
+    entries = db.cache.stats()["entries"]
+
+    batches = list(db.stream_query(query, (), batch_size=4))
+
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert db.cache.stats()["entries"] == entries
+    assert [row for batch in batches for row in batch] == db.execute_lookup_query(
+        query, ()
+    )
+
+
+def test_stream_columnar_query_matches_whole_result(race_db_path):
+    db = DB(race_db_path)
+    query = "SELECT BibNumber, LOCAverage FROM VideoObservation WHERE IDRace = ? ORDER BY ID"
+    dtypes = [np.int64, np.float64]
+
+    chunks = list(db.stream_columnar_query(query, (1,), dtypes, batch_size=3))
+    columns = db.execute_columnar_query(query, (1,), dtypes)
+
+    assert [len(chunk["BibNumber"]) for chunk in chunks] == [3, 3]
+    np.testing.assert_array_equal(
+        np.concatenate([chunk["LOCAverage"] for chunk in chunks]),
+        columns["LOCAverage"],
+    )
+
+    # Empty results still have their columns
+    (empty,) = db.stream_columnar_query(query, (99,), dtypes)
+    assert list(empty) == ["BibNumber", "LOCAverage"]
+    assert empty["LOCAverage"].dtype == np.float64
+
+
+def test_execute_columnar_query_joins_batches(race_db_path, monkeypatch):
+    db = DB(race_db_path)
+    query = "SELECT BibNumber, LOCAverage FROM VideoObservation WHERE IDRace = ? ORDER BY ID"
+    dtypes = [np.int64, np.float64]
+    expected = db.execute_lookup_query(query, (1,))
+
+    # Batches smaller than the result have to be grown into the returned arrays
+    stream = db.stream_columnar_query
+    monkeypatch.setattr(
+        db,
+        "stream_columnar_query",
+        lambda *args: stream(*args, batch_size=2),
+    )
+    columns = db.execute_columnar_query(query, (1,), dtypes)
+
+    assert columns["BibNumber"].tolist() == [row[0] for row in expected]
+    np.testing.assert_array_equal(
+        columns["LOCAverage"], np.array([row[1] for row in expected], np.float64)
+    )
+    assert not columns["LOCAverage"].flags.writeable
+
+
+def test_profiler_groups_queries_by_call_site(race_db_path):
+    db = DB(race_db_path)
+    profiler = db.enable_profiling(dump_at_exit=False)
+
+    db.get_judge_call_filtered(7, 1, 1, "Red", "~")
+    db.get_judge_call_filtered(7, 1, 1, "Red", "~")
+    db.get_loc_columns_by_race(1)
+
+    stats = profiler.stats()
+    assert stats["get_judge_call_filtered"]["calls"] == 2
+    assert stats["get_judge_call_filtered"]["cached"] == 1
+    assert stats["get_loc_columns_by_race"]["rows"] == 5
+    # Without the indexes of an optimized copy, every table is scanned
+    assert "SCAN VideoObservation" in stats["get_loc_columns_by_race"]["flags"]
+    assert profiler.report().startswith(
+        max(stats, key=lambda site: stats[site]["seconds"])
+    )
+
+    db.disable_profiling()
+    db.get_races()
+    assert "get_races" not in profiler.stats()
+
+
+def test_roster_of_race(race_db_path):
+    db = DB(race_db_path)
+
+    roster = db.get_roster(2)
+
+    assert sorted(roster.athletes) == [7, 9]
+    assert roster.athletes[7][:4] == (7, 1, "Ann", "Able")
+    assert roster.athletes[9][6:] == ("00:47:00", 2, "Y")
+    assert roster.athlete_name(9) == ("Dunn", "Dee")
+    assert roster.athlete_name(99) == ("", "")
+    assert [judge[0] for judge in roster.judges] == [1, 2]
+    assert db.get_roster(2) is roster
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from endurance.db import DB, optimize_database
+from endurance.importer import ImportFormatError, import_export
+from endurance.race_data import load_race_dataset
+
+
+def test_import_observations_from_csv(tmp_path, race_db_path):
+    export = tmp_path / "observations.csv"
+    export.write_text(
+        "ID,IDRace,BibNumber,LOCAverage,TOD\n"
+        "20,2,9,33.5,11:00:00 AM\n"
+        "21,2,9,,11:04:00 AM\n"
+        "22,2,9,36,11:08:00 AM\n"
+    )
+
+    rows, elapsed = import_export(str(export), race_db_path, chunk_size=2)
+
+    assert rows == 3
+    assert elapsed >= 0
+    db = DB(race_db_path)
+    loc_values = list(load_race_dataset(db, 2).athlete_loc(9)[1])
+    assert 33.5 in loc_values and 36.0 in loc_values
+    connection = sqlite3.connect(race_db_path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    connection.close()
+
+
+def test_import_fills_tod_seconds_of_optimized_copy(tmp_path, race_db_path):
+    copy_path = optimize_database(race_db_path)
+    export = tmp_path / "calls.csv"
+    export.write_text(
+        "IDRace,IDJudge,Color,Infraction,TOD,BibNumber\n2,3,Red,~,11:30:15 AM,9\n"
+    )
+
+    import_export(str(export), copy_path)
+
+    connection = sqlite3.connect(copy_path)
+    assert connection.execute(
+        "SELECT TODSeconds FROM JudgeCall WHERE IDJudge = 3 AND IDRace = 2"
+    ).fetchall() == [(41415,)]
+    connection.close()
+
+
+def test_import_rejects_invalid_times(tmp_path, race_db_path):
+    export = tmp_path / "observations.csv"
+    export.write_text(
+        "IDRace,BibNumber,LOCAverage,TOD\n" "2,9,33.5,11:00:00 AM\n" "2,9,34.5,11:00\n"
+    )
+
+    with pytest.raises(ImportFormatError, match="row 2: '11:00'"):
+        import_export(str(export), race_db_path)
+
+    # Nothing of a rejected export is imported
+    connection = sqlite3.connect(race_db_path)
+    assert connection.execute("SELECT COUNT(*) FROM VideoObservation").fetchone() == (
+        10,
+    )
+    connection.close()
@@ -1,7 +1,15 @@
-from PyQt6 import QtCore
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from PyQt6 import QtCore, QtWidgets
 from PyQt6.QtWidgets import QApplication
 from endurance.ui.plot_widget import PlotWidget
-from endurance.db import DB
+from endurance.db import DB, optimize_database, optimized_path
+from endurance.loc_graph import JudgeCallType
+from endurance.race_data import RaceDataset, load_race_dataset
 from endurance.ui.main_window import MainWindow
 
 
@@ -33,3 +41,276 @@ def test_plot_widget_user_interaction(qtbot):
     qtbot.mouseDClick(
         widget.judge_list._left_list.viewport(), QtCore.Qt.MouseButton.LeftButton
     )
+
+
+def test_plot_widget_only_plots_last_selected_race(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+
+    # Switch races faster than they can load
+    widget.race_combo_box.setCurrentIndex(1)
+    widget.race_combo_box.setCurrentIndex(0)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+
+    bibs = [
+        widget.walker_list._left_list.item(row).endurance_id
+        for row in range(widget.walker_list._left_list.count())
+    ]
+    assert sorted(bibs) == [7, 12]
+    assert widget.load_progress_bar.isHidden()
+
+    widget.close_application()
+
+
+def test_plot_widget_prefetches_neighbouring_races(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.prefetch_pool.waitForDone()
+
+    assert (widget.db.path, 2) in widget.race_cache
+
+    # Going back and forth is answered from the cache
+    misses = widget.race_cache.misses
+    widget.race_combo_box.setCurrentIndex(1)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.race_combo_box.setCurrentIndex(0)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    assert widget.race_cache.misses == misses
+
+    widget.close_application()
+
+
+def test_plot_widget_only_plots_what_is_displayed(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    graph = widget.graph
+
+    # Only the Max LOC line is plotted until something is displayed
+    assert list(graph.ax.lines) == [graph.max_loc_line.loc_plot]
+    assert len(graph.ax.collections) == 0
+    limits = graph.ax.get_xlim(), graph.ax.get_ylim()
+
+    graph.display_athletes([12])
+    graph.display_judge_call_by_type(JudgeCallType.LOC, True)
+    assert graph.athlete_plots[7].loc_plot is None
+    assert graph.athlete_plots[12].get_visible()
+    assert len(graph.ax.collections) == 0
+
+    graph.display_judge_call_by_judges([2])
+    calls = graph.judge_call_plots[(12, 2, JudgeCallType.LOC)]
+    assert calls.get_visible()
+    assert len(graph.ax.collections) == 2
+    assert graph.judge_call_plots[(7, 2, JudgeCallType.LOC)].get_plots() == ()
+
+    # Hiding keeps what was plotted, and the axes never move
+    graph.display_athletes([7])
+    assert not calls.get_visible()
+    assert len(graph.ax.lines) == 3
+    assert (graph.ax.get_xlim(), graph.ax.get_ylim()) == limits
+
+    widget.close_application()
+
+
+def test_plot_widget_loads_walkers_on_demand(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.cancel_prefetch()
+    widget.race_cache.clear()
+    widget.lazy_action.setChecked(True)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+
+    # Every walker can be selected, but none of them is plotted yet
+    assert widget.walker_list._left_list.count() == 2
+    assert widget.graph.athlete_plots == {}
+
+    left_list = widget.walker_list._left_list
+    for row in range(left_list.count()):
+        left_list.item(row).setSelected(left_list.item(row).endurance_id == 12)
+    widget.walker_list.move_items(left_list, widget.walker_list._right_list)
+
+    assert list(widget.graph.athlete_plots) == [12]
+    line = widget.graph.athlete_plots[12].loc_plot
+    assert line.get_visible()
+    assert list(line.get_ydata()) == [61.0, 52.0]
+    assert {key[0] for key in widget.graph.judge_call_plots} == {12}
+
+    # The rest of the race is loaded in the background
+    widget.prefetch_pool.waitForDone()
+    assert (widget.db.path, 1) in widget.race_cache
+
+    widget.close_application()
+
+
+def test_plot_widget_live_mode_appends_new_rows(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.live_action.setChecked(True)
+    assert widget.live_timer.isActive()
+
+    widget.graph.display_athletes([7])
+    widget.graph.display_judge_call_by_judges([1])
+    widget.graph.display_judge_call_by_type(JudgeCallType.LOC, True)
+    line = widget.graph.athlete_plots[7].loc_plot
+    assert len(line.get_xdata()) == 3
+
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (11, 1, 7, 47.0, '10:08:00 AM')"
+        )
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 1, 'Yellow', '~', '10:07:00 AM', 7)"
+        )
+    connection.close()
+    widget.poll_live_data()
+
+    # The lines were extended rather than plotted again
+    assert widget.graph.athlete_plots[7].loc_plot is line
+    assert list(line.get_ydata()) == [38.0, 41.5, 45.25, 47.0]
+    yellow = widget.graph.judge_call_plots[(7, 1, JudgeCallType.LOC)].yellow
+    assert len(yellow.get_offsets()) == 2
+    assert widget.load_token is None
+
+    # A judge new to the race makes the race load again
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute("INSERT INTO Judge VALUES (4, 'May', 'Hill', 'NZL')")
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 4, 'Red', '~', '10:07:30 AM', 12)"
+        )
+    connection.close()
+    widget.poll_live_data()
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    assert 4 in widget.graph.judges
+
+    widget.close_application()
+    assert not widget.live_timer.isActive()
+
+
+def test_plot_widget_live_mode_merges_late_rows_in_time_order(qtbot, race_db_path):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.live_action.setChecked(True)
+    widget.graph.display_athletes([7])
+    widget.graph.display_judge_call_by_judges([1])
+    widget.graph.display_judge_call_by_type(JudgeCallType.LOC, True)
+
+    # An observation recorded late, between the ones already plotted
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (11, 1, 7, 50.0, '10:00:00 AM')"
+        )
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 1, 'Yellow', '~', '09:59:00 AM', 7)"
+        )
+    connection.close()
+    widget.poll_live_data()
+
+    line = widget.graph.athlete_plots[7].loc_plot
+    times = line.get_xdata()
+    assert list(np.diff(times) > 0) == [True, True, True]
+    assert list(line.get_ydata()) == [38.0, 50.0, 41.5, 45.25]
+
+    # Calls plotted before the late observation are placed on the merged line too
+    yellow = widget.graph.judge_call_plots[(7, 1, JudgeCallType.LOC)].yellow
+    offsets = yellow.get_offsets()
+    np.testing.assert_allclose(
+        offsets[:, 1], np.interp(offsets[:, 0], times, line.get_ydata())
+    )
+    assert sorted(offsets[:, 1]) == pytest.approx([44.0, 50.0])
+    widget.close_application()
+
+
+def test_plot_widget_live_mode_keeps_calls_off_other_walkers_lines(qtbot, race_db_path):
+    db = DB(race_db_path)
+    widget = PlotWidget(db)
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.cancel_prefetch()
+    widget.race_cache.clear()
+    widget.live_action.setChecked(True)
+    widget.lazy_action.setChecked(True)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    assert widget.graph.athlete_plots == {}
+
+    # Walker 12 is added before any of their LOC values are within the marks loaded
+    widget.graph.add_athletes(load_race_dataset(db, 1, widget.live_marks, [7]), [7])
+    widget.graph.add_athletes(RaceDataset(1), [12])
+    widget.graph.display_athletes([7, 12])
+    widget.graph.display_judge_call_by_judges([1])
+    widget.graph.display_judge_call_by_type(JudgeCallType.LOC, True)
+
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (11, 1, 7, 47.0, '10:08:00 AM')"
+        )
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 1, 'Yellow', '~', '10:07:00 AM', 12)"
+        )
+    connection.close()
+    widget.poll_live_data()
+
+    assert widget.load_token is None
+    assert list(widget.graph.athlete_plots[7].loc_plot.get_ydata())[-1] == 47.0
+    yellow = widget.graph.call_values[(12, 1, JudgeCallType.LOC)][0]
+    assert len(yellow[0]) == 1
+    assert np.isnan(yellow[1]).all()
+    widget.close_application()
+
+
+def test_plot_widget_live_mode_stays_on_the_original_database(
+    qtbot, race_db_path, monkeypatch
+):
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    messages = []
+    monkeypatch.setattr(
+        QtWidgets.QMessageBox,
+        "information",
+        lambda parent, title, text: messages.append(title),
+    )
+
+    widget.live_action.setChecked(True)
+    assert not widget.optimize_action.isEnabled()
+
+    # Optimizing would reopen the database on a snapshot that never changes
+    widget.optimize_db()
+    assert messages == ["Optimize database"]
+    assert widget.db.path == race_db_path
+    assert not os.path.exists(optimized_path(race_db_path))
+
+    widget.live_action.setChecked(False)
+    assert widget.optimize_action.isEnabled()
+    widget.close_application()
+
+
+def test_plot_widget_table_window_follows_database_switch(qtbot, race_db_path):
+    optimize_database(race_db_path)
+    widget = PlotWidget(DB(race_db_path))
+    qtbot.addWidget(widget)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    widget.create_table_window()
+    table_window = widget.table_window
+    qtbot.addWidget(table_window)
+    old_db = widget.db
+
+    # Live mode switches away from the optimized copy, closing it
+    widget.live_action.setChecked(True)
+    assert widget.db is not old_db
+    assert table_window.db is widget.db
+    assert table_window.report_engine.db is widget.db
+
+    widget.race_combo_box.setCurrentIndex(1)
+    qtbot.waitUntil(lambda: widget.load_token is None)
+    assert table_window.selected_race == 2
+    assert table_window.model.rowCount() > 0
+
+    widget.close_application()
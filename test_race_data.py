@@ -0,0 +1,263 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from matplotlib.dates import num2date
+
+from endurance.db import DB
+from endurance.loc_graph import JudgeCallType
+from endurance.race_data import (
+    LOAD_STEPS,
+    CancellationToken,
+    LoadCancelled,
+    RaceCache,
+    RaceDataset,
+    load_race,
+    load_race_dataset,
+    load_race_update,
+)
+
+
+def clock(times):
+    return [num2date(time).strftime("%H:%M") for time in times]
+
+
+def test_race_dataset_slices_athletes_in_time_order(race_db_path):
+    dataset = load_race_dataset(DB(race_db_path), 1)
+
+    assert list(dataset.bibs) == [7, 12]
+    times, loc_values = dataset.athlete_loc(7)
+    assert loc_values.dtype == np.float32
+    assert list(loc_values) == [38.0, 41.5, 45.25]
+    assert clock(times) == ["09:58", "10:02", "10:06"]
+    # Slices are views into the columns of the whole race
+    assert np.shares_memory(loc_values, dataset.loc_values)
+    # Observations without a LOC value are left out
+    assert list(dataset.athlete_loc(12)[1]) == [61.0, 52.0]
+    assert len(dataset.athlete_loc(99)[0]) == 0
+
+
+def test_race_dataset_empty_race(race_db_path):
+    dataset = load_race_dataset(DB(race_db_path), 99)
+
+    assert len(dataset.bibs) == 0
+    assert dataset.judge_calls(7) == {}
+    assert dataset.plotted_bibs() == set()
+
+
+def test_race_dataset_buckets_calls(race_db_path):
+    dataset = load_race_dataset(DB(race_db_path), 1)
+
+    assert dataset.plotted_bibs() == {7, 12}
+    assert dataset.plotted_judges() == {1, 2, 3}
+    calls = dataset.plotted_calls(7)
+    assert set(calls) == {1, 2, 3}
+    # Only call types that were actually called get a bucket
+    assert set(calls[1]) == {JudgeCallType.LOC}
+    assert set(calls[3]) == {JudgeCallType.BENT_KNEE}
+
+    (yellow_times, yellow_loc), (red_times, red_loc) = calls[1][JudgeCallType.LOC]
+    assert clock(yellow_times) == ["10:00"]
+    assert clock(red_times) == ["10:04"]
+    # Calls sit on the LOC line of the athlete
+    assert list(yellow_loc) == pytest.approx([39.75])
+    assert list(red_loc) == pytest.approx([43.375])
+
+    yellow, red = calls[2][JudgeCallType.LOC]
+    assert len(yellow[0]) == len(yellow[1]) == 0
+    assert list(red[1]) == pytest.approx([42.4375])
+
+
+def test_race_dataset_interpolates_loc_like_numpy(race_db_path):
+    dataset = load_race_dataset(DB(race_db_path), 1)
+    times = np.concatenate([dataset.athlete_loc(7)[0], dataset.athlete_loc(12)[0]])
+    times = np.concatenate([times - 0.001, times, times + 0.0005])
+    bibs = np.tile([7, 7, 7, 12, 12], 3)
+
+    loc_values = dataset.loc_at(bibs, times)
+
+    expected = [
+        np.interp(time, *dataset.athlete_loc(bib)) for bib, time in zip(bibs, times)
+    ]
+    np.testing.assert_array_equal(loc_values, expected)
+    assert np.isnan(dataset.loc_at(np.array([9, 7]), times[:2])[0])
+    assert len(dataset.call_loc) == len(dataset.call_times)
+
+
+def test_race_dataset_does_not_interpolate_on_empty_loc_lines(race_db_path):
+    dataset = load_race_dataset(DB(race_db_path), 1)
+    times, loc_values = dataset.athlete_loc(7)
+    lines = RaceDataset.from_loc_lines(
+        1,
+        {
+            7: (times, loc_values),
+            9: (times[:0], loc_values[:0]),
+            12: (times, loc_values),
+        },
+    )
+
+    # The empty line of bib 9 lies between the lines of bib 7 and bib 12
+    result = lines.loc_at(np.array([9, 7, 9, 12]), times[[0, 1, 2, 2]])
+    assert np.isnan(result[0]) and np.isnan(result[2])
+    assert list(result[[1, 3]]) == [41.5, 45.25]
+
+    # Nor is anything interpolated when every line is empty
+    lines = RaceDataset.from_loc_lines(1, {9: (times[:0], loc_values[:0])})
+    assert np.isnan(lines.loc_at(np.array([9]), times[:1])).all()
+
+
+def test_race_dataset_keeps_incomplete_calls_out_of_the_graph(race_db_path):
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO JudgeCall VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (1, None, "Red", "~", "10:05:00 AM", 7),
+                (1, 1, "Red", "~", None, 7),
+                (1, 1, "Green", "~", "10:05:00 AM", 7),
+                (1, 2, "Red", "~", "10:05:00 AM", None),
+            ],
+        )
+    connection.close()
+
+    dataset = load_race_dataset(DB(race_db_path), 1)
+
+    # Every call is kept for the reports, with -1 for what is not known
+    assert len(dataset.call_bibs) == 12
+    assert list(dataset.judge_calls(-1)) == [2]
+    assert -1 in dataset.judge_calls(7)
+    yellow, red = dataset.plotted_calls(7)[1][JudgeCallType.LOC]
+    assert clock(red[0]) == ["10:04"]
+    assert -1 not in dataset.plotted_calls(7)
+    assert dataset.plotted_bibs() == {7, 12}
+
+
+def test_load_race_reports_progress(race_db_path):
+    db = DB(race_db_path)
+    finished = []
+
+    dataset, athletes, judges = load_race(db, 1, progress=finished.append)
+
+    assert finished == list(range(LOAD_STEPS + 1))
+    assert [athlete[2] for athlete in athletes] == [7, 12]
+    assert dataset.plotted_bibs() == {7, 12}
+
+
+def test_lazy_load_race_only_loads_athletes(race_db_path):
+    db = DB(race_db_path)
+
+    dataset, athletes, judges = load_race(db, 1, lazy=True)
+
+    assert athletes == load_race(db, 1)[1]
+    assert len(dataset.loc_times) == 0 and len(dataset.call_times) == 0
+    assert [judge[0] for judge in judges] == [1, 2, 3]
+
+    # The data of an athlete is loaded once needed
+    dataset = load_race_dataset(db, 1, db.get_high_water_marks(), [12])
+    assert list(dataset.bibs) == [12]
+    assert dataset.plotted_bibs() == {12}
+    assert list(dataset.athlete_loc(12)[1]) == list(
+        load_race_dataset(db, 1).athlete_loc(12)[1]
+    )
+
+
+def test_load_race_stops_when_cancelled(race_db_path):
+    db = DB(race_db_path)
+    token = CancellationToken()
+    token.cancel()
+
+    with pytest.raises(LoadCancelled):
+        load_race(db, 1, token)
+
+
+def test_load_race_update_only_loads_new_rows(race_db_path):
+    db = DB(race_db_path)
+    marks = db.get_high_water_marks()
+    assert marks == {"VideoObservation": 10, "JudgeCall": 10}
+    load_race(db, 1, marks=marks)
+
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (11, 1, 7, 47.0, '10:08:00 AM')"
+        )
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (12, 2, 9, 51.0, '11:14:00 AM')"
+        )
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 3, 'Red', '<', '10:07:00 AM', 12)"
+        )
+    connection.close()
+
+    new_marks = db.get_high_water_marks()
+    assert new_marks == {"VideoObservation": 12, "JudgeCall": 11}
+    update = load_race_update(db, 1, marks, new_marks)
+
+    assert list(update.bibs) == [7]
+    assert list(update.athlete_loc(7)[1]) == [47.0]
+    assert update.plotted_bibs() == {7, 12}
+    calls = update.plotted_calls(12)
+    assert list(calls) == [3]
+    assert list(calls[3]) == [JudgeCallType.BENT_KNEE]
+    yellow, red = calls[3][JudgeCallType.BENT_KNEE]
+    assert len(yellow[0]) == 0
+    assert clock(red[0]) == ["10:07"]
+
+    # Nothing is new past the latest marks
+    update = load_race_update(db, 1, new_marks, new_marks)
+    assert len(update.loc_times) == 0 and len(update.call_times) == 0
+
+
+def test_race_cache_keeps_races_until_the_database_changes(race_db_path):
+    db = DB(race_db_path)
+    cache = RaceCache()
+
+    marks, data = cache.load(db, 1)
+    assert cache.load(db, 1)[1] is data
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bytes"] == RaceCache.estimate_size(data) > 0
+    assert marks == db.get_high_water_marks()
+
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO VideoObservation VALUES (11, 1, 7, 47.0, '10:08:00 AM')"
+        )
+    connection.close()
+
+    marks, reloaded = cache.load(db, 1)
+    assert reloaded is not data
+    assert list(reloaded[0].athlete_loc(7)[1]) == [38.0, 41.5, 45.25, 47.0]
+    assert marks["VideoObservation"] == 11
+    assert len(cache) == 1
+
+
+def test_race_cache_evicts_least_recently_used_races(race_db_path):
+    db = DB(race_db_path)
+    size = RaceCache.estimate_size(load_race(db, 1))
+    cache = RaceCache(max_bytes=size + RaceCache.estimate_size(load_race(db, 2)))
+
+    cache.load(db, 1)
+    cache.load(db, 2)
+    cache.load(db, 1)
+    cache.load(db, 99)
+
+    assert (db.path, 1) in cache
+    assert (db.path, 2) not in cache
+    assert cache.nbytes <= cache.max_bytes
+    assert len(RaceCache(max_bytes=0).load(db, 1)[1][1]) == 2
+
+
+def test_race_cache_does_not_keep_lazy_loads(race_db_path):
+    db = DB(race_db_path)
+    cache = RaceCache()
+
+    marks, (dataset, athletes, _) = cache.load(db, 1, lazy=True)
+    assert len(dataset.loc_times) == 0
+    assert len(cache) == 0
+    assert cache.get(db, 1) is None
+
+    # Once the race is loaded in full, lazy loads are answered from the cache
+    data = cache.load(db, 1)[1]
+    assert cache.load(db, 1, lazy=True) == (marks, data)
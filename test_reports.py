@@ -0,0 +1,181 @@
+import os
+import sqlite3
+
+from endurance import reports
+from endurance.db import DB, hash_database
+from endurance.reports import (
+    REPORTS,
+    ConsensusEngine,
+    ReportEngine,
+    SummaryStore,
+    build_summary_store,
+    find_summary_store,
+    summary_store_path,
+)
+
+
+def test_red_without_yellow_compares_times(race_db_path):
+    engine = ReportEngine(DB(race_db_path))
+
+    headers, rows = engine.red_without_yellow_summary(1)
+
+    assert headers == [
+        "Judge First Name",
+        "Judge Last Name",
+        "# of ~ Red cards without Yellow",
+        "# of < Red cards without Yellow",
+    ]
+    # Ken Jones gave a paddle to bib 12, but only after the red card
+    assert rows == [
+        ("Jane", "Smith", 0, 0),
+        ("Ken", "Jones", 2, 0),
+        ("Lee", "Brown", 1, 0),
+    ]
+
+
+def test_yellow_without_red(race_db_path):
+    engine = ReportEngine(DB(race_db_path))
+
+    _, rows = engine.yellow_without_red_summary(1)
+
+    assert rows == [
+        ("Jane", "Smith", 0, 1),
+        ("Ken", "Jones", 1, 0),
+        ("Lee", "Brown", 0, 1),
+    ]
+
+
+def test_athlete_reports_only_join_bibs_of_the_race(race_db_path):
+    engine = ReportEngine(DB(race_db_path))
+
+    _, race_1 = engine.athlete_infraction_summary(1)
+    _, race_2 = engine.per_athlete_calls_summary(2)
+
+    # Bib 7 belongs to Bob Baker in race 1 and to Ann Able in race 2
+    assert race_1 == [(7, "Bob", "Baker", 1, 1, 2, 0), (12, "Cal", "Cole", 1, 1, 2, 0)]
+    assert race_2 == [(9, "Dee", "Dunn", 1, 1)]
+
+
+def test_athlete_judge_infraction_summary_marks_every_kind_of_call(race_db_path):
+    engine = ReportEngine(DB(race_db_path))
+
+    _, rows = engine.athlete_judge_infraction_summary(1)
+
+    assert rows[0] == (7, "Bob", "Baker", "Jane", "Smith", "x", "x", None, None)
+    assert len(rows) == 6
+
+
+def test_judge_consistency_report(race_db_path):
+    engine = ReportEngine(DB(race_db_path))
+
+    headers, rows = engine.judge_consistency_report(1)
+
+    assert headers[2:] == [
+        "Majority Matched Red ~",
+        "Majority Matched Red <",
+        "Majority Matched Yellow ~",
+        "Majority Matched Yellow <",
+    ]
+    # With three judges in the race, a single call is already a majority
+    assert rows == [
+        ("Lee", "Brown", 1, 0, 0, 1),
+        ("Ken", "Jones", 2, 0, 1, 0),
+        ("Jane", "Smith", 1, 0, 1, 1),
+    ]
+
+
+def test_consensus_quorum_and_tolerance(race_db_path):
+    consensus = ConsensusEngine(quorum=2)
+    engine = ReportEngine(DB(race_db_path), consensus)
+
+    # Both red cards for bib 7 and bib 12 were given by two judges, a minute apart
+    _, rows = engine.judge_consistency_report(1)
+    assert rows == [
+        ("Lee", "Brown", 1, 0, 0, 0),
+        ("Ken", "Jones", 2, 0, 0, 0),
+        ("Jane", "Smith", 1, 0, 0, 0),
+    ]
+
+    consensus.tolerance = 60
+    assert engine.judge_consistency_report(1)[1] == rows
+    consensus.tolerance = 30
+    assert engine.judge_consistency_report(1)[1] == []
+
+
+def test_consensus_falls_back_to_judges_making_calls(race_db_path):
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute("DROP TABLE RaceJudge")
+    connection.close()
+    db = DB(race_db_path)
+
+    assert db.get_race_judge_count(1) == 3
+    assert ReportEngine(db).judge_consistency_report(1)[1] == [
+        ("Lee", "Brown", 1, 0, 0, 1),
+        ("Ken", "Jones", 2, 0, 1, 0),
+        ("Jane", "Smith", 1, 0, 1, 1),
+    ]
+
+
+def test_summary_store_serves_precomputed_reports(race_db_path):
+    db = DB(race_db_path)
+    engine = ReportEngine(db)
+
+    store_path = build_summary_store(db)
+
+    assert store_path == summary_store_path(race_db_path)
+    store = SummaryStore.open(race_db_path)
+    for name, report in REPORTS.items():
+        assert store.get(name, 1) == report(engine, 1)
+    assert store.get("Judge Infraction Summary", 99) is None
+    store.close()
+
+
+def test_summary_store_is_only_built_again_once_the_database_changes(race_db_path):
+    store_path = build_summary_store(DB(race_db_path))
+    built = os.stat(store_path).st_mtime_ns
+    os.utime(store_path, ns=(built - 10**9, built - 10**9))
+
+    assert build_summary_store(DB(race_db_path)) == store_path
+    assert os.stat(store_path).st_mtime_ns == built - 10**9
+
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 1, 'Red', '<', '10:10:00 AM', 12)"
+        )
+    connection.close()
+
+    assert build_summary_store(DB(race_db_path)) == store_path
+    assert os.stat(store_path).st_mtime_ns != built - 10**9
+    assert find_summary_store(race_db_path) == store_path
+
+
+def test_summary_store_is_keyed_by_contents(race_db_path, monkeypatch):
+    build_summary_store(DB(race_db_path))
+    hashed = []
+    monkeypatch.setattr(
+        reports,
+        "hash_database",
+        lambda path: hashed.append(path) or hash_database(path),
+    )
+
+    # Touching the file without changing it keeps the store, and the file is only
+    # hashed the first time the store is found after
+    stat = os.stat(race_db_path)
+    os.utime(race_db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert find_summary_store(race_db_path) == summary_store_path(race_db_path)
+    assert find_summary_store(race_db_path) == summary_store_path(race_db_path)
+    assert hashed == [race_db_path]
+
+    store = SummaryStore.open(race_db_path)
+    connection = sqlite3.connect(race_db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO JudgeCall VALUES (1, 1, 'Red', '<', '10:10:00 AM', 12)"
+        )
+    connection.close()
+
+    assert store.get("Judge Infraction Summary", 1) is None
+    assert find_summary_store(race_db_path) is None
+    store.close()
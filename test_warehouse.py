@@ -0,0 +1,106 @@
+import sqlite3
+
+import pytest
+
+from conftest import create_race_db
+from endurance.db import DB
+from endurance.race_data import load_race_dataset
+from endurance.warehouse import (
+    ID_NAMESPACE,
+    NamespaceError,
+    build_warehouse,
+    find_event_databases,
+)
+
+
+def make_events(directory):
+    paths = [str(directory / "event_a.db"), str(directory / "event_b.db")]
+    for path in paths:
+        create_race_db(path)
+    # Tell the two events apart
+    connection = sqlite3.connect(paths[1])
+    with connection:
+        connection.execute("UPDATE Event SET Event = 'Worlds'")
+    connection.close()
+    return paths
+
+
+def test_warehouse_namespaces_ids(tmp_path):
+    paths = make_events(tmp_path)
+    warehouse_path = str(tmp_path / "warehouse.sqlite")
+
+    result = build_warehouse(paths, warehouse_path, workers=2)
+
+    assert len(result["ingested"]) == 2
+    db = DB(warehouse_path)
+    assert db.optimized
+    assert [race[0] for race in db.get_races()] == [
+        1_000_001,
+        1_000_002,
+        2_000_001,
+        2_000_002,
+    ]
+    # Athletes and judges of both events keep to their own races
+    assert db.get_athlete_by_race_and_bib(2_000_001, 7)[0] == 2_000_002
+    assert {judge[0] for judge in db.get_judge_by_race(1_000_001)} == {
+        1_000_001,
+        1_000_002,
+        1_000_003,
+    }
+    assert list(load_race_dataset(db, 2_000_001).athlete_loc(7)[1]) == [
+        38.0,
+        41.5,
+        45.25,
+    ]
+
+
+def test_warehouse_skips_unchanged_databases(tmp_path):
+    paths = make_events(tmp_path)
+    warehouse_path = str(tmp_path / "warehouse.sqlite")
+    build_warehouse(paths, warehouse_path, workers=2)
+
+    result = build_warehouse(paths, warehouse_path, workers=2)
+    assert result["ingested"] == []
+    assert len(result["skipped"]) == 2
+
+    connection = sqlite3.connect(paths[0])
+    with connection:
+        connection.execute("DELETE FROM JudgeCall WHERE IDRace = 2")
+    connection.close()
+
+    result = build_warehouse(paths, warehouse_path, workers=2)
+    assert len(result["ingested"]) == 1
+    db = DB(warehouse_path)
+    assert len(db.get_races()) == 4
+    assert len(db.get_judge_call_columns_by_race(1_000_002)["IDJudge"]) == 0
+    assert len(db.get_judge_call_columns_by_race(2_000_002)["IDJudge"]) == 2
+
+
+def test_find_event_databases_skips_derived_files(tmp_path):
+    paths = make_events(tmp_path)
+    (tmp_path / "event_a.optimized.db").touch()
+    (tmp_path / "event_a.summaries.db").touch()
+
+    assert find_event_databases(str(tmp_path), exclude=[paths[1]]) == [paths[0]]
+
+
+def test_warehouse_refuses_ids_outside_the_namespace(tmp_path):
+    paths = make_events(tmp_path)
+    warehouse_path = str(tmp_path / "warehouse.sqlite")
+    connection = sqlite3.connect(paths[0])
+    with connection:
+        connection.execute(
+            "UPDATE VideoObservation SET ID = ? WHERE ID = 10", (ID_NAMESPACE,)
+        )
+    connection.close()
+
+    with pytest.raises(NamespaceError, match="VideoObservation.ID"):
+        build_warehouse(paths, warehouse_path, workers=2)
+
+    # Nothing of the database was ingested into the IDs of the next database
+    connection = sqlite3.connect(warehouse_path)
+    assert connection.execute("SELECT COUNT(*) FROM WarehouseSource").fetchone() == (0,)
+    assert connection.execute("SELECT COUNT(*) FROM VideoObservation").fetchone() == (
+        0,
+    )
+    connection.close()